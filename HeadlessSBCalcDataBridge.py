@@ -0,0 +1,777 @@
+import re
+import sqlite3
+from contextlib import closing
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import attributeColumns
+    from . import distanceCache
+    from . import wkbGeometry
+except ImportError:  # imported as a top-level module, e.g. by headlessRunner
+    import attributeColumns
+    import distanceCache
+    import wkbGeometry
+
+
+FEET_PER_METRE = 1 / 0.3048
+
+
+class HeadlessSBCalcDataBridge:
+    """
+    Provides the same data as QgsSBCalcDataBridge, to SBCalculator.SBEngine and
+    burdenTableWriter, from CSV and GeoPackage files and without QGIS.
+
+    CSV tables need latitude and longitude fields for their locations. GeoPackage
+    layers can have those too, or else their geometries are used: the point of a
+    facility, and the centroid of a population group (see wkbGeometry).
+
+    Since nothing is reprojected, the facilities have to be in the same coordinate
+    reference system as the population. A projected CRS gives planar distances, as
+    in the plugin; the size of its unit is read from its definition, or given with
+    setFeetPerMapUnit (which also makes CSV coordinates planar).
+    """
+
+    def __init__(self):
+        # information fields about the facilities table
+        self._facilitiesPath = None  # CSV or GeoPackage file
+        self._facilitiesLayerName = None  # layer in the GeoPackage; None for the only one
+        self._facilitiesData = None  # pandas DataFrame of the attributes
+        self._facilitiesCrs = None  # CRS definition (WKT), or None if unknown
+        self._facilitiesIndexFieldName = None
+        self._facilitiesLatField = None
+        self._facilitiesLongField = None
+        self._facilitiesSectorField = None
+        self._facilitiesSLReduceField = None  # per-facility service level reduction, if any
+        self._facilityLatitudes = None  # data values, np 1-d array
+        self._facilityLongitudes = None  # data values, np 1-d array
+
+        # information fields about the population table
+        self._populationPath = None
+        self._populationLayerName = None
+        self._populationData = None
+        self._populationCrs = None
+        self._populationIndexFieldName = None
+        self._populationCentroidLatField = None  # specified latitude field, if any
+        self._populationCentroidLongField = None  # specified longitude field, if any
+        self._populationPopulationFieldName = None
+        self._populationAttainFactorFieldName = None
+        self._populationCentroidLats = None  # latitude values of the centroids
+        self._populationCentroidLongs = None  # longitude values of the centroids
+
+        # sector to service table information fields
+        self._sectorToServicePath = None
+        self._sectorToServiceLayerName = None
+        self._sectorToServiceData = None
+        self._sectorToServiceKeyFields = []  # GeoPackage primary key; not a service
+        self._sectorToServiceSectorField = None  # sector field name
+        self._sectorToServiceEpfField = None  # effort per foot field name
+        self._sectorToServiceZdeField = None  # zero-distance effort field name
+
+        # the sector to service row of each facility, -1 if its sector isn't in the
+        # table; see createFacilityServiceLayer
+        self._facilityServiceRows = None
+        self._unmatchedSectors = {}  # number of facilities of each sector not in the table
+
+        # exclusion profile information fields
+        self._exclusionPath = None  # GeoPackage file of polygons; None for none
+        self._exclusionLayerName = None
+        self._SLReduction = 0.0  # percent, for every exclusion polygon
+        self._SLReductionField = None  # field of per-polygon reductions, if any
+        self._SLReductionArray = None  # is of shape ( num facilities, )
+
+        # distances: None means from the population CRS (see getDistanceMode)
+        self._feetPerMapUnit = None
+
+        # csv export fields
+        self._perCapitaCsvOutputPath = None
+        self._aggregatedCsvOutputPath = None
+        self._sensitivityCsvOutputPath = None  # None for no sensitivity table
+
+        # performance settings
+        self._workers = 1
+        self._useProcesses = False
+        self._distanceCacheDirectory = None  # None for no caching
+        self._distanceCacheMaxBytes = distanceCache.DEFAULT_MAX_BYTES
+
+    def importDataFromArguments(self, args):
+        """
+        Populates the fields from parsed command line arguments (see headlessRunner),
+        as importDataFromDialog does from the plugin's dialog.
+        """
+        self.setPopulationPath(args.population, args.population_layer)
+        self.setPopulationIndexField(args.population_index_field)
+        self.setPopulationPopulationField(args.population_field)
+        self.setPopulationAttainFactorField(args.attain_factor_field)
+        self.setPopulationLatField(args.population_lat_field)
+        self.setPopulationLongField(args.population_long_field)
+
+        self.setFacilitiesPath(args.facilities, args.facilities_layer)
+        self.setFacilityIndexField(args.facility_index_field)
+        self.setFacilitySectorField(args.facility_sector_field)
+        self.setFacilityLatField(args.facility_lat_field)
+        self.setFacilityLongField(args.facility_long_field)
+        self.setFacilitySLReduceField(args.sl_reduce_field)
+
+        self.setExclusionPath(args.exclusion, args.exclusion_layer)
+        self.setSLReduction(args.sl_reduction)
+        self.setSLReductionField(args.sl_reduction_field)
+
+        self.setSectorToServicePath(args.sector_to_service, args.sector_to_service_layer)
+        self.setSectorToServiceSectorField(args.sector_field)
+        self.setSectorToServiceEpfField(args.epf_field)
+        self.setSectorToServiceZdeField(args.zde_field)
+
+        self.setPerCapitaCsvOutputPath(args.per_area_csv)
+        self.setAggregatedCsvOutputPath(args.totals_csv)
+        self.setSensitivityCsvOutputPath(args.sensitivity_csv)
+
+        self.setFeetPerMapUnit(args.feet_per_map_unit)
+        self.setWorkers(args.workers)
+        self.setUseProcesses(args.processes)
+        self.setDistanceCacheDirectory(args.distance_cache)
+
+    # ------------- reading -------------------
+
+    def _readTable(self, path: str, layerName: str = None):
+        """
+        Reads a CSV file, or a layer of a GeoPackage file.
+
+        returns:
+            tuple (pandas DataFrame of the attributes, list of geometry blobs or None
+            if there is no geometry, CRS definition or None if unknown, names of the
+            primary key fields)
+
+        CSV values are all read as strings, so that index fields keep any leading
+        zeros; the numeric getters convert them.
+        """
+        if not str(path).lower().endswith(".gpkg"):
+            return pd.read_csv(path, dtype=str), None, None, []
+
+        with closing(sqlite3.connect(path)) as connection:
+            tables = [
+                i[0]
+                for i in connection.execute(
+                    "SELECT table_name FROM gpkg_contents WHERE data_type IN ('features', 'attributes')"
+                )
+            ]
+            if layerName is None:
+                if len(tables) != 1:
+                    raise ValueError(
+                        "%s has %d layers; say which one to use." % (path, len(tables))
+                    )
+                layerName = tables[0]
+            elif layerName not in tables:
+                raise ValueError("%s has no layer named %s" % (path, layerName))
+
+            keys = [
+                i[1] for i in connection.execute('PRAGMA table_info("%s")' % layerName) if i[5]
+            ]
+            geometryColumn, crs = None, None
+            row = connection.execute(
+                "SELECT column_name, srs_id FROM gpkg_geometry_columns WHERE table_name = ?",
+                (layerName,),
+            ).fetchone()
+            if row is not None:
+                geometryColumn = row[0]
+                definition = connection.execute(
+                    "SELECT definition FROM gpkg_spatial_ref_sys WHERE srs_id = ?", (row[1],)
+                ).fetchone()
+                if definition is not None and definition[0] not in (None, "", "undefined"):
+                    crs = definition[0]
+
+            data = pd.read_sql_query('SELECT * FROM "%s"' % layerName, connection)
+        geometries = None
+        if geometryColumn is not None:
+            geometries = list(data.pop(geometryColumn))
+        return data, geometries, crs, keys
+
+    def _locations(self, data, geometries, latField, longField, whichgeom, locate):
+        """
+        (latitudes, longitudes) from the lat/long fields if they are given, and else
+        from the geometries with locate (see wkbGeometry).
+        """
+        if latField is not None and longField is not None:
+            return (
+                self._numericColumn(data, latField, whichgeom),
+                self._numericColumn(data, longField, whichgeom),
+            )
+        if geometries is None:
+            raise ValueError(
+                "The %s table has no geometry, so its latitude and longitude fields are needed."
+                % whichgeom
+            )
+        return locate(geometries, whichgeom)
+
+    def _column(self, data, fieldname, expected_type, whichtable):
+        """
+        A field of a table. As in QgsSBCalcDataBridge, "string" (or str) gives a
+        python list, and "numeric" (or int or float) a numpy array with nulls as 0s.
+        """
+        if fieldname not in data.columns:
+            raise ValueError("The %s layer has no field named %s" % (whichtable, fieldname))
+        if expected_type in ["str", "string"] or expected_type == str:
+            return [None if pd.isna(i) else i for i in data[fieldname]]
+        elif expected_type == "numeric" or expected_type in [int, float]:
+            return self._numericColumn(data, fieldname, whichtable)
+        else:
+            raise ValueError(f"Unexpected requested return type: {expected_type}.")
+
+    def _numericColumn(self, data, fieldname, whichtable, nullValue=0.0):
+        if fieldname not in data.columns:
+            raise ValueError("The %s layer has no field named %s" % (whichtable, fieldname))
+        try:
+            values = pd.to_numeric(data[fieldname])
+        except (ValueError, TypeError):
+            raise ValueError(
+                "The %s layer's field %s has values that are not numbers." % (whichtable, fieldname)
+            )
+        return np.nan_to_num(values.to_numpy(dtype=np.float64), nan=nullValue)
+
+    # ------------- preparing -------------------
+
+    def createPopulationCentroids(self):
+        """
+        Reads the population table, and its locations: the specified lat/long
+        fields, if any, or else the centroids of its geometries. As in the plugin,
+        lat/long fields are geographic whatever the table's CRS, unless a map unit
+        size has been set with setFeetPerMapUnit.
+
+        Also performs a CRS check, as the plugin does: a warning is given if the
+        CRS is projected and the size of its units is unknown.
+        """
+        data, geometries, crs, _ = self._readTable(
+            self.getPopulationPath(), self.getPopulationLayerName()
+        )
+        self._populationData = data
+        usesFields = (
+            self.getPopulationLatField() is not None and self.getPopulationLongField() is not None
+        )
+        self._populationCrs = None if usesFields else crs
+        lat, long = self._locations(
+            data,
+            geometries,
+            self.getPopulationLatField(),
+            self.getPopulationLongField(),
+            "population centroids",
+            lambda blobs, whichgeom: wkbGeometry.centroidLocations(
+                blobs, whichgeom, workers=self.getWorkers()
+            ),
+        )
+        self.setPopulationLatitudes(lat)
+        self.setPopulationLongitudes(long)
+
+        if (
+            self.getDistanceMode() == "planar"
+            and self._feetPerMapUnit is None
+            and _crsFeetPerUnit(crs) is None
+        ):
+            warnings.warn(
+                "Population layer is in a projected CRS with unknown distance units, "
+                "so outputs of this program will likely be garbage."
+            )
+
+    def createFacilitiesAsPointsLayer(self):
+        """
+        Reads the facilities table, and its locations: the specified lat/long
+        fields, if any, or else its point geometries.
+
+        Facilities in a different CRS than the population can't be reprojected
+        without QGIS, and raise a ValueError.
+        """
+        data, geometries, crs, _ = self._readTable(
+            self.getFacilitiesPath(), self.getFacilitiesLayerName()
+        )
+        usesGeometry = self.getFacilityLatField() is None or self.getFacilityLongField() is None
+        if usesGeometry and crs is not None and self._populationCrs is not None:
+            if _normalizedCrs(crs) != _normalizedCrs(self._populationCrs):
+                raise ValueError(
+                    "The facilities are in a different CRS than the population; "
+                    "reproject one of them first."
+                )
+        self._facilitiesData = data
+        self._facilitiesCrs = crs
+        lat, long = self._locations(
+            data,
+            geometries,
+            self.getFacilityLatField(),
+            self.getFacilityLongField(),
+            "facilities",
+            wkbGeometry.pointLocations,
+        )
+        self.setFacilityLatitudes(lat)
+        self.setFacilityLongitudes(long)
+
+    def createSLReductionArray(self):
+        """
+        Service level reduction of each facility, in percent: the specified field of
+        the facilities table, if any, and else 0 for every facility.
+
+        With an exclusion profile, facilities in its polygons get the polygons'
+        reduction instead, if that is larger; see QgsSBCalcDataBridge's
+        createSLReductionArray. The polygons have to be in the population's CRS,
+        and valid: there is no GEOS here to repair self-intersecting rings, so
+        repair them first (e.g. with ogr2ogr -makevalid).
+        """
+        if self.getFacilitySLReduceField() is not None:
+            sl_reduce_array = self.getFacilityDataByFieldName(
+                self.getFacilitySLReduceField(), expected_type=float
+            )
+        else:
+            sl_reduce_array = np.zeros(self._facilitiesData.shape[0])
+
+        if self.getExclusionPath() is not None:
+            data, geometries, crs, _ = self._readTable(
+                self.getExclusionPath(), self.getExclusionLayerName()
+            )
+            if geometries is None:
+                raise ValueError("The exclusion profile has no geometry; it has to be a GeoPackage.")
+            if crs is not None and self._populationCrs is not None:
+                if _normalizedCrs(crs) != _normalizedCrs(self._populationCrs):
+                    raise ValueError(
+                        "The exclusion profile is in a different CRS than the population; "
+                        "reproject one of them first."
+                    )
+            if self.getSLReductionField() is not None:  # nulls get the scalar reduction
+                reductions = self._numericColumn(
+                    data,
+                    self.getSLReductionField(),
+                    "exclusion profile",
+                    nullValue=self.getSLReduction(),
+                )
+            else:
+                reductions = np.full(len(geometries), self.getSLReduction())
+            sl_reduce_array = np.maximum(
+                sl_reduce_array,
+                wkbGeometry.polygonValuesAtPoints(
+                    self.getFacilityLatitudes(),
+                    self.getFacilityLongitudes(),
+                    geometries,
+                    reductions,
+                    "exclusion profile",
+                ),
+            )
+        self.setSLReductionArray(sl_reduce_array)
+
+    def createFacilityServiceLayer(self):
+        """
+        Joins the sector to service table to the facilities, on the sector fields:
+        the first row of each sector, as in the plugin (see
+        QgsSBCalcDataBridge.createFacilityServiceLayer). Facilities of
+        a sector the table doesn't have get no services, and are reported in a
+        warning and by getUnmatchedSectors.
+        """
+        rows, unmatched = attributeColumns.firstMatchingRows(
+            self.getFacilityDataByFieldName(self.getFacilitySectorField(), expected_type=str),
+            self.getSectors(),
+        )
+        self._facilityServiceRows = rows
+        self._unmatchedSectors = unmatched
+        if unmatched:
+            warnings.warn(
+                "%d facilities have sectors that are not in the sector to service table, "
+                "so they provide no services: %s"
+                % (
+                    sum(unmatched.values()),
+                    ", ".join(
+                        "%s (%d)" % ("no sector" if sector is None else sector, n)
+                        for sector, n in unmatched.items()
+                    ),
+                )
+            )
+
+    # -------------GETTERS -------------------
+
+    # -------facilities getters ----
+
+    def getFacilityDataByFieldName(self, fieldname: str, expected_type="string"):
+        """
+        See QgsSBCalcDataBridge.getFacilityDataByFieldName.
+        """
+        return self._column(self._facilitiesData, fieldname, expected_type, "facilities")
+
+    def getFacilitiesPath(self):
+        return self._facilitiesPath
+
+    def getFacilitiesLayerName(self):
+        return self._facilitiesLayerName
+
+    def getFacilityLatitudes(self):
+        return self._facilityLatitudes
+
+    def getFacilityLongitudes(self):
+        return self._facilityLongitudes
+
+    def getFacilityIndexField(self):
+        return self._facilitiesIndexFieldName
+
+    def getFacilityLatField(self):
+        return self._facilitiesLatField
+
+    def getFacilityLongField(self):
+        return self._facilitiesLongField
+
+    def getFacilitySectorField(self):
+        return self._facilitiesSectorField
+
+    def getFacilitySLReduceField(self):
+        return self._facilitiesSLReduceField
+
+    def getDistanceMode(self):
+        """
+        "geographic" for lat/long coordinates, for great circle distances; "planar"
+        for a projected CRS, or if a map unit size has been set with
+        setFeetPerMapUnit (see QgsSBCalcDataBridge.getDistanceMode).
+        """
+        if self._feetPerMapUnit is not None:
+            return "planar"
+        if self._populationCrs is not None and _crsIsProjected(self._populationCrs):
+            return "planar"
+        return "geographic"
+
+    def getFeetPerMapUnit(self):
+        """
+        Length in feet of one linear unit of the population coordinates: as set, or
+        else from the population CRS' definition. 1 if unknown.
+        """
+        if self._feetPerMapUnit is not None:
+            return self._feetPerMapUnit
+        feetPerUnit = None if self._populationCrs is None else _crsFeetPerUnit(self._populationCrs)
+        return 1.0 if feetPerUnit is None else feetPerUnit
+
+    # -------population getters  ----
+
+    def getPopulationDataByFieldName(self, fieldname: str, expected_type="string"):
+        """
+        See QgsSBCalcDataBridge.getPopulationDataByFieldName.
+        """
+        return self._column(self._populationData, fieldname, expected_type, "population")
+
+    def getPopulationPath(self):
+        return self._populationPath
+
+    def getPopulationLayerName(self):
+        return self._populationLayerName
+
+    def getPopulationHasCentroids(self):
+        return self.getPopulationLatField() is not None and self.getPopulationLongField() is not None
+
+    def getPopulationLatField(self):
+        return self._populationCentroidLatField
+
+    def getPopulationLongField(self):
+        return self._populationCentroidLongField
+
+    def getPopulationIndexField(self):
+        return self._populationIndexFieldName
+
+    def getPopulationPopulationField(self):
+        return self._populationPopulationFieldName
+
+    def getPopulationAttainFactorField(self):
+        return self._populationAttainFactorFieldName
+
+    def getPopulationLatitudes(self):
+        return self._populationCentroidLats
+
+    def getPopulationLongitudes(self):
+        return self._populationCentroidLongs
+
+    def getPopulationTotalPopulation(self):
+        return np.sum(
+            self.getPopulationDataByFieldName(
+                self.getPopulationPopulationField(), expected_type=int
+            )
+        )
+
+    # -----facility service getters --
+
+    def getFacilityServiceRows(self):
+        return self._facilityServiceRows
+
+    def getUnmatchedSectors(self):
+        """
+        See QgsSBCalcDataBridge.getUnmatchedSectors.
+        """
+        return self._unmatchedSectors
+
+    def getFacilityServiceServiceArray(self):
+        """
+        Service levels of the facilities, of shape (number of facilities, number of
+        services), ordered as the facilities and as the service names; all 0s for
+        facilities of unmatched sectors.
+        """
+        sectorToService = self.getSectorToServiceArray()
+        noService = np.zeros((1, sectorToService.shape[1]))
+        return np.concatenate([sectorToService, noService])[self.getFacilityServiceRows()]
+
+    def getFacilityServiceDataByFieldName(self, fieldname: str, expected_type="string"):
+        """
+        See QgsSBCalcDataBridge.getFacilityServiceDataByFieldName.
+        """
+        if fieldname in self._facilitiesData.columns:
+            return self.getFacilityDataByFieldName(fieldname, expected_type)
+        rows = self.getFacilityServiceRows()
+        values = self._column(
+            self.getSectorToServiceLayerData(), fieldname, expected_type, "sector to service"
+        )
+        if isinstance(values, list):
+            return [values[i] if i >= 0 else None for i in rows]
+        return np.append(values, 0.0)[rows]
+
+    # ------ sector to service table getters --------
+
+    def getSectorToServicePath(self):
+        return self._sectorToServicePath
+
+    def getSectorToServiceLayerName(self):
+        return self._sectorToServiceLayerName
+
+    def getSectorToServiceLayerData(self):
+        if self._sectorToServiceData is None:
+            data, _, _, keys = self._readTable(
+                self.getSectorToServicePath(), self.getSectorToServiceLayerName()
+            )
+            self._sectorToServiceData = data
+            self._sectorToServiceKeyFields = keys
+        return self._sectorToServiceData
+
+    def getSectorToServiceSectorField(self):
+        return self._sectorToServiceSectorField
+
+    def getSectorToServiceEpfField(self):
+        return self._sectorToServiceEpfField
+
+    def getSectorToServiceZdeField(self):
+        return self._sectorToServiceZdeField
+
+    def getServiceNames(self):
+        """
+        The fields of the sector to service table other than the sector, effort per
+        foot and zero-distance effort fields (and a GeoPackage's primary key).
+        """
+        data = self.getSectorToServiceLayerData()
+        return [
+            i
+            for i in data.columns
+            if i
+            not in [
+                self.getSectorToServiceSectorField(),
+                self.getSectorToServiceEpfField(),
+                self.getSectorToServiceZdeField(),
+            ]
+            + self._sectorToServiceKeyFields
+        ]
+
+    def getSectors(self):
+        """
+        The sectors of the sector to service table, in its order.
+        """
+        return self._column(
+            self.getSectorToServiceLayerData(),
+            self.getSectorToServiceSectorField(),
+            "string",
+            "sector to service",
+        )
+
+    def getSectorToServiceArray(self):
+        """
+        Service levels of the sector to service table, of shape (number of rows,
+        number of services), ordered as the service names.
+        """
+        data = self.getSectorToServiceLayerData()
+        return np.stack(
+            [self._numericColumn(data, i, "sector to service") for i in self.getServiceNames()],
+            axis=1,
+        ).reshape((data.shape[0], -1))
+
+    # ------- service level reduction getters ----
+
+    def getExclusionPath(self):
+        return self._exclusionPath
+
+    def getExclusionLayerName(self):
+        return self._exclusionLayerName
+
+    def getSLReduction(self):
+        return self._SLReduction
+
+    def getSLReductionField(self):
+        return self._SLReductionField
+
+    def getSLReductionArray(self):
+        return self._SLReductionArray
+
+    # -------- export getters -----
+
+    def getExportToCsv(self):
+        return True
+
+    def getPerCapitaCsvOutputPath(self):
+        return self._perCapitaCsvOutputPath
+
+    def getAggregatedCsvOutputPath(self):
+        return self._aggregatedCsvOutputPath
+
+    def getSensitivityCsvOutputPath(self):
+        return self._sensitivityCsvOutputPath
+
+    def getSaveFacilityLevelResults(self):
+        return False
+
+    # -------- performance getters -----
+
+    def getWorkers(self):
+        return self._workers
+
+    def getUseProcesses(self):
+        return self._useProcesses
+
+    def getDistanceCacheDirectory(self):
+        """
+        Folder distance matrices are cached in, or None if they are not to be cached.
+        """
+        return self._distanceCacheDirectory
+
+    def getDistanceCacheMaxBytes(self):
+        return self._distanceCacheMaxBytes
+
+    # -----------------SETTERS------------------
+
+    # ---- facility setters ----
+    def setFacilitiesPath(self, path: str, layerName: str = None):
+        self._facilitiesPath = path
+        self._facilitiesLayerName = layerName
+
+    def setFacilityLatitudes(self, vals: np.array):
+        self._facilityLatitudes = vals
+
+    def setFacilityLongitudes(self, vals: np.array):
+        self._facilityLongitudes = vals
+
+    def setFacilityIndexField(self, field: str):
+        self._facilitiesIndexFieldName = field
+
+    def setFacilityLatField(self, field: str):
+        self._facilitiesLatField = field
+
+    def setFacilityLongField(self, field: str):
+        self._facilitiesLongField = field
+
+    def setFacilitySectorField(self, field: str):
+        self._facilitiesSectorField = field
+
+    def setFacilitySLReduceField(self, field: str):
+        self._facilitiesSLReduceField = field
+
+    # ---- population setters ----
+    def setPopulationPath(self, path: str, layerName: str = None):
+        self._populationPath = path
+        self._populationLayerName = layerName
+
+    def setPopulationLatField(self, field: str):
+        self._populationCentroidLatField = field
+
+    def setPopulationLongField(self, field: str):
+        self._populationCentroidLongField = field
+
+    def setPopulationIndexField(self, field: str):
+        self._populationIndexFieldName = field
+
+    def setPopulationPopulationField(self, field: str):
+        self._populationPopulationFieldName = field
+
+    def setPopulationAttainFactorField(self, field: str):
+        self._populationAttainFactorFieldName = field
+
+    def setPopulationLatitudes(self, vals: np.array):
+        self._populationCentroidLats = vals
+
+    def setPopulationLongitudes(self, vals: np.array):
+        self._populationCentroidLongs = vals
+
+    # ---- sector to service setters ----
+    def setSectorToServicePath(self, path: str, layerName: str = None):
+        self._sectorToServicePath = path
+        self._sectorToServiceLayerName = layerName
+        self._sectorToServiceData = None
+
+    def setSectorToServiceSectorField(self, field: str):
+        self._sectorToServiceSectorField = field
+
+    def setSectorToServiceEpfField(self, field: str):
+        self._sectorToServiceEpfField = field
+
+    def setSectorToServiceZdeField(self, field: str):
+        self._sectorToServiceZdeField = field
+
+    def setExclusionPath(self, path: str, layerName: str = None):
+        self._exclusionPath = path
+        self._exclusionLayerName = layerName
+
+    def setSLReduction(self, amt):
+        """
+        This is a scalar percent value (0-100), not an array.
+        """
+        self._SLReduction = float(amt)
+
+    def setSLReductionField(self, field: str):
+        self._SLReductionField = field
+
+    def setSLReductionArray(self, data: np.array):
+        self._SLReductionArray = data
+
+    def setFeetPerMapUnit(self, feetPerUnit):
+        """
+        None to take the map units from the population CRS.
+        """
+        self._feetPerMapUnit = None if feetPerUnit is None else float(feetPerUnit)
+
+    # ---- export setters ----
+    def setPerCapitaCsvOutputPath(self, path: str):
+        self._perCapitaCsvOutputPath = path
+
+    def setAggregatedCsvOutputPath(self, path: str):
+        self._aggregatedCsvOutputPath = path
+
+    def setSensitivityCsvOutputPath(self, path: str):
+        self._sensitivityCsvOutputPath = path
+
+    # ---- performance setters ----
+    def setWorkers(self, workers: int):
+        self._workers = workers
+
+    def setUseProcesses(self, useProcesses: bool):
+        self._useProcesses = bool(useProcesses)
+
+    def setDistanceCacheDirectory(self, directory: str):
+        self._distanceCacheDirectory = directory
+
+    def setDistanceCacheMaxBytes(self, maxBytes: int):
+        self._distanceCacheMaxBytes = maxBytes
+
+
+def _normalizedCrs(definition: str):
+    return re.sub(r"\s+", "", definition).upper()
+
+
+def _crsIsProjected(definition: str):
+    """
+    Whether a WKT (1 or 2) CRS definition is of a projected CRS.
+    """
+    return _normalizedCrs(definition).startswith(("PROJCS[", "PROJCRS[", "PROJECTEDCRS["))
+
+
+def _crsFeetPerUnit(definition: str):
+    """
+    Length in feet of the linear unit of a projected WKT CRS definition: the last
+    UNIT (or LENGTHUNIT) in it, whose factor is to metres. None if there is none.
+    """
+    factors = re.findall(
+        r"(?:LENGTH)?UNIT\[\s*\"[^\"]*\"\s*,\s*([0-9.eE+-]+)", definition, flags=re.IGNORECASE
+    )
+    if not factors:
+        return None
+    return float(factors[-1]) * FEET_PER_METRE
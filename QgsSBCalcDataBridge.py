@@ -4,11 +4,17 @@ import numpy as np
 import processing
 import tempfile
 from datetime import datetime
+from operator import itemgetter
 
 from qgis.core import QgsProject
+from qgis.core import QgsCoordinateReferenceSystem
+from qgis.core import QgsApplication
+from qgis.core import QgsUnitTypes
 from qgis.core import QgsVectorLayer
 from qgis.core import QgsField
 from qgis.core import QgsFeature
+from qgis.core import QgsFeatureRequest
+from qgis.core import QgsWkbTypes
 from qgis.core import NULL
 from qgis.core import QgsProcessing
 from qgis.core import QgsProcessingAlgorithm
@@ -16,6 +22,9 @@ from PyQt5.QtCore import QVariant
 from qgis.PyQt.QtWidgets import QAction
 from qgis.PyQt.QtWidgets import QFileDialog
 from .social_burden_calculator_dialog import SocialBurdenCalculatorDialog
+from . import distanceCache
+from . import attributeColumns
+from . import wkbGeometry
 
 
 class QgsSBCalcDataBridge:
@@ -24,9 +33,6 @@ class QgsSBCalcDataBridge:
         self._facilitiesLayerData = None  # data in the facilities table
         self._facilitiesLayerName = None  # name of the facilities layer (str)
         self._facilitiesLayer = None  # the actual QgsVectorLayer layer
-        self._facilitiesLayerFieldNames = (
-            None  # names of the columns in the facilities table
-        )
         self._facilitiesIndexFieldName = None  # name of the index column for facilities
         self._facilitiesLatField = None
         self._facilitiesLongField = None
@@ -39,9 +45,6 @@ class QgsSBCalcDataBridge:
         self._populationLayerData = None  # data contained in the population layer
         self._populationLayer = None  # the QgsVectorLayer object
         self._populationLayerName = None  # name of the population layer (str)
-        self._populationFieldNames = (
-            None  # names of the columns in the population layer table
-        )
         self._populationIndexFieldName = (
             None  # name of the index field for the population
         )
@@ -56,8 +59,8 @@ class QgsSBCalcDataBridge:
         )
         self._populationAttainFactorFieldName = None
 
-        self._populationCentroidsLayer = None  # this is the _layer_ (QgsVectorLayer)
-        # that contains the population centroids.
+        self._populationCentroidsCrs = None  # the QgsCoordinateReferenceSystem
+        # the population centroids are in.
         self._populationCentroidLats = None  # latitude values of the centroids
         self._populationCentroidLongs = None  # longitude values of the centroids
 
@@ -79,12 +82,13 @@ class QgsSBCalcDataBridge:
         self._exclusionLayer = None
         self._hasExclusionLayer = None
         self._SLReduction = None
+        self._SLReductionField = None  # exclusion layer field of per-polygon reductions, if any
         self._SLReductionArray = None  # is of shape ( num facilities, )
 
-        # facility-service join layer fields
-        self._facilityServiceLayer = None  # the QgsVectorLayer object
-        self._facilityServiceLayerData = None  # will hold all the data for the info
-        self._facilityServiceFieldNames = None  # the names of the fields in the layer
+        # facility-service join fields
+        self._facilityServiceRows = None  # row of the sector to service table of each
+        # facility, -1 if its sector isn't in the table; np 1-d int array
+        self._unmatchedSectors = {}  # number of facilities of each sector not in the table
 
         # csv export fields
         self._exportToCsv = None
@@ -97,6 +101,10 @@ class QgsSBCalcDataBridge:
 
         self._exportAsRencatOutput = None
         self._exportAsRencatOutputPath = None
+
+        # facility sensitivity export fields
+        self._exportSensitivity = None
+        self._sensitivityCsvOutputPath = None
         
         
         #export fields for the per-population-per-facility-per-service interim 
@@ -104,6 +112,17 @@ class QgsSBCalcDataBridge:
         self._saveFacilityLevelResults = False
         # self._perCapitaPerFacilityPerServiceTablePath = None #this is currently formed by deriving from other values
 
+        # performance settings
+        self._workers = 1  # number of threads (or processes) used for the calculation
+        self._useProcesses = False  # whether to use worker processes rather than threads
+        self._cacheDistances = False  # whether to keep distance matrices on disk between runs
+        self._distanceCacheMaxBytes = distanceCache.DEFAULT_MAX_BYTES
+
+        # typed attribute columns read from each layer, by layer ("population",
+        # "facilities" or "sectorToService") and then by field
+        # name; each an attributeColumns.AttributeColumn. See _getColumn.
+        self._columnStores = {}
+
     def importDataFromDialog(self, dlg):
         """
         Uses a social burden calculator dialog
@@ -155,6 +174,7 @@ class QgsSBCalcDataBridge:
         self.setExclusionLayerName(dlg.getExclusionLayerName())
         self.setHasExclusionLayer(dlg.getHasExclusionProfile())
         self.setSLReduction(dlg.getExclusionServiceLevelReduction())
+        self.setSLReductionField(dlg.getExclusionReductionField() or None)
 
         # import information about the exports to files
         self.setExportToCsv(dlg.exportToCSV())
@@ -167,13 +187,27 @@ class QgsSBCalcDataBridge:
         self.setExportAsRencatOutput(dlg.exportAsRencatOutput())
         self.setExportAsRencatOutputPath(dlg.getExportAsRencatOutputPath())
 
-    def _extractPointLocations(self, layer: QgsVectorLayer, whichgeom: str):
+        self.setExportSensitivity(dlg.exportSensitivity())
+        self.setSensitivityCsvOutputPath(dlg.getSensitivityCsvOutputPath())
+
+        # import performance settings
+        self.setWorkers(dlg.getWorkers())
+        self.setUseProcesses(dlg.getUseProcesses())
+        self.setCacheDistances(dlg.getCacheDistances())
+
+    def _extractPointLocations(self, layer: QgsVectorLayer, whichgeom: str, storeName: str = None):
         """
         Helper function to extract the latitude and
         longitude geometries from a point layer
 
         inputs:
             layer:QgsVectorLayer: the layer of interest.
+            storeName: the layer's column store (see _getColumn), if any. If it
+                hasn't been read yet, the fields the calculation needs are read
+                in the same pass as the geometries.
+
+        The geometries are read in one pass over the features, as WKB, and decoded
+        all at once (see wkbGeometry.pointLocations).
 
         If the geometry of the layer isn't
         single points, will raise TypeError.
@@ -187,21 +221,19 @@ class QgsSBCalcDataBridge:
             for maximally useful error messages.
         """
 
-        geometryList = [layer.getGeometry(i.id()) for i in layer.getFeatures()]
-
-        # these should be points. If they're not points, fail with slightly less not-useful message.
-        try:
-            pointList = [i.asPoint() for i in geometryList]
-        except TypeError:
-            raise TypeError(
-                "The locations for the %s layer somehow aren't single-point type."
-                % whichgeom
-            )
-        except ValueError:
-            raise ValueError("Somehow the %s' geometry is null." % whichgeom)
+        fieldnames = []
+        if storeName is not None and not self._columnStores.get(storeName):
+            names = layer.fields().names()
+            fieldnames = [
+                i for i in dict.fromkeys(self._neededFields(storeName)) if i in names
+            ]
+        columns, wkbs = self._extractColumns(layer, fieldnames, withGeometry=True)
+        if fieldnames:
+            self._columnStores.setdefault(storeName, {}).update(columns)
 
-        pointsArray = np.array([(i.y(), i.x()) for i in pointList])
-        return (pointsArray[:, 0], pointsArray[:, 1])
+        # these should be points. If they're not points, pointLocations fails with
+        # slightly less not-useful messages.
+        return wkbGeometry.pointLocations(wkbs, whichgeom)
 
     def _extractDataFromLayer(self, layer: QgsVectorLayer):
         """
@@ -213,51 +245,162 @@ class QgsSBCalcDataBridge:
 
         return [i.attributes() for i in layer.getFeatures()]
 
+    def _extractColumns(self, layer: QgsVectorLayer, fieldnames: list, withGeometry=False):
+        """
+        Reads the given fields of every feature of the layer, in one pass (without
+        geometry, unless withGeometry) into typed columns: int64 or float64 for
+        numeric fields, and python objects for the rest, with their nulls masked.
+
+        returns:
+            dict of attributeColumns.AttributeColumn, by field name; with
+            withGeometry, a tuple of that and the list of the features' WKB
+        """
+        fields = layer.fields()
+        indices = [fields.indexFromName(i) for i in fieldnames]
+        kinds = []
+        for idx in indices:
+            field = fields.at(idx)
+            if not field.isNumeric():
+                kinds.append("string")
+            elif field.type() == QVariant.Double:
+                kinds.append("float")
+            else:
+                kinds.append("int")
+
+        request = QgsFeatureRequest()
+        if not withGeometry:
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(indices)
+        getter = itemgetter(*indices) if indices else None
+        rows, wkbs = [], []
+        for feature in layer.getFeatures(request):
+            if getter is not None:
+                rows.append(getter(feature.attributes()))
+            if withGeometry:
+                geometry = feature.geometry()
+                if QgsWkbTypes.isCurvedType(geometry.wkbType()):
+                    geometry.convertToStraightSegment()
+                wkbs.append(bytes(geometry.asWkb()))
+        if len(indices) == 1:
+            rows = [(i,) for i in rows]
+        columns = attributeColumns.columnsFromRows(rows, fieldnames, kinds, _isNull)
+        return (columns, wkbs) if withGeometry else columns
+
+    def _getColumn(self, storeName: str, layer: QgsVectorLayer, fieldname: str, whichLayer: str):
+        """
+        The column of the named field, from the column store of the layer. The
+        first time a layer's store is used, all the fields the calculation needs
+        from it (see _neededFields) are read together; any other field is read on
+        its own when it is asked for.
+        """
+        store = self._columnStores.setdefault(storeName, {})
+        if fieldname not in store:
+            names = layer.fields().names()
+            if fieldname not in names:
+                raise ValueError("The %s layer has no field named %s" % (whichLayer, fieldname))
+            toRead = [fieldname]
+            if not store:
+                toRead += [
+                    i for i in self._neededFields(storeName) if i in names and i != fieldname
+                ]
+            store.update(self._extractColumns(layer, list(dict.fromkeys(toRead))))
+        return store[fieldname]
+
+    def _neededFields(self, storeName: str):
+        """
+        The fields of a layer that the calculation reads.
+        """
+        if storeName == "population":
+            fields = [
+                self.getPopulationIndexField(),
+                self.getPopulationPopulationField(),
+                self.getPopulationAttainFactorField(),
+            ]
+        elif storeName == "facilities":
+            fields = [self.getFacilityIndexField(), self.getFacilitySectorField()]
+        else:  # "sectorToService"
+            fields = [
+                self.getSectorToServiceSectorField(),
+                self.getSectorToServiceZdeField(),
+                self.getSectorToServiceEpfField(),
+            ] + self.getServiceNames()
+        return [i for i in fields if i is not None]
+
+    def _fieldData(self, column, expected_type, getterName: str):
+        """
+        A column as the *DataByFieldName getters return it: a python list (with
+        NULLs) for "string" or str, and a numpy array (with nulls as 0s) for
+        "numeric", int or float.
+        """
+        if expected_type in ["str", "string"] or expected_type == str:
+            return column.asList(NULL)
+        elif expected_type == "numeric" or expected_type in [int, float]:
+            return column.asNumeric()
+        else:
+            raise ValueError(f"Unexpected requested return type in {getterName}(): {expected_type}.")
+
     def createPopulationCentroids(self):
         """
         Calculate centroids of user-input population block group polygons layer:
         If user has said to use the specified columns, rather than calculating centroids,
-        the user's specified lat-long columns are used to make a layer instead.
-
-        Also performs a CRS check on the resulting layer and provides a warning if the CRS
-        is not geographic.
+        the user's specified lat-long columns are used instead. Those are always
+        taken as WGS 84 latitudes and longitudes (EPSG:4326), whatever the project
+        CRS, so that they get great circle distances.
+
+        Both are read straight into numpy arrays, with no intermediate layer: the
+        lat-long columns from the population layer's column store, and the
+        geometries in one pass that also fills that store. The centroids are those
+        native:centroids gives with ALL_PARTS off (see wkbGeometry.centroidLocations),
+        calculated on getWorkers() threads.
+
+        Also performs a CRS check on the centroids: a geographic CRS gets great
+        circle distances, and a projected CRS gets planar distances in its linear
+        units (see getDistanceMode). A warning is given if those units are unknown.
         """
-
+        layer = self.getPopulationLayer()
         if self.getPopulationHasCentroids():  # if it has centroids.
-            outputs_Centroids1 = processing.run(
-                "native:createpointslayerfromtable",
-                {
-                    "INPUT": self.getPopulationLayerName(),
-                    "YFIELD": self.getPopulationLatField(),
-                    "XFIELD": self.getPopulationLongField(),
-                    "TARGET_CRS": "ProjectCrs",
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                },
-            )
+            coordinates = [
+                self._getColumn("population", layer, i, "population")
+                for i in [self.getPopulationLatField(), self.getPopulationLongField()]
+            ]
+            if any(i.getNullMask().any() for i in coordinates):
+                raise ValueError("Somehow the population centroids' geometry is null.")
+            lat, long = (i.asNumeric(np.float64) for i in coordinates)
+            crs = QgsCoordinateReferenceSystem("EPSG:4326")
         else:
-            # this output layer has all the same fields as the original.
-            outputs_Centroids1 = processing.run(
-                "native:centroids",
-                {
-                    "ALL_PARTS": False,  # True creates issues if, for example, a given population group is divided into multiple non-continguous sections - think Hawaii.
-                    "INPUT": self.getPopulationLayerName(),
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                },
+            store = self._columnStores.setdefault("population", {})
+            names = layer.fields().names()
+            fieldnames = [
+                i
+                for i in dict.fromkeys(self._neededFields("population"))
+                if i in names and i not in store
+            ]
+            columns, wkbs = self._extractColumns(layer, fieldnames, withGeometry=True)
+            store.update(columns)
+            # ALL_PARTS off: True creates issues if, for example, a given population group is divided into multiple non-continguous sections - think Hawaii.
+            lat, long = wkbGeometry.centroidLocations(
+                wkbs, "population centroids", workers=self.getWorkers()
             )
+            crs = layer.crs()
 
-        self.setPopulationCentroidsLayer(outputs_Centroids1["OUTPUT"])
-        if not self.getPopulationCentroidsLayer().crs().isGeographic():
+        self.setPopulationLatitudes(lat)
+        self.setPopulationLongitudes(long)
+        self.setPopulationCentroidsCrs(crs)
+        if not crs.isGeographic() and crs.mapUnits() == QgsUnitTypes.DistanceUnknownUnit:
             warnings.warn(
-                "Population layer after creating centroids is not in a lat/long CRS, \
-            so outputs of this program will likely be garbage."
+                "Population layer after creating centroids is in a projected CRS "
+                "with unknown distance units, so outputs of this program will likely be garbage."
             )
 
     def createFacilitiesAsPointsLayer(self):
         """
         If the facilities are a table and latlongs are specified, make a layer out of it.
+        As for the population, the latlongs are taken as WGS 84 (EPSG:4326).
 
-        Also performs a check on the CRS of the resulting facilities layer and
-        creates a warning if the layer does not have a geographic CRS.
+        If the facilities are in a different CRS than the population centroids
+        (see createPopulationCentroids, which should be run first), they are
+        reprojected into the population centroids' CRS, so that distances between
+        the two are measured in one coordinate system.
         """
         if self.getHasFacilityLatLongs():
             facilityLayer = processing.run(
@@ -266,7 +409,7 @@ class QgsSBCalcDataBridge:
                     "INPUT": self.getFacilitiesLayerName(),
                     "XFIELD": self.getFacilityLongField(),
                     "YFIELD": self.getFacilityLatField(),
-                    "TARGET_CRS": "ProjectCrs",
+                    "TARGET_CRS": "EPSG:4326",
                     "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
                 },
             )["OUTPUT"]
@@ -274,152 +417,127 @@ class QgsSBCalcDataBridge:
             facilityLayer = self.getFacilitiesLayerName()
             facilityLayer = QgsProject.instance().mapLayersByName(facilityLayer)[0]
 
-        self.setFacilitiesLayer(facilityLayer)
-        if not self.getFacilitiesLayer().crs().isGeographic():
-            warnings.warn(
-                "Facilities layer coordinate reference system is not in a lat-long format \
-            (if you defined your lat/longs manually, check your project CRS). \
-            This means results of this program will likely be garbage."
-            )
-
-    def createSLReductionArray(self):
-        if self.getHasExclusionLayer():
-            #   Make sure that the geometry of the exclusion profile layer is correct - if it is,will have no effect.
-            outputs_FixGeometries1 = processing.run(
-                "native:fixgeometries",
-                {
-                    "INPUT": self.getExclusionLayerName(),
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                },
-            )
-            #
-
-            # Intersect user-input facilities layer with post-processed geometry-fixed exclusion profile layer:
-            #   Determines which facilities are affected by the exclusion profile.
-            outputs_Intersection1 = processing.run(
-                "native:intersection",
-                {
-                    "INPUT": self.getFacilitiesLayer(),
-                    "INPUT_FIELDS": [""],
-                    "OVERLAY": outputs_FixGeometries1["OUTPUT"],
-                    "OVERLAY_FIELDS": [""],
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                },
-            )
-
-            # Convert multi-part output of facilities x exclusion profile intersection to single parts layer:
-            #   QGIS logistics.
-            outputs_MultiToSinglePart1 = processing.run(
-                "native:multiparttosingleparts",
-                {
-                    "INPUT": outputs_Intersection1["OUTPUT"],
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                },
-            )
-            #
-            # Use field calculator to assign user-input value of the exclusion profile reduction on service
-            #         levels as new field in facility x exclusion profile point layer:
-            #       Create new column of reduction of service level based on the exclusion profile.
-            outputs_FieldCalculator0 = processing.run(
-                "native:fieldcalculator",
-                {
-                    "FIELD_LENGTH": 3,
-                    "FIELD_NAME": "SL_Reduce",
-                    "FIELD_PRECISION": 0,
-                    "FIELD_TYPE": 1,
-                    "FORMULA": self.getSLReduction(),
-                    "INPUT": outputs_MultiToSinglePart1["OUTPUT"],
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                },
-            )
-            #
-            # Use extract by locatoin with disjoint (outside of) method to extract facilities from the input layer
-            #         that do NOT fall within the boundaries of the exclusion profile layer.
-            outputs_ExctractByLocation1 = processing.run(
-                "native:extractbylocation",
-                {
-                    "INPUT": self.getFacilitiesLayer(),
-                    "INTERSECT": outputs_FixGeometries1["OUTPUT"],
-                    "PREDICATE": [2],  # disjoint
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                },
-            )
-            #
-            # Use merge algorithm to combine the untouched facilities falling outside the
-            #           exclusion layer (calculated
-            #         by the Difference algorithm) with the reduction-adjusted facilities falling
-            #           inside the exclusion layer
-            #        (calculated by the intersect & field calculator steps above)
-            outputs_Merge1 = processing.run(
-                "qgis:mergevectorlayers",
-                {
-                    "LAYERS": [
-                        outputs_ExctractByLocation1["OUTPUT"],
-                        outputs_FieldCalculator0["OUTPUT"],
-                    ],
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                },
-            )
-            #
-            #  Use field calculator to overwrite NULLS in the SL_Reduce
-            # field with zeros for the facilities which fell outside
-            #         the exclusion profile and therefore did not have an SL_Reduce value assigned to them.
-            # This completes the description of service level reduction for any facilities that
-            # fall into the exclusion area.
-            outputs_FacilitiesWithSLReduce = processing.run(
-                "native:fieldcalculator",
+        centroidsCrs = self.getPopulationCentroidsCrs()
+        if centroidsCrs is not None and facilityLayer.crs() != centroidsCrs:
+            facilityLayer = processing.run(
+                "native:reprojectlayer",
                 {
-                    "FIELD_LENGTH": 3,
-                    "FIELD_NAME": "SL_Reduce",
-                    "FIELD_PRECISION": 0,
-                    "FIELD_TYPE": 1,
-                    "FORMULA": 'if("SL_Reduce" is null, 0, "SL_Reduce")',
-                    "INPUT": outputs_Merge1["OUTPUT"],
+                    "INPUT": facilityLayer,
+                    "TARGET_CRS": centroidsCrs,
                     "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
                 },
-            )
+            )["OUTPUT"]
 
-            sl_reduce_idx = (
-                outputs_FacilitiesWithSLReduce["OUTPUT"]
-                .fields()
-                .indexFromName("SL_Reduce")
-            )
-            sl_reduce_rows = [
-                i.attributes()
-                for i in outputs_FacilitiesWithSLReduce["OUTPUT"].getFeatures()
-            ]
+        self.setFacilitiesLayer(facilityLayer)
 
-            sl_reduce_array = np.array(
-                [
-                    i[sl_reduce_idx] if type(i[sl_reduce_idx]) != QVariant else 0.0
-                    for i in sl_reduce_rows
-                ]
+    def createSLReductionArray(self):
+        """
+        Service level reduction of each facility, in percent, in the facilities
+        layer's order: that of the exclusion profile polygons the facility is in
+        (on their boundary counting as in), and 0 outside them all. Where polygons
+        overlap, the largest of their reductions applies.
+
+        Each polygon's reduction is the scalar SL reduction, unless an SL
+        reduction field of the exclusion layer is set, in which case it is that
+        field's value (with nulls falling back to the scalar), so that hazard zones
+        of different severity are handled in one pass.
+
+        The exclusion polygons are repaired with native:fixgeometries (as the
+        intersection this replaced did), reprojected if they are not in the
+        facilities' CRS, read in one pass and tested against all the facility
+        locations in process (see wkbGeometry.polygonValuesAtPoints).
+        """
+        numFacilities = self.getFacilityLatitudes().shape[0]
+        if self.getHasExclusionLayer():
+            # self-intersecting rings would otherwise give wrong inside tests
+            exclusionLayer = processing.run(
+                "native:fixgeometries",
+                {"INPUT": self.getExclusionLayer(), "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT},
+            )["OUTPUT"]
+            facilitiesCrs = self.getFacilitiesLayer().crs()
+            if exclusionLayer.crs() != facilitiesCrs:
+                exclusionLayer = processing.run(
+                    "native:reprojectlayer",
+                    {
+                        "INPUT": exclusionLayer,
+                        "TARGET_CRS": facilitiesCrs,
+                        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+                    },
+                )["OUTPUT"]
+
+            reductionField = self.getSLReductionField()
+            fieldnames = [] if reductionField is None else [reductionField]
+            if not set(fieldnames) <= set(exclusionLayer.fields().names()):
+                raise ValueError(
+                    "The exclusion profile layer has no field named %s" % reductionField
+                )
+            columns, wkbs = self._extractColumns(exclusionLayer, fieldnames, withGeometry=True)
+            reductions = np.full(len(wkbs), float(self.getSLReduction()))
+            if reductionField is not None:
+                column = columns[reductionField]
+                try:
+                    values = column.asNumeric(np.float64)
+                except ValueError:
+                    raise ValueError(
+                        "Expected numeric type for exclusion profile field %s" % reductionField
+                    )
+                reductions = np.where(column.getNullMask(), reductions, values)
+
+            sl_reduce_array = wkbGeometry.polygonValuesAtPoints(
+                self.getFacilityLatitudes(),
+                self.getFacilityLongitudes(),
+                wkbs,
+                reductions,
+                "exclusion profile",
             )
 
         else:  # there was no exclusion layer. All we're doing is creating a column
             # containing the service level reduction, and every element in it is 0.
-            sl_reduce_array = np.zeros(self.getFacilitiesLayer().featureCount())
+            sl_reduce_array = np.zeros(numFacilities)
             # service level reduction array is of shape (num facilities,)
 
         self.setSLReductionArray(sl_reduce_array)
 
     def createFacilityServiceLayer(self):
         """
-        creates and stores the facility-service join layer.
-        """
-        facility_service_join = processing.run(
-            "native:joinattributestable",
-            {
-                "INPUT": self.getFacilitiesLayer(),
-                "FIELD": self.getFacilitySectorField(),  # join field name in input 1
-                "INPUT_2": self.getSectorToServiceLayer(),  # sector to service table, as layer
-                "FIELD_2": self.getSectorToServiceSectorField(),  # join field in input 2
-                # 'FIELDS_TO_COPY': , #fields from table 2 that should be retained; other fields are discarded
-                "METHOD": 1,  # one-to-one matching rather than one-to-many
-                "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-            },
-        )
-        self.setFacilityServiceLayer(facility_service_join["OUTPUT"])
+        Joins the sector to service table to the facilities on their sector fields,
+        as native:joinattributestable did with one-to-one matching, but without
+        making a layer: each facility gets the row of the first matching sector
+        (see attributeColumns.firstMatchingRows), and the facility service getters
+        gather the table's columns by those rows.
+
+        Facilities whose sector is null or not in the table get no services (the
+        calculator gives them a ZDE of 1 and an EPF of 0); they are reported in a
+        warning, and by getUnmatchedSectors.
+        """
+        facilitySectors = self._getColumn(
+            "facilities",
+            self.getFacilitiesLayer(),
+            self.getFacilitySectorField(),
+            "facilities",
+        ).asList(None)
+        # nulls as None rather than getSectors' NULLs, which would be joined as "NULL"
+        tableSectors = self._getColumn(
+            "sectorToService",
+            self.getSectorToServiceLayer(),
+            self.getSectorToServiceSectorField(),
+            "sector to service",
+        ).asList(None)
+        rows, unmatched = attributeColumns.firstMatchingRows(facilitySectors, tableSectors)
+        self.setFacilityServiceRows(rows)
+        self._unmatchedSectors = unmatched
+        if unmatched:
+            warnings.warn(
+                "%d facilities have sectors that are not in the sector to service table, "
+                "so they provide no services: %s"
+                % (
+                    sum(unmatched.values()),
+                    ", ".join(
+                        "%s (%d)" % ("no sector" if sector is None else sector, n)
+                        for sector, n in unmatched.items()
+                    ),
+                )
+            )
 
     def importLayerFromBurdenTempFile(
         self, tmp: tempfile.NamedTemporaryFile, name: str
@@ -451,30 +569,10 @@ class QgsSBCalcDataBridge:
 
         """
 
-        # find index of that field
-
-        # first we make sure that there are population field names to check
-        if self._facilitiesLayerFieldNames is None:
-            lay = self.getFacilitiesLayer()
-            self._facilitiesLayerFieldNames = [i for i in lay.fields().names()]
-        try:
-            idx = self._facilitiesLayerFieldNames.index(fieldname)
-        except ValueError:
-            raise ValueError("The facilities layer has no field named %s" % fieldname)
-
-        # we now know that there is such a field in the population layer
-        # and what its index is.
-        if expected_type in ["str", "string"] or expected_type == str:
-            return [i[idx] for i in self.getFacilitiesLayerData()]
-        elif expected_type == "numeric" or expected_type in [int, float]:
-            return np.array(
-                [
-                    i[idx] if type(i[idx]) != QVariant else 0.0
-                    for i in self.getFacilitiesLayerData()
-                ]
-            )
-        else: 
-            raise ValueError(f"Unexpected requested return type in getFacilityDataByFieldName(): {expected_type}.")
+        column = self._getColumn(
+            "facilities", self.getFacilitiesLayer(), fieldname, "facilities"
+        )
+        return self._fieldData(column, expected_type, "getFacilityDataByFieldName")
 
 
     def getFacilitiesLayerData(self):
@@ -496,7 +594,7 @@ class QgsSBCalcDataBridge:
 
         if self._facilityLatitudes is None:
             lat, long = self._extractPointLocations(
-                self.getFacilitiesLayer(), "facilities"
+                self.getFacilitiesLayer(), "facilities", "facilities"
             )
             self.setFacilityLatitudes(lat)
             self.setFacilityLongitudes(long)
@@ -508,12 +606,31 @@ class QgsSBCalcDataBridge:
         """
         if self._facilityLongitudes is None:
             lat, long = self._extractPointLocations(
-                self.getFacilitiesLayer(), "facilities"
+                self.getFacilitiesLayer(), "facilities", "facilities"
             )
             self.setFacilityLatitudes(lat)
             self.setFacilityLongitudes(long)
         return self._facilityLongitudes
 
+    def getDistanceMode(self):
+        """
+        "geographic" if the population centroids (and so the facilities) are in a
+        lat/long CRS, for great circle distances; "planar" for a projected CRS, in
+        which case the latitudes and longitudes are really northings and eastings,
+        and distances are Euclidean (see getFeetPerMapUnit).
+        """
+        if self.getPopulationCentroidsCrs().isGeographic():
+            return "geographic"
+        return "planar"
+
+    def getFeetPerMapUnit(self):
+        """
+        Length in feet of one linear unit of the population centroids' CRS.
+        """
+        return QgsUnitTypes.fromUnitToUnitFactor(
+            self.getPopulationCentroidsCrs().mapUnits(), QgsUnitTypes.DistanceFeet
+        )
+
     def getFacilityIndexField(self):
         return self._facilitiesIndexFieldName
 
@@ -545,30 +662,10 @@ class QgsSBCalcDataBridge:
             if expected_type is "string", will return a python list
             if expected_type is "numeric", returns a numpy array.
         """
-        # find index of that field
-
-        # first we make sure that there are population field names to check
-        if self._populationFieldNames is None:
-            lay = self.getPopulationLayer()
-            self._populationFieldNames = [i for i in lay.fields().names()]
-        try:
-            idx = self._populationFieldNames.index(fieldname)
-        except ValueError:
-            raise ValueError("The population layer has no field named %s" % fieldname)
-
-        # we now know that there is such a field in the population layer
-        # and what its index is.
-        if expected_type == "str" or expected_type == str or expected_type=="string":
-            return [i[idx] for i in self.getPopulationLayerData()]
-        elif expected_type == "numeric" or expected_type in [int, float]:
-            return np.array(
-                [
-                    i[idx] if type(i[idx]) != QVariant else 0.0
-                    for i in self.getPopulationLayerData()
-                ]
-            )
-        else: 
-            raise ValueError(f"Unexpected requested return type in getPopulationDataByFieldName(): {expected_type}.")
+        column = self._getColumn(
+            "population", self.getPopulationLayer(), fieldname, "population"
+        )
+        return self._fieldData(column, expected_type, "getPopulationDataByFieldName")
 
     def getPopulationLayerName(self):
         return self._populationLayerName
@@ -591,19 +688,15 @@ class QgsSBCalcDataBridge:
     def getPopulationAttainFactorField(self):
         return self._populationAttainFactorFieldName
 
-    def getPopulationCentroidsLayer(self):
-        return self._populationCentroidsLayer
+    def getPopulationCentroidsCrs(self):
+        return self._populationCentroidsCrs
 
     def getPopulationLatitudes(self):
         """
         expected return: np 1-d array
         """
         if self._populationCentroidLats is None:
-            lat, long = self._extractPointLocations(
-                self.getPopulationCentroidsLayer(), "population centroids"
-            )
-            self.setPopulationLatitudes(lat)
-            self.setPopulationLongitudes(long)
+            self.createPopulationCentroids()
         return self._populationCentroidLats
 
     def getPopulationLongitudes(self):
@@ -611,11 +704,7 @@ class QgsSBCalcDataBridge:
         expected return: np 1-d array
         """
         if self._populationCentroidLongs is None:
-            lat, long = self._extractPointLocations(
-                self.getPopulationCentroidsLayer(), "population centroids"
-            )
-            self.setPopulationLatitudes(lat)
-            self.setPopulationLongitudes(long)
+            self.createPopulationCentroids()
         return self._populationCentroidLongs
 
     def getPopulationLayerData(self):
@@ -627,7 +716,7 @@ class QgsSBCalcDataBridge:
     def getPopulationLayer(self):
         if self._populationLayer is None:
             self._populationLayer = QgsProject.instance().mapLayersByName(
-                self.getPopulationLayerName
+                self.getPopulationLayerName()
             )[0]
         return self._populationLayer
 
@@ -638,16 +727,23 @@ class QgsSBCalcDataBridge:
             )
         )
 
-    # -----facility service layer getters --
+    # -----facility service getters --
 
-    def getFacilityServiceLayer(self):
-        return self._facilityServiceLayer
+    def getFacilityServiceRows(self):
+        """
+        Row of the sector to service table of each facility, -1 for facilities whose
+        sector isn't in it; see createFacilityServiceLayer.
+        """
+        if self._facilityServiceRows is None:
+            self.createFacilityServiceLayer()
+        return self._facilityServiceRows
 
-    def getFacilityServiceLayerData(self):
-        if self._facilityServiceLayerData is None:
-            tmp = self._extractDataFromLayer(self.getFacilityServiceLayer())
-            self.setFacilityServiceLayerData(tmp)
-        return self._facilityServiceLayerData
+    def getUnmatchedSectors(self):
+        """
+        Returns: dict of the number of facilities of each sector that is not in the
+        sector to service table (None for facilities without a sector).
+        """
+        return self._unmatchedSectors
 
     def getFacilityServiceServiceArray(self):
         """
@@ -655,29 +751,18 @@ class QgsSBCalcDataBridge:
 
         Returns a numpy array of shape (number of facilities, number of services)
         ordered in the same order as the facilities and ordered in the same number
-        as the service names.
+        as the service names. Facilities of unmatched sectors have all 0s.
         """
-
-        # these are the indices with the facilities' service levels
-        service_column_indices = [
-            self.getFacilityServiceLayer().fields().indexFromName(i)
-            for i in self.getServiceNames()
-        ]
-
-        # assemble the info at these column indices into a numpy array
-        service_array = np.array(
-            [
-                [
-                    i[j] if type(i[j]) != QVariant else 0.0
-                    for j in service_column_indices
-                ]
-                for i in self.getFacilityServiceLayerData()
-            ]
-        )
-        return service_array
+        sectorToService = self.getSectorToServiceArray()
+        noService = np.zeros((1, sectorToService.shape[1]))
+        return np.concatenate([sectorToService, noService])[self.getFacilityServiceRows()]
 
     def getFacilityServiceDataByFieldName(self, fieldname: str, expected_type="string"):
         """
+        A field of the facilities joined with the sector to service table: the
+        facilities' own fields, as the join kept them first, and else the table's
+        field on each facility's row, null for facilities of unmatched sectors.
+
         optional input: "expected type"
             options are:
                 'string' or str
@@ -690,33 +775,12 @@ class QgsSBCalcDataBridge:
             if expected_type is "string", will return a python list
             if expected_type is "numeric", returns a numpy array.
         """
-
-        # find index of that field
-
-        # first we make sure that there are facility service field names to check
-        if self._facilityServiceFieldNames is None:
-            lay = self.getFacilityServiceLayer()
-            self._facilityServiceFieldNames = [i for i in lay.fields().names()]
-        try:
-            idx = self._facilityServiceFieldNames.index(fieldname)
-        except ValueError:
-            raise ValueError(
-                "The facility service layer has no field named %s" % fieldname
-            )
-
-        # we now know that there is such a field in the layer
-        # and what its index is.
-        if expected_type in ["str", "string"] or expected_type == str:
-            return [i[idx] for i in self.getFacilityServiceLayerData()]
-        elif expected_type == "numeric" or expected_type in [int, float]:
-            return np.array(
-                [
-                    i[idx] if type(i[idx]) != QVariant else 0.0
-                    for i in self.getFacilityServiceLayerData()
-                ]
-            )
-        else: 
-            raise ValueError(f"Unexpected expeted type in getFacilityServiceDataByFieldName(): {expected_type}.")
+        if fieldname in self.getFacilitiesLayer().fields().names():
+            return self.getFacilityDataByFieldName(fieldname, expected_type)
+        column = self._getColumn(
+            "sectorToService", self.getSectorToServiceLayer(), fieldname, "sector to service"
+        ).take(self.getFacilityServiceRows())
+        return self._fieldData(column, expected_type, "getFacilityServiceDataByFieldName")
 
     # ------ sector to service table getters --------
 
@@ -761,12 +825,12 @@ class QgsSBCalcDataBridge:
         Returns the list of sectors (e.g., grocery store)
         available in the sector to service mapping table.
         """
-        sector_idx = (
-            self.getSectorToServiceLayer()
-            .fields()
-            .indexFromName(self.getSectorToServiceSectorField())
-        )
-        return [i[sector_idx] for i in self.getSectorToServiceLayerData()]
+        return self._getColumn(
+            "sectorToService",
+            self.getSectorToServiceLayer(),
+            self.getSectorToServiceSectorField(),
+            "sector to service",
+        ).asList(NULL)
 
     def getServiceFieldIndices(self):
         """
@@ -790,16 +854,63 @@ class QgsSBCalcDataBridge:
         values, ordered by sectors in the rows and
         services in the columns.
         """
-        service_fields_index_list = self.getServiceFieldIndices()
-        return np.array(
+        layer = self.getSectorToServiceLayer()
+        return np.stack(
             [
-                [
-                    i[j] if type(i[j]) != QVariant else 0.0
-                    for j in service_fields_index_list
-                ]
-                for i in self.getSectorToServiceLayerData()
-            ]
+                self._getColumn("sectorToService", layer, i, "sector to service").asNumeric(
+                    np.float64
+                )
+                for i in self.getServiceNames()
+            ],
+            axis=1,
+        )
+
+    def getSectorServiceProfile(self, sector):
+        """
+        What a new facility of the given sector would provide, from the sector to
+        service mapping table.
+
+        returns:
+            tuple (service levels, a numpy 1-d array ordered as the service names,
+            zero-distance effort, effort per foot)
+        """
+        sectors = [str(i) for i in self.getSectors()]
+        try:
+            row = sectors.index(str(sector))
+        except ValueError:
+            raise ValueError(
+                "The sector to service table has no sector named %s" % sector
+            )
+        layer = self.getSectorToServiceLayer()
+        zde, epf = (
+            self._getColumn("sectorToService", layer, i, "sector to service").asNumeric(
+                np.float64
+            )[row]
+            for i in [self.getSectorToServiceZdeField(), self.getSectorToServiceEpfField()]
         )
+        return self.getSectorToServiceArray()[row], float(zde), float(epf)
+
+    def getCandidateSiteLocations(self, layerName: str):
+        """
+        Locations of a point layer of candidate sites for new facilities (see
+        SBCalculator.optimizeFacilitySiting), reprojected into the population
+        centroids' CRS as the facilities are (see createFacilitiesAsPointsLayer).
+
+        returns:
+             tuple of numpy 1-d arrays, (latitudes, longitudes)
+        """
+        candidateLayer = QgsProject.instance().mapLayersByName(layerName)[0]
+        centroidsCrs = self.getPopulationCentroidsCrs()
+        if centroidsCrs is not None and candidateLayer.crs() != centroidsCrs:
+            candidateLayer = processing.run(
+                "native:reprojectlayer",
+                {
+                    "INPUT": candidateLayer,
+                    "TARGET_CRS": centroidsCrs,
+                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+                },
+            )["OUTPUT"]
+        return self._extractPointLocations(candidateLayer, "candidate sites")
 
     # ------- exclusion profile getters ----
 
@@ -807,6 +918,10 @@ class QgsSBCalcDataBridge:
         return self._exclusionLayerName
 
     def getExclusionLayer(self):
+        if self._exclusionLayer is None:
+            self._exclusionLayer = QgsProject.instance().mapLayersByName(
+                self.getExclusionLayerName()
+            )[0]
         return self._exclusionLayer
 
     def getHasExclusionLayer(self):
@@ -815,6 +930,9 @@ class QgsSBCalcDataBridge:
     def getSLReduction(self):
         return self._SLReduction
 
+    def getSLReductionField(self):
+        return self._SLReductionField
+
     def getSLReductionArray(self):
         return self._SLReductionArray
 
@@ -840,6 +958,12 @@ class QgsSBCalcDataBridge:
 
     def getExportAsRencatOutputPath(self):
         return self._exportAsRencatOutputPath
+
+    def getExportSensitivity(self):
+        return self._exportSensitivity
+
+    def getSensitivityCsvOutputPath(self):
+        return self._sensitivityCsvOutputPath
         
     
         
@@ -865,6 +989,31 @@ class QgsSBCalcDataBridge:
             f"perCapitaPerFacilityPerServiceBenefitsIndices-{now}.json"
         )
         return outpath
+
+    # -------- performance getters -----
+
+    def getWorkers(self):
+        return self._workers
+
+    def getUseProcesses(self):
+        return self._useProcesses
+
+    def getCacheDistances(self):
+        return self._cacheDistances
+
+    def getDistanceCacheDirectory(self):
+        """
+        Folder in the QGIS profile that distance matrices are cached in,
+        or None if they are not to be cached.
+        """
+        if not self.getCacheDistances():
+            return None
+        return os.path.join(
+            QgsApplication.qgisSettingsDirPath(), "social_burden_calculator", "distance_cache"
+        )
+
+    def getDistanceCacheMaxBytes(self):
+        return self._distanceCacheMaxBytes
     
     # -----------------SETTERS------------------
 
@@ -874,6 +1023,8 @@ class QgsSBCalcDataBridge:
 
     def setFacilitiesLayer(self, layer: QgsVectorLayer):
         self._facilitiesLayer = layer
+        self._columnStores.pop("facilities", None)
+        self._facilityServiceRows = None
 
     def setFacilitiesLayerData(self, data: list):
         self._facilitiesLayerData = data
@@ -921,8 +1072,8 @@ class QgsSBCalcDataBridge:
     def setPopulationAttainFactorField(self, field: str):
         self._populationAttainFactorFieldName = field
 
-    def setPopulationCentroidsLayer(self, layer: QgsVectorLayer):
-        self._populationCentroidsLayer = layer
+    def setPopulationCentroidsCrs(self, crs):
+        self._populationCentroidsCrs = crs
 
     def setPopulationLatitudes(self, vals: np.array):
         self._populationCentroidLats = vals
@@ -938,6 +1089,7 @@ class QgsSBCalcDataBridge:
 
     def setPopulationLayer(self, layer: QgsVectorLayer):
         self._populationLayer = layer
+        self._columnStores.pop("population", None)
 
     # -----sector to service mapping
     def setSectorToServiceLayerName(self, layerName: str):
@@ -945,6 +1097,8 @@ class QgsSBCalcDataBridge:
 
     def setSectorToServiceLayer(self, layer: QgsVectorLayer):
         self._sectorToServiceLayer = layer
+        self._columnStores.pop("sectorToService", None)
+        self._facilityServiceRows = None
 
     def setSectorToServiceSectorField(self, field: str):
         self._sectorToServiceSectorField = field
@@ -955,12 +1109,9 @@ class QgsSBCalcDataBridge:
     def setSectorToServiceZdeField(self, field: str):
         self._sectorToServiceZdeField = field
 
-    # -------facility service layer-
-    def setFacilityServiceLayer(self, layer: QgsVectorLayer):
-        self._facilityServiceLayer = layer
-
-    def setFacilityServiceLayerData(self, data: list):
-        self._facilityServiceLayerData = data
+    # -------facility service -------
+    def setFacilityServiceRows(self, rows: np.array):
+        self._facilityServiceRows = rows
 
     # ------- exclusion profile setters ----
 
@@ -979,6 +1130,13 @@ class QgsSBCalcDataBridge:
         """
         self._SLReduction = amt
 
+    def setSLReductionField(self, field: str):
+        """
+        Field of the exclusion layer holding each polygon's reduction, in percent;
+        None to use the scalar SL reduction for every polygon.
+        """
+        self._SLReductionField = field
+
     def setSLReductionArray(self, arr: np.array):
         self._SLReductionArray = arr
 
@@ -1003,3 +1161,29 @@ class QgsSBCalcDataBridge:
 
     def setExportAsRencatOutputPath(self, path: str):
         self._exportAsRencatOutputPath = path
+
+    def setExportSensitivity(self, hc: bool):
+        self._exportSensitivity = hc
+
+    def setSensitivityCsvOutputPath(self, path: str):
+        self._sensitivityCsvOutputPath = path
+
+    # ---------performance setters ----------
+    def setWorkers(self, workers: int):
+        self._workers = workers
+
+    def setUseProcesses(self, hc: bool):
+        self._useProcesses = hc
+
+    def setCacheDistances(self, hc: bool):
+        self._cacheDistances = hc
+
+    def setDistanceCacheMaxBytes(self, maxBytes: int):
+        self._distanceCacheMaxBytes = maxBytes
+
+
+def _isNull(value):
+    """
+    Whether an attribute value is a null: QGIS gives NULL QVariants (or None).
+    """
+    return value is None or type(value) == QVariant
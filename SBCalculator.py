@@ -1,12 +1,53 @@
 import numpy as np
 import warnings, pdb
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-from . import QgsSBCalcDataBridge
+try:
+    from . import burdenKernels
+    from . import burdenProcessPool
+    from . import burdenSparse
+    from . import burdenFarField
+    from . import burdenIncremental
+    from . import burdenScenarios
+    from . import burdenCriticality
+    from . import burdenResilience
+    from . import burdenSiting
+    from . import burdenMonteCarlo
+    from . import burdenSensitivity
+    from . import distanceCache
+    from . import distanceProviders
+except ImportError:  # imported as a top-level module, e.g. by headlessRunner
+    import burdenKernels
+    import burdenProcessPool
+    import burdenSparse
+    import burdenFarField
+    import burdenIncremental
+    import burdenScenarios
+    import burdenCriticality
+    import burdenResilience
+    import burdenSiting
+    import burdenMonteCarlo
+    import burdenSensitivity
+    import distanceCache
+    import distanceProviders
 
+if TYPE_CHECKING:  # the engine itself does not need QGIS
+    from . import QgsSBCalcDataBridge
 
-class SBCalculator:
-    def __init__(self, dataBridge: QgsSBCalcDataBridge.QgsSBCalcDataBridge):
+
+class SBEngine:
+    """
+    The burden calculation itself, on plain numpy arrays; nothing in here needs QGIS.
+
+    The inputs are set either one by one with the setters (see fromArrays), or all
+    at once from a data bridge (see importFromDataBridge): a
+    QgsSBCalcDataBridge.QgsSBCalcDataBridge in the plugin, or a
+    HeadlessSBCalcDataBridge.HeadlessSBCalcDataBridge reading CSV and GeoPackage
+    files without QGIS.
+    """
+
+    def __init__(self, dataBridge=None):
         self._units = "feet"
         self._SLReduceArray = None
         self._distancesPopByFacs = None
@@ -16,6 +57,13 @@ class SBCalculator:
         self._attainFactorArray = None
         self._populationArray = None
 
+        # coordinates the distances are calculated from; np 1-d arrays
+        self._populationLatitudes = None
+        self._populationLongitudes = None
+        self._facilityLatitudes = None
+        self._facilityLongitudes = None
+        self._facilitySectors = None  # sector label of each facility
+
         self._populationToFacilitiesDistances = None  # this is derived, not set
 
         self._burdenArray = None  # this is derived, not set.
@@ -24,20 +72,97 @@ class SBCalculator:
         self._facilityLevelBenefits = None #this is experimental and extremely memory-expensive - should be None unless 
         # you are the developer
 
-        self.importFromDataBridge(dataBridge)  # make sure all fields are filled
+        # number of population groups handled at once when calculating burden.
+        # Peak memory is roughly (tile size * num facilities * num services) doubles;
+        # None means all population groups at once.
+        self._populationTileSize = 256
 
-    def importFromDataBridge(self, dataBridge: QgsSBCalcDataBridge.QgsSBCalcDataBridge):
-        self.setSLReduce(dataBridge.getSLReductionArray())
-        self.setZeroDistanceEffort(
-            dataBridge.getFacilityServiceDataByFieldName(
-                dataBridge.getSectorToServiceZdeField(), expected_type=float
-            )
-        )
-        self.setEffortPerDistanceArray(
-            dataBridge.getFacilityServiceDataByFieldName(
-                dataBridge.getSectorToServiceEpfField(), expected_type=float
+        # how the benefits are reduced over the facilities; see burdenKernels.BENEFIT_KERNELS.
+        # "broadcast" is the original formulation, "gemm" does the facility sum as a matrix product.
+        self._benefitKernel = "broadcast"
+
+        # how pairwise distances are calculated; see burdenKernels.DISTANCE_KERNELS.
+        # "haversine" is the original formulation, "unitVector" uses a matrix product
+        # of unit vectors and avoids most of the trig. "planar" is for projected
+        # coordinates, in which case the "latitudes" and "longitudes" are northings
+        # and eastings in map units of self._feetPerMapUnit feet.
+        self._distanceKernel = "haversine"
+        self._feetPerMapUnit = 1.0
+
+        # number of threads (or processes) the population tiles are spread over
+        self._workers = 1
+        # "threads" or "processes"; see setBackend
+        self._backend = "threads"
+
+        # optional distance cutoff: either only facilities within this many feet, or
+        # only this many nearest facilities of each sector, count. None means exact.
+        self._maxDistance = None
+        self._nearestPerSector = None
+        self._discardedBenefitBound = None  # this is derived, not set.
+
+        # optional far-field approximation: the maximum relative error allowed when a
+        # distant cluster of facilities is counted as one point. None means exact.
+        self._farFieldTolerance = None
+
+        # optional on-disk cache of distance matrices, reused across runs with the same
+        # coordinates; a distanceCache.DistanceCache, or None for no caching.
+        self._distanceCache = None
+
+        # where the distances come from; a distanceProviders.DistanceProvider, or None
+        # for straight-line distances from the coordinates (see getDistanceProvider).
+        self._distanceProvider = None
+
+        # (n,s) summed benefits kept for incremental facility updates; a
+        # burdenIncremental.IncrementalBenefits. This is derived, not set.
+        self._incrementalBenefits = None
+
+        # derivatives of the population-weighted total burden with respect to each
+        # facility's inputs; see calculateBurdenSensitivity. This is derived, not set.
+        self._burdenSensitivity = None
+
+        # memoized intermediate products; see the "memoized intermediate products"
+        # section. Each is None until it is needed, and set back to None by the
+        # setters of the inputs it depends on. These are derived, not set.
+        self._SLR = None  # (m,s) reduced service levels
+        self._reciprocalDenominators = None  # (n,m) 1/(ZDE + EPF*distance)
+        self._benefitSums = None  # (n,s) benefits summed over facilities, before attainment
+        self._burdenAggregates = {}  # sums of the burden array, by getter
+        # whether to keep the (n,m) reciprocal denominators too. They are as big as
+        # the distance matrix, so they are off by default; the (n,s) benefit sums,
+        # which the gemm path reuses, are kept either way.
+        self._memoizeReciprocalDenominators = False
+
+        if dataBridge is not None:
+            self.importFromDataBridge(dataBridge)  # make sure all fields are filled
+
+    def importFromDataBridge(self, dataBridge: "QgsSBCalcDataBridge.QgsSBCalcDataBridge"):
+        self.setWorkers(dataBridge.getWorkers())
+        self.setBackend("processes" if dataBridge.getUseProcesses() else "threads")
+        if dataBridge.getDistanceMode() == "planar":
+            self.setDistanceKernel("planar")
+            self.setFeetPerMapUnit(dataBridge.getFeetPerMapUnit())
+        cacheDirectory = dataBridge.getDistanceCacheDirectory()
+        self.setDistanceCache(
+            None
+            if cacheDirectory is None
+            else distanceCache.DistanceCache(
+                cacheDirectory, dataBridge.getDistanceCacheMaxBytes()
             )
         )
+        self.setSLReduce(dataBridge.getSLReductionArray())
+        zde = dataBridge.getFacilityServiceDataByFieldName(
+            dataBridge.getSectorToServiceZdeField(), expected_type=float
+        ).astype(np.float64)
+        epf = dataBridge.getFacilityServiceDataByFieldName(
+            dataBridge.getSectorToServiceEpfField(), expected_type=float
+        ).astype(np.float64)
+        # facilities of sectors the sector to service table doesn't have (reported by
+        # the bridge's getUnmatchedSectors) have no services; an effort of 1 keeps
+        # their benefits at 0 rather than 0/0.
+        unmatched = dataBridge.getFacilityServiceRows() < 0
+        zde[unmatched], epf[unmatched] = 1.0, 0.0
+        self.setZeroDistanceEffort(zde)
+        self.setEffortPerDistanceArray(epf)
         self.setServiceLevelArray(dataBridge.getFacilityServiceServiceArray())
         self.setAttainFactorArray(
             dataBridge.getPopulationDataByFieldName(
@@ -50,20 +175,74 @@ class SBCalculator:
             )
         )
 
-        self.setPopulationToFacilitiesDistances(
-            self.calculatePairwiseDistances(
-                dataBridge.getPopulationLatitudes(),
-                dataBridge.getFacilityLatitudes(),
-                dataBridge.getPopulationLongitudes(),
-                dataBridge.getFacilityLongitudes(),
+        self.setPopulationCoordinates(
+            dataBridge.getPopulationLatitudes(), dataBridge.getPopulationLongitudes()
+        )
+        self.setFacilityCoordinates(
+            dataBridge.getFacilityLatitudes(), dataBridge.getFacilityLongitudes()
+        )
+        self.setFacilitySectors(
+            dataBridge.getFacilityDataByFieldName(
+                dataBridge.getFacilitySectorField(), expected_type=str
             )
-            * 3.28084  # convert meters to feet
         )
         
         self.setSaveFacilityLevelBenefits(
             dataBridge.getSaveFacilityLevelResults()
         )
 
+    @classmethod
+    def fromArrays(
+        cls,
+        population: np.array,
+        attainFactors: np.array,
+        populationLatitudes: np.array,
+        populationLongitudes: np.array,
+        facilityLatitudes: np.array,
+        facilityLongitudes: np.array,
+        zde: np.array,
+        epf: np.array,
+        serviceLevels: np.array,
+        SLReduce: np.array = None,
+        facilitySectors=None,
+    ):
+        """
+        An engine with its inputs set from plain arrays, without any data bridge.
+
+        Inputs:
+            population, attainFactors: (n,)
+            populationLatitudes, populationLongitudes: (n,) population group locations
+            facilityLatitudes, facilityLongitudes: (m,) facility locations
+            zde, epf: (m,) zero distance effort and effort per foot
+            serviceLevels: (m,s) service levels
+            SLReduce: (m,) service level reductions in percent; None for no reduction
+            facilitySectors: (m,) sector labels, only needed for setNearestPerSector
+
+        The distance kernel and everything else are left at their defaults, and can
+        be changed with the setters before calculateBurden.
+        """
+        engine = cls()
+        engine.setPopulationArray(np.asarray(population))
+        engine.setAttainFactorArray(np.asarray(attainFactors, dtype=np.float64))
+        engine.setPopulationCoordinates(
+            np.asarray(populationLatitudes, dtype=np.float64),
+            np.asarray(populationLongitudes, dtype=np.float64),
+        )
+        engine.setFacilityCoordinates(
+            np.asarray(facilityLatitudes, dtype=np.float64),
+            np.asarray(facilityLongitudes, dtype=np.float64),
+        )
+        engine.setZeroDistanceEffort(np.asarray(zde, dtype=np.float64))
+        engine.setEffortPerDistanceArray(np.asarray(epf, dtype=np.float64))
+        engine.setServiceLevelArray(np.asarray(serviceLevels, dtype=np.float64))
+        engine.setSLReduce(
+            np.zeros(np.shape(zde)[0])
+            if SLReduce is None
+            else np.asarray(SLReduce, dtype=np.float64)
+        )
+        engine.setFacilitySectors(facilitySectors)
+        return engine
+
 
     def _calculatePerCapitaPerFacilityBurden(self):
         """Calculate per-person benefits from each facility/cbg pairing for each service type.
@@ -127,43 +306,209 @@ class SBCalculator:
         # You may ask here, why are you multiplying by 0.01 instead of dividing by 100?
         # Because division is expensive (The issues with floating point
         # numbers for 0.01 are not particularly worrisome here.)
+        #
+        # Building that whole (n,m,s) array at once is what runs us out of memory on
+        # statewide runs, so the population groups are walked in tiles of
+        # self._populationTileSize rows; only a (tile size, m, s) block exists at any
+        # one time, and each tile is reduced over the facilities and inverted straight
+        # into the (n,s) burden array. See burdenKernels.blockedBurden.
+        # Because the benefit separates as attainment[n] * sum_m (1/denominator[n,m]) * SLR[m,s],
+        # the facility sum can also be done as an (n,m)@(m,s) matrix product; that's the
+        # "gemm" benefit kernel, chosen with setBenefitKernel().
+
+        SLR = self._getReducedServiceLevels()  # (m,s)
+
+        approximate = (
+            self.getDistanceCutoff() is not None
+            or self.getNearestPerSector() is not None
+            or self.getFarFieldTolerance() is not None
+        )
+        if approximate and self.getDistanceKernel() == "planar":
+            raise ValueError(
+                "Distance cutoffs and the far field approximation need latitudes and "
+                "longitudes; they are not available for projected coordinates."
+            )
+        if approximate and self._distanceProvider is not None:
+            raise ValueError(
+                "Distance cutoffs and the far field approximation use straight-line "
+                "distances; they are not available with a distance provider."
+            )
 
-        # result is (n,m) due to broadcasting
-        denominator = self._ZdeArray + self._EpfArray * self._distancesPopByFacs
+        # Optionally, only nearby population/facility pairs are kept (see burdenSparse);
+        # this never builds the distance matrix.
+        self._discardedBenefitBound = None
+        if self.getDistanceCutoff() is not None or self.getNearestPerSector() is not None:
+            burden_arr, self._discardedBenefitBound = burdenSparse.cutoffBurden(
+                self._populationLatitudes,
+                self._populationLongitudes,
+                self._facilityLatitudes,
+                self._facilityLongitudes,
+                self._ZdeArray,
+                self._EpfArray,
+                SLR,
+                self._attainFactorArray,
+                maxDistance=self.getDistanceCutoff(),
+                nearestPerGroup=self.getNearestPerSector(),
+                facilityGroups=self._facilitySectors,
+            )
+            self._setBurdenArray(burden_arr)
+            return
 
-        SLR = (
-            (1 - self._SLReduceArray * 1e-2).reshape((-1, 1)) * self._serviceLevelArray
-        ).transpose()
+        # Optionally, distant clusters of facilities are counted as single points, to
+        # within a relative error (see burdenFarField); this never builds the distance matrix.
+        if self.getFarFieldTolerance() is not None:
+            burden_arr = burdenFarField.farFieldBurden(
+                self._populationLatitudes,
+                self._populationLongitudes,
+                self._facilityLatitudes,
+                self._facilityLongitudes,
+                self._ZdeArray,
+                self._EpfArray,
+                SLR,
+                self._attainFactorArray,
+                tolerance=self.getFarFieldTolerance(),
+                tileSize=self.getPopulationTileSize() or 256,
+                workers=self.getWorkers(),
+            )
+            self._setBurdenArray(burden_arr)
+            return
 
-        numerator = (
-            SLR.reshape((SLR.shape[0], SLR.shape[1], 1)) * self._attainFactorArray
-        ).transpose()
-        # numerator had darn better be (n,m,s) now.
+        # for very large runs the population groups can instead be sharded over worker
+        # processes, each computing its own distances; see burdenProcessPool.
+        # They calculate straight-line distances, so a distance provider keeps us on threads.
+        if (
+            self.getBackend() == "processes"
+            and not self.getSaveFacilityLevelBenefits()
+            and self._distanceProvider is None
+        ):
+            burden_arr = burdenProcessPool.processPoolBurden(
+                self._populationLatitudes,
+                self._populationLongitudes,
+                self._facilityLatitudes,
+                self._facilityLongitudes,
+                self._ZdeArray,
+                self._EpfArray,
+                SLR,
+                self._attainFactorArray,
+                workers=self.getWorkers(),
+                tileSize=self.getPopulationTileSize(),
+                kernel=self.getBenefitKernel(),
+                distanceKernel=self.getDistanceKernel(),
+                distanceOptions=self._distanceKernelOptions(),
+            )
+            self._setBurdenArray(burden_arr)
+            return
+
+        # the gemm kernel's burden is 1/(attainment * benefit sums), and the benefit
+        # sums are memoized, so e.g. a new attainment array only redoes that division.
+        # (The broadcast kernel multiplies by the attainment factor inside the facility
+        # sum, so it keeps its own, original, calculation.)
+        if self.getBenefitKernel() == "gemm" and not self.getSaveFacilityLevelBenefits():
+            with np.errstate(divide="ignore"):
+                self._setBurdenArray(
+                    1 / (self._attainFactorArray.reshape((-1, 1)) * self._getBenefitSums())
+                )
+            return
+
+        distances = self.getPopulationToFacilitiesDistances()
+        numPopulations, numFacilities = distances.shape
+        facility_level_benefits = None
+        # easter egg for researcher: if we need to look at facility-level benefits, this is where
+        # they're saved, if the settings are told to do so. This needs the full (n,m,s) array,
+        # so it defeats the tiling, and it is only built by the broadcast kernel.
+        kernel = self.getBenefitKernel()
+        if self.getSaveFacilityLevelBenefits():
+            kernel = "broadcast"
+            facility_level_benefits = np.empty(
+                (numPopulations, numFacilities, SLR.shape[1])
+            )
 
-        per_capita_per_facility_benefit_arr = numerator / (
-            denominator.reshape((denominator.shape[0], denominator.shape[1], 1))
-        )
-        
-        #easter egg for researcher: if we need to look at facility-level benefits, this is where
-        # they're saved, if the settings are told to do so
-        if self.getSaveFacilityLevelBenefits(): 
-            self.setPerFacilityBenefits(per_capita_per_facility_benefit_arr)
-
-        # #we now have the per-capita burden-grouped benefits,
-        # broken out by service
-        benefit_arr = np.sum(
-            per_capita_per_facility_benefit_arr, axis=1
-        )  # is of shape (num population groups, num services)
-
-        # invert to find partial burdens.
-        burden_arr = 1 / benefit_arr
         # is of shape (num cbgs, num services)
+        burden_arr = burdenKernels.blockedBurden(
+            distances,
+            self._ZdeArray,
+            self._EpfArray,
+            SLR,
+            self._attainFactorArray,
+            tileSize=self.getPopulationTileSize(),
+            facilityBenefitsOut=facility_level_benefits,
+            kernel=kernel,
+            workers=self.getWorkers(),
+        )
 
-        self._burdenArray = burden_arr
+        if facility_level_benefits is not None:
+            self.setPerFacilityBenefits(facility_level_benefits)
+
+        self._setBurdenArray(burden_arr)
 
     def calculateBurden(self):
+        self._incrementalBenefits = None
+        self._burdenSensitivity = None
         self._calculatePerCapitaPerFacilityBurden()
 
+    def _calculateFeetDistances(self, lat1, lat2, long1, long2):
+        """
+        Pairwise distances between the two sets of points, in feet.
+        Shapes are as for calculatePairwiseDistances.
+        """
+        if self.getDistanceKernel() != "haversine":
+            return burdenKernels.DISTANCE_KERNELS[self.getDistanceKernel()](
+                lat1, lat2, long1, long2, **self._distanceKernelOptions()
+            )
+        return (
+            self.calculatePairwiseDistances(lat1, lat2, long1, long2)
+            * burdenKernels.METERS_TO_FEET
+        )
+
+    def _distanceKernelOptions(self):
+        """
+        Extra keyword arguments for the distance kernel.
+        """
+        if self.getDistanceKernel() == "planar":
+            return {"feetPerUnit": self.getFeetPerMapUnit()}
+        return {}
+
+    def calculateDistances(self):
+        """
+        Calculates and stores the (num population groups, num facilities) distances in feet
+        from the stored population and facility coordinates. The population groups are
+        handled in tiles, spread over self._workers threads.
+
+        The distances come from the distance provider (see getDistanceProvider).
+        Without one of our own, and with a distance cache set, a matrix cached by an
+        earlier run with the same coordinates (and distance kernel) is memory-mapped
+        instead, and a newly calculated one is written straight into the cache.
+        """
+        provider = self.getDistanceProvider()
+
+        def fillDistances(out):
+            def distanceTile(rows):
+                out[rows] = provider.getFeetDistances(rows)
+
+            burdenKernels.forEachTile(
+                distanceTile, out.shape[0], self.getPopulationTileSize(), self.getWorkers()
+            )
+
+        shape = provider.getShape()
+        cache = self.getDistanceCache()
+        if cache is None or self._distanceProvider is not None:
+            distances = np.empty(shape)
+            fillDistances(distances)
+        else:
+            key = cache.key(
+                self._populationLatitudes,
+                self._populationLongitudes,
+                self._facilityLatitudes,
+                self._facilityLongitudes,
+                label=f"{self.getDistanceKernel()}{self._distanceKernelOptions()}",
+            )
+            distances = cache.load(key)
+            if distances is None or distances.shape != shape:
+                distances = cache.store(key, shape, fillDistances)
+        # not through the setter: these are the distances of the current coordinates,
+        # so nothing derived from them is out of date
+        self._distancesPopByFacs = distances
+
     def calculatePairwiseDistances(self, lat1, lat2, long1, long2):
         """
         Array-based version of latlong great circle distance calculation.
@@ -179,32 +524,635 @@ class SBCalculator:
         Returns:
             (n,m) array of pairwise distances, in meters
         """
-        radlatdiff = np.deg2rad(
-            lat1.reshape(lat1.shape[0], 1) - lat2.reshape(lat2.shape[0], 1).T
-        )  # of shape (n,m)
-        radlatsum = np.deg2rad(
-            lat1.reshape(lat1.shape[0], 1) + lat2.reshape(lat2.shape[0], 1).T
-        )  # of shape(n,m)
-        radlongdiff = np.deg2rad(
-            long1.reshape(long1.shape[0], 1) - long2.reshape(long2.shape[0], 1).T
-        )  # of shape (n,m)
-        sinsquaredlatdiff = np.power(np.sin(radlatdiff * 0.5), 2)  # (n,m)
-        sinsquaredlatsum = np.power(np.sin(radlatsum * 0.5), 2)  # (n,m)
-        sinsquaredlongdiff = np.power(np.sin(radlongdiff * 0.5), 2)  # (n,m)
-        res = (
-            2
-            * np.arcsin(
-                np.sqrt(
-                    sinsquaredlatdiff
-                    + (1 - sinsquaredlatdiff - sinsquaredlatsum) * sinsquaredlongdiff
+        return burdenKernels.greatCircleDistances(lat1, lat2, long1, long2)
+
+    # ------- memoized intermediate products ------------------
+    # The burden is built from intermediate products that only depend on some of
+    # the inputs:
+    #     reduced service levels SLR (m,s)       <- service levels, SL reduction
+    #     reciprocal denominators R (n,m)        <- distances, ZDE, EPF
+    #     benefit sums T = R @ SLR (n,s)         <- all of the above
+    #     burden = 1/(attainment * T) (n,s)      <- T, attainment
+    #     aggregates of the burden               <- burden, population
+    #     incremental benefit sums (n,s)         <- every input
+    # Each is calculated the first time it is needed and kept; the setters of the
+    # inputs it depends on set it back to None. So e.g. setting a new attainment
+    # array and recalculating (with the gemm kernel) only redoes the last division
+    # and the aggregates, and the getters the table writer calls repeatedly only
+    # reduce the burden array once. The incremental benefit sums are the copy of T
+    # that addFacility, updateFacility and removeFacility keep up to date; those
+    # write the facility arrays directly rather than through the setters, and clear
+    # the other products with _clearFacilityProducts, while any setter drops the
+    # incremental sums so the next update starts again from a full calculation.
+
+    def _getReducedServiceLevels(self):
+        if self._SLR is None:
+            self._SLR = burdenKernels.reducedServiceLevels(
+                self._SLReduceArray, self._serviceLevelArray
+            )
+        return self._SLR
+
+    def _getReciprocalDenominators(self):
+        """
+        (n,m) 1/(ZDE + EPF*distance); kept if getMemoizeReciprocalDenominators().
+        """
+        if self._reciprocalDenominators is not None:
+            return self._reciprocalDenominators
+        reciprocal = burdenScenarios.reciprocalDenominators(
+            self.getPopulationToFacilitiesDistances(),
+            self._ZdeArray,
+            self._EpfArray,
+            tileSize=self.getPopulationTileSize(),
+            workers=self.getWorkers(),
+        )
+        if self.getMemoizeReciprocalDenominators():
+            self._reciprocalDenominators = reciprocal
+        return reciprocal
+
+    def _getBenefitSums(self):
+        """
+        (n,s) benefits summed over the facilities, before attainment factors.
+        """
+        if self._benefitSums is None:
+            if self.getMemoizeReciprocalDenominators():
+                reciprocal = self._getReciprocalDenominators()
+                SLR = self._getReducedServiceLevels()
+                sums = np.empty((reciprocal.shape[0], SLR.shape[1]))
+
+                def sumTile(rows):
+                    sums[rows] = reciprocal[rows] @ SLR
+
+                burdenKernels.forEachTile(
+                    sumTile, reciprocal.shape[0], self.getPopulationTileSize(), self.getWorkers()
                 )
+                self._benefitSums = sums
+            else:
+                self._benefitSums = self._benefitSumsFromScratch()
+        return self._benefitSums
+
+    def _benefitSumsFromScratch(self):
+        return burdenIncremental.benefitSums(
+            self.getPopulationToFacilitiesDistances(),
+            self._ZdeArray,
+            self._EpfArray,
+            self._getReducedServiceLevels(),
+            tileSize=self.getPopulationTileSize(),
+            workers=self.getWorkers(),
+        )
+
+    def _clearServiceLevelProducts(self):
+        self._SLR = None
+        self._benefitSums = None
+        self._incrementalBenefits = None
+
+    def _clearDenominatorProducts(self):
+        self._reciprocalDenominators = None
+        self._benefitSums = None
+        self._incrementalBenefits = None
+
+    def _clearFacilityProducts(self):
+        """
+        Clears what the facility setters do, except the incremental benefit sums,
+        which the incremental updates keep up to date themselves.
+        """
+        self._SLR = None
+        self._reciprocalDenominators = None
+        self._benefitSums = None
+
+    def _setBurdenArray(self, burdenArray: np.array):
+        self._burdenArray = burdenArray
+        self._burdenAggregates = {}
+
+    def _getBurdenAggregate(self, name: str, calculate):
+        """
+        The aggregate of the burden array called name, calculated by calculate() the
+        first time and kept (read-only) until the burden or population changes.
+        """
+        if name not in self._burdenAggregates:
+            aggregate = np.asarray(calculate())
+            aggregate.flags.writeable = False
+            self._burdenAggregates[name] = aggregate
+        return self._burdenAggregates[name]
+
+    def _requireExactDistances(self, featureName: str):
+        """
+        Raises a ValueError naming the feature if a distance cutoff or the far field
+        approximation is set, since the feature needs every exact distance.
+        """
+        if (
+            self.getDistanceCutoff() is not None
+            or self.getNearestPerSector() is not None
+            or self.getFarFieldTolerance() is not None
+        ):
+            raise ValueError(
+                f"{featureName} is exact, so it is not available with a distance cutoff "
+                "or the far field approximation."
+            )
+
+    def _distanceTiles(self):
+        """
+        A function from a slice of population rows to their (rows, m) distances in
+        feet: from the stored distance matrix if there is one, and else from the
+        distance provider, a tile at a time.
+        """
+        distances = self._distancesPopByFacs
+        if distances is None:
+            return self.getDistanceProvider().getFeetDistances
+
+        def distanceTile(rows):
+            return distances[rows]
+
+        return distanceTile
+
+    # ------- incremental facility updates ------------------
+    # Each of these adjusts the (n,s) summed benefits by one facility's term, in
+    # O(n*s), and re-derives the burden array (and so all the aggregate getters),
+    # without recalculating the other facilities. See burdenIncremental.
+
+    def _getIncrementalBenefits(self):
+        """
+        The summed benefits to update; calculated from scratch the first time.
+        """
+        self._requireExactDistances("Updating the burden incrementally")
+        if self._incrementalBenefits is None:
+            self._incrementalBenefits = burdenIncremental.IncrementalBenefits(
+                self._calculateBenefitSums()
+            )
+        return self._incrementalBenefits
+
+    def _calculateBenefitSums(self):
+        # a copy, since the incremental updates change it in place
+        return np.array(self._getBenefitSums())
+
+    def _facilityDistances(self, facility: int):
+        """
+        (n,) distances in feet from every population group to one facility.
+        """
+        if self._distancesPopByFacs is not None or self._distanceProvider is not None:
+            return np.asarray(self.getPopulationToFacilitiesDistances()[:, facility])
+        return self._calculateFeetDistances(
+            self._populationLatitudes,
+            self._facilityLatitudes[facility : facility + 1],
+            self._populationLongitudes,
+            self._facilityLongitudes[facility : facility + 1],
+        )[:, 0]
+
+    def _facilityBenefits(self, facility: int, distances: np.array):
+        SLR = burdenKernels.reducedServiceLevels(
+            self._SLReduceArray[facility : facility + 1],
+            self._serviceLevelArray[facility : facility + 1],
+        )[0]
+        return burdenIncremental.facilityBenefits(
+            distances, self._ZdeArray[facility], self._EpfArray[facility], SLR
+        )
+
+    def _finishUpdate(self):
+        self._setBurdenArray(self._incrementalBenefits.getBurden(self._attainFactorArray))
+        self._facilityLevelBenefits = None  # no longer matches the facilities
+
+    def _checkFacilitiesCanChange(self):
+        if self._distanceProvider is not None:
+            raise ValueError(
+                "Facilities can't be added or removed while a distance provider is set, "
+                "since its distances are for a fixed set of facilities."
+            )
+
+    def addFacility(
+        self,
+        latitude: float,
+        longitude: float,
+        serviceLevels: np.array,
+        zde: float,
+        epf: float,
+        SLReduce=0.0,
+        sector=None,
+    ):
+        """
+        Adds a facility and updates the burden.
+
+        Inputs:
+            latitude, longitude: the facility's location (in map units for projected
+                coordinates; see setDistanceKernel)
+            serviceLevels: (s,) the facility's service levels
+            zde, epf: the facility's zero distance effort and effort per foot
+            SLReduce: the facility's service level reduction, in percent
+            sector: the facility's sector label
+
+        Returns:
+            index of the new facility
+        """
+        self._checkFacilitiesCanChange()
+        incremental = self._getIncrementalBenefits()
+
+        # the arrays are written directly: the setters would also throw away the
+        # incremental sums this updates
+        self._facilityLatitudes = np.append(self._facilityLatitudes, latitude)
+        self._facilityLongitudes = np.append(self._facilityLongitudes, longitude)
+        self._serviceLevelArray = np.vstack(
+            [self._serviceLevelArray, np.reshape(serviceLevels, (1, -1))]
+        )
+        self._ZdeArray = np.append(self._ZdeArray, zde)
+        self._EpfArray = np.append(self._EpfArray, epf)
+        self._SLReduceArray = np.append(self._SLReduceArray, SLReduce)
+        if self._facilitySectors is not None:
+            self._facilitySectors = list(self._facilitySectors) + [sector]
+        # the stored distance matrix no longer covers all the facilities; it is
+        # recalculated if it is needed again.
+        self._distancesPopByFacs = None
+        self._clearFacilityProducts()
+
+        facility = self._facilityLatitudes.shape[0] - 1
+        incremental.update(added=self._facilityBenefits(facility, self._facilityDistances(facility)))
+        self._finishUpdate()
+        return facility
+
+    def removeFacility(self, facility: int):
+        """
+        Removes a facility (by index) and updates the burden. Facilities after it
+        move down one index.
+        """
+        self._checkFacilitiesCanChange()
+        incremental = self._getIncrementalBenefits()
+        incremental.update(
+            removed=self._facilityBenefits(facility, self._facilityDistances(facility))
+        )
+
+        self._facilityLatitudes = np.delete(self._facilityLatitudes, facility)
+        self._facilityLongitudes = np.delete(self._facilityLongitudes, facility)
+        self._serviceLevelArray = np.delete(self._serviceLevelArray, facility, axis=0)
+        self._ZdeArray = np.delete(self._ZdeArray, facility)
+        self._EpfArray = np.delete(self._EpfArray, facility)
+        self._SLReduceArray = np.delete(self._SLReduceArray, facility)
+        if self._facilitySectors is not None:
+            sectors = list(self._facilitySectors)
+            del sectors[facility]
+            self._facilitySectors = sectors
+        self._distancesPopByFacs = None
+        self._clearFacilityProducts()
+        self._finishUpdate()
+
+    def updateFacility(
+        self, facility: int, serviceLevels=None, zde=None, epf=None, SLReduce=None
+    ):
+        """
+        Changes a facility's service levels ((s,) array), zero distance effort,
+        effort per foot and/or status (service level reduction, in percent; 100
+        takes it out of service), and updates the burden. Arguments left as None
+        are not changed.
+        """
+        incremental = self._getIncrementalBenefits()
+        distances = self._facilityDistances(facility)
+        before = self._facilityBenefits(facility, distances)
+
+        # copies, so that arrays shared with e.g. the data bridge are not changed;
+        # written directly, since the setters would throw away the incremental sums
+        if serviceLevels is not None:
+            self._serviceLevelArray = np.array(self._serviceLevelArray, dtype=float)
+            self._serviceLevelArray[facility] = serviceLevels
+        if zde is not None:
+            self._ZdeArray = np.array(self._ZdeArray, dtype=float)
+            self._ZdeArray[facility] = zde
+        if epf is not None:
+            self._EpfArray = np.array(self._EpfArray, dtype=float)
+            self._EpfArray[facility] = epf
+        if SLReduce is not None:
+            self._SLReduceArray = np.array(self._SLReduceArray, dtype=float)
+            self._SLReduceArray[facility] = SLReduce
+        self._clearFacilityProducts()
+
+        incremental.update(removed=before, added=self._facilityBenefits(facility, distances))
+        self._finishUpdate()
+
+    def checkIncrementalConsistency(self, rtol=1e-9):
+        """
+        Recalculates the summed benefits from scratch and compares them with the
+        incrementally updated ones.
+
+        Returns:
+            (consistent, largest relative difference): consistent is True if the
+            difference is within rtol.
+        """
+        difference = self._getIncrementalBenefits().relativeDifference(
+            self._benefitSumsFromScratch()
+        )
+        return difference <= rtol, difference
+
+    # ------- batched scenarios ------------------
+    # Many scenarios that only differ in the facilities' status (service level
+    # reduction) are evaluated together over the same distances; see burdenScenarios.
+    # Status factors are 1 - reduction/100 per facility: 1 is fully open, 0 is closed.
+
+    def _scenarioReciprocalDenominators(self):
+        self._requireExactDistances("Batched scenario evaluation")
+        return self._getReciprocalDenominators()
+
+    def iterScenarioBurdens(self, statusFactors: np.array, scenarioBatch=32):
+        """
+        Yields (scenario index, (num population groups, num services) burden array)
+        for each row of the (num scenarios, num facilities) statusFactors, computing
+        scenarioBatch scenarios per matrix product. Use this when there are too many
+        scenarios to keep all their burdens in memory.
+        """
+        yield from burdenScenarios.iterScenarioBurdens(
+            self._scenarioReciprocalDenominators(),
+            self._serviceLevelArray,
+            statusFactors,
+            self._attainFactorArray,
+            scenarioBatch,
+        )
+
+    def calculateScenarioBurdens(self, statusFactors: np.array, scenarioBatch=32):
+        """
+        Burdens of each row of the (num scenarios, num facilities) statusFactors.
+        Returns array of shape (num scenarios, num population groups, num services).
+        """
+        return burdenScenarios.scenarioBurdens(
+            self._scenarioReciprocalDenominators(),
+            self._serviceLevelArray,
+            statusFactors,
+            self._attainFactorArray,
+            scenarioBatch,
+        )
+
+    def calculateScenarioAggregatedWeightedBurdens(self, statusFactors: np.array, scenarioBatch=32):
+        """
+        Population-weighted burden summed over the population groups (as
+        getAggregatedWeightedBurden), for each row of the (num scenarios, num facilities)
+        statusFactors. Returns array of shape (num scenarios, num services); sum over
+        axis 1 for each scenario's total (as getAggregatedWeightedTotalBurden).
+        """
+        return burdenScenarios.aggregatedWeightedScenarioBurdens(
+            self._scenarioReciprocalDenominators(),
+            self._serviceLevelArray,
+            statusFactors,
+            self._attainFactorArray,
+            self._populationArray,
+            scenarioBatch,
+        )
+
+    # ------- facility criticality ------------------
+
+    def rankFacilityCriticality(self, topK=10):
+        """
+        How much population-weighted burden would go up, for each service, if each
+        facility were removed on its own; calculated in one blocked pass, without
+        building per-facility benefits (see burdenCriticality). Uses the stored
+        distance matrix if there is one, and otherwise calculates distances a tile
+        at a time.
+
+        Returns:
+            (criticality, top): criticality is an array of shape (number of facilities,
+            number of services); top holds the indices of the topK facilities with
+            the largest increase over all services, largest first. A facility that is
+            the only provider of a service to some population group has an infinite
+            increase.
+        """
+        self._requireExactDistances("Facility criticality")
+        distanceTile = self._distanceTiles()
+
+        criticality = burdenCriticality.facilityCriticality(
+            distanceTile,
+            self._attainFactorArray.shape[0],
+            self._ZdeArray,
+            self._EpfArray,
+            self._getReducedServiceLevels(),
+            self._attainFactorArray,
+            self._populationArray,
+            tileSize=self.getPopulationTileSize(),
+            workers=self.getWorkers(),
+        )
+        return criticality, burdenCriticality.topFacilities(criticality, topK)
+
+    def findWorstCaseFacilityLosses(self, k, lazy=False):
+        """
+        Greedy search for the k facilities that, lost together, raise population-weighted
+        burden the most (see burdenResilience). The calculator itself is not changed.
+
+        Inputs:
+            k: number of facilities to remove
+            lazy: only recalculate the gains of the most promising candidates at each
+                step. This is much faster, but is an approximation: it can miss the
+                facility the exact greedy search (the default), which recalculates
+                every candidate at every step, would remove, and so report a milder
+                worst case.
+
+        Returns:
+            (removed, burden, unserved): the removed facility indices, in order; the
+            population-weighted total burden of the population groups that still
+            have a provider, before any removal and after each one; and the
+            population (counted once per service) left without any provider,
+            before any removal and after each one.
+        """
+        self._requireExactDistances("The worst case facility loss search")
+        distanceTile = self._distanceTiles()
+
+        return burdenResilience.worstCaseRemovals(
+            distanceTile,
+            self._facilityDistances,
+            self._attainFactorArray.shape[0],
+            self._ZdeArray,
+            self._EpfArray,
+            self._getReducedServiceLevels(),
+            self._attainFactorArray,
+            self._populationArray,
+            k,
+            lazy=lazy,
+            tileSize=self.getPopulationTileSize(),
+            workers=self.getWorkers(),
+        )
+
+    # ------- sensitivity ------------------
+
+    def calculateBurdenSensitivity(self):
+        """
+        Calculates the burden (as calculateBurden does), and in the same blocked pass
+        the derivatives of the population-weighted total burden (as
+        getAggregatedWeightedTotalBurden) with respect to every facility's service
+        levels, zero distance effort, effort per foot and service level reduction
+        (see burdenSensitivity). Costs about twice as much as calculateBurden on
+        the exact path. Get the derivatives with getBurdenSensitivity.
+        """
+        self._requireExactDistances("Sensitivity analysis")
+        distanceTile = self._distanceTiles()
+
+        burden, gradients = burdenSensitivity.burdenAndGradients(
+            distanceTile,
+            self._attainFactorArray.shape[0],
+            self._ZdeArray,
+            self._EpfArray,
+            self._SLReduceArray,
+            self._serviceLevelArray,
+            self._attainFactorArray,
+            self._populationArray,
+            tileSize=self.getPopulationTileSize(),
+            workers=self.getWorkers(),
+        )
+        self._incrementalBenefits = None
+        self._setBurdenArray(burden)
+        self._burdenSensitivity = gradients
+
+    # ------- Monte Carlo uncertainty ------------------
+
+    def calculateMonteCarloBurden(
+        self,
+        specs: dict,
+        numDraws: int,
+        batchSize=8,
+        quantiles=(0.05, 0.5, 0.95),
+        seed=None,
+        drawPerSector=True,
+    ):
+        """
+        Burden distributions when service levels, ZDE, EPF and/or attainment factors
+        are uncertain (see burdenMonteCarlo). The distances are read tile by tile,
+        from the stored distance matrix if there is one and else from the distance
+        provider, once per batch of draws; the (n,m) matrix is never built here.
+
+        Inputs:
+            specs: dict from input name ("serviceLevels", "zde", "epf",
+                "attainFactors") to a distribution spec of multiplicative noise,
+                e.g. {"serviceLevels": ("triangular", 0.8, 1.0, 1.2)}
+            numDraws: number of draws
+            batchSize: number of draws calculated together
+            quantiles: quantile levels (fractions between 0 and 1) to estimate
+            seed: random seed, for repeatable runs
+            drawPerSector: draw facility inputs once per sector, so that all the
+                facilities of a sector move together; otherwise once per facility.
+
+        Returns:
+            burdenMonteCarlo.BurdenDistributions, with running means, variances and
+            quantile estimates per population group and service, and of the
+            population-weighted totals.
+        """
+        self._requireExactDistances("The Monte Carlo burden")
+        facilityGroups = None
+        if drawPerSector and self._facilitySectors is not None:
+            _, facilityGroups = np.unique(
+                np.asarray(self._facilitySectors, dtype=str), return_inverse=True
+            )
+        return burdenMonteCarlo.monteCarloBurden(
+            self._distanceTiles(),
+            self._attainFactorArray.shape[0],
+            self._ZdeArray,
+            self._EpfArray,
+            self._getReducedServiceLevels(),
+            self._attainFactorArray,
+            self._populationArray,
+            specs,
+            numDraws,
+            facilityGroups=facilityGroups,
+            batchSize=batchSize,
+            quantiles=quantiles,
+            seed=seed,
+            tileSize=self.getPopulationTileSize(),
+            workers=self.getWorkers(),
+        )
+
+    # ------- facility siting ------------------
+
+    def optimizeFacilitySiting(
+        self,
+        candidateLatitudes: np.array,
+        candidateLongitudes: np.array,
+        serviceLevels: np.array,
+        zde: float,
+        epf: float,
+        p: int,
+        lazy=True,
+        candidateDistanceProvider=None,
+    ):
+        """
+        Greedy search for the p candidate sites at which a new facility of one sector
+        lowers population-weighted burden the most, on top of the current facilities
+        (see burdenSiting). The calculator itself is not changed; add the picked
+        sites with addFacility to carry on from there.
+
+        The data bridge's getCandidateSiteLocations and getSectorServiceProfile give
+        the inputs for a candidate site layer and a sector.
+
+        Inputs:
+            candidateLatitudes, candidateLongitudes: (c,) candidate site locations
+                (in map units for projected coordinates; see setDistanceKernel)
+            serviceLevels: (s,) the new facilities' service levels
+            zde, epf: the new facilities' zero distance effort and effort per foot
+            p: number of sites to pick
+            lazy: CELF lazy re-evaluation (much faster); lazy=False recalculates
+                every candidate at every step
+            candidateDistanceProvider: distanceProviders.DistanceProvider for the
+                (n,c) distances to the candidates, e.g. an origin-destination matrix.
+                By default, straight-line distances from the coordinates.
+
+        Returns:
+            (picked, burden, unserved): the picked candidate indices, in order; the
+            population-weighted total burden of the population groups that have a
+            provider, before any pick and after each one; and the population
+            (counted once per service) without any provider, before any pick and
+            after each one.
+        """
+        self._requireExactDistances("Facility siting")
+        candidateLatitudes = np.asarray(candidateLatitudes, dtype=np.float64)
+        candidateLongitudes = np.asarray(candidateLongitudes, dtype=np.float64)
+        if candidateDistanceProvider is None:
+            candidateDistanceProvider = distanceProviders.CoordinateDistanceProvider(
+                self._populationLatitudes,
+                self._populationLongitudes,
+                candidateLatitudes,
+                candidateLongitudes,
+                self._calculateFeetDistances,
             )
-            * 6.3781e6
-        )  # had better be (n,m)
-        return res
+
+            def candidateDistances(candidates):
+                return self._calculateFeetDistances(
+                    self._populationLatitudes,
+                    candidateLatitudes[candidates],
+                    self._populationLongitudes,
+                    candidateLongitudes[candidates],
+                )
+
+        else:
+
+            def candidateDistances(candidates):
+                # keep only the requested columns of each tile, so a stale batch never
+                # holds the whole (n,c) matrix
+                numPopulation = candidateDistanceProvider.getShape()[0]
+                columns = np.empty((numPopulation, len(candidates)), dtype=np.float64)
+                for rows in burdenKernels.populationTiles(
+                    numPopulation, self.getPopulationTileSize()
+                ):
+                    columns[rows] = candidateDistanceProvider.getFeetDistances(rows)[:, candidates]
+                return columns
+
+        return burdenSiting.greedySiting(
+            candidateDistanceProvider.getFeetDistances,
+            candidateDistances,
+            self._attainFactorArray.shape[0],
+            zde,
+            epf,
+            serviceLevels,
+            self._getIncrementalBenefits().getBenefitSums(),
+            self._attainFactorArray,
+            self._populationArray,
+            p,
+            lazy=lazy,
+            tileSize=self.getPopulationTileSize(),
+            workers=self.getWorkers(),
+        )
 
     # ------- getters ------------------
 
+    def getBurdenSensitivity(self):
+        """
+        Derivatives of the population-weighted total burden, from the last
+        calculateBurdenSensitivity: a dict with "serviceLevels" (num facilities,
+        num services), and "zde", "epf" and "SLReduce" (num facilities,) arrays.
+        The SLReduce derivative is per percentage point of reduction.
+        """
+        if self._burdenSensitivity is None:
+            raise ValueError(
+                "No sensitivities have been calculated; run calculateBurdenSensitivity first."
+            )
+        return self._burdenSensitivity
+
     def getBurdenArray(self):
         """
         burdenArray is of shape (number of population groups, number of services)
@@ -228,7 +1176,9 @@ class SBCalculator:
                 "Because burden has not yet been calculated, derived calculations cannot be performed."
             )
 
-        return np.sum(burdenArray, axis=0)
+        return self._getBurdenAggregate(
+            "perCapitaAggregated", lambda: np.sum(burdenArray, axis=0)
+        )
 
     def getPerCapitaAggregatedTotalBurden(self):
         """
@@ -236,7 +1186,9 @@ class SBCalculator:
         services and populations - a scalar (or, perhaps more accurately,
         a length-1 numpy array)
         """
-        return np.sum(self.getPerCapitaAggregatedBurdenArray())
+        return self._getBurdenAggregate(
+            "perCapitaAggregatedTotal", lambda: np.sum(self.getPerCapitaAggregatedBurdenArray())
+        )
 
     def getPerCapitaTotalBurden(self):
         """
@@ -250,7 +1202,7 @@ class SBCalculator:
                 "Because burden has not yet been calculated, derived calculations cannot be performed."
             )
 
-        return np.sum(burdenArray, axis=1)
+        return self._getBurdenAggregate("perCapitaTotal", lambda: np.sum(burdenArray, axis=1))
 
     def getPerCapitaWeightedTotalBurden(self):
         """
@@ -258,7 +1210,10 @@ class SBCalculator:
         (aggregated across services).
         Shape (num population groups, )
         """
-        return self._populationArray * self.getPerCapitaTotalBurden()
+        return self._getBurdenAggregate(
+            "perCapitaWeightedTotal",
+            lambda: self._populationArray * self.getPerCapitaTotalBurden(),
+        )
 
     def getAggregatedWeightedTotalBurden(self):
         """
@@ -266,7 +1221,9 @@ class SBCalculator:
         population groups.
         Shape (1,)
         """
-        return np.sum(self.getPerCapitaWeightedTotalBurden())
+        return self._getBurdenAggregate(
+            "aggregatedWeightedTotal", lambda: np.sum(self.getPerCapitaWeightedTotalBurden())
+        )
 
     def getAggregatedWeightedBurden(self):
         """
@@ -274,10 +1231,83 @@ class SBCalculator:
         the population groups, but still grouped by services.
         Of shape (number of services, )
         """
-        return np.sum(
-            self._populationArray.reshape((-1, 1)) * self.getBurdenArray(), axis=0
+        burdenArray = self.getBurdenArray()
+        return self._getBurdenAggregate(
+            "aggregatedWeighted",
+            lambda: np.sum(self._populationArray.reshape((-1, 1)) * burdenArray, axis=0),
         )
         
+    def getPopulationTileSize(self):
+        return self._populationTileSize
+
+    def getBenefitKernel(self):
+        return self._benefitKernel
+
+    def getDistanceKernel(self):
+        return self._distanceKernel
+
+    def getFeetPerMapUnit(self):
+        return self._feetPerMapUnit
+
+    def getPopulationToFacilitiesDistances(self):
+        """
+        (num population groups, num facilities) distances in feet.
+        Calculated from the coordinates the first time they are asked for.
+        """
+        if self._distancesPopByFacs is None:
+            self.calculateDistances()
+        return self._distancesPopByFacs
+
+    def getWorkers(self):
+        return self._workers
+
+    def getMemoizeReciprocalDenominators(self):
+        return self._memoizeReciprocalDenominators
+
+    def getDistanceCache(self):
+        return self._distanceCache
+
+    def getDistanceProvider(self):
+        """
+        The distanceProviders.DistanceProvider the distances come from: the one set
+        with setDistanceProvider, or else straight-line distances from the stored
+        coordinates, using the distance kernel.
+        """
+        if self._distanceProvider is not None:
+            return self._distanceProvider
+        return distanceProviders.CoordinateDistanceProvider(
+            self._populationLatitudes,
+            self._populationLongitudes,
+            self._facilityLatitudes,
+            self._facilityLongitudes,
+            self._calculateFeetDistances,
+        )
+
+    def getDistanceCutoff(self):
+        return self._maxDistance
+
+    def getNearestPerSector(self):
+        return self._nearestPerSector
+
+    def getFarFieldTolerance(self):
+        return self._farFieldTolerance
+
+    def getDiscardedBenefitBound(self):
+        """
+        Only available when burden was calculated with a distance cutoff.
+        (number of population groups, number of services) upper bound on the per-capita
+        benefit that the cutoff left out. The exact burden lies between
+        1/(1/burden + bound) and the calculated burden.
+        """
+        if self._discardedBenefitBound is None:
+            raise ValueError(
+                "Burden has not been calculated with a distance cutoff, so there is no discarded benefit bound."
+            )
+        return self._discardedBenefitBound
+
+    def getBackend(self):
+        return self._backend
+
     def getSaveFacilityLevelBenefits(self): 
         return self._saveFacilityLevelBenefits
       
@@ -286,29 +1316,197 @@ class SBCalculator:
 
     # --------setters --------
 
+    # Setters clear the memoized products that depend on what they set. Arrays are
+    # kept as given (not copied); to change one in place, set it again afterwards.
+
     def setSLReduce(self, SLR: np.array):
         self._SLReduceArray = SLR
+        self._clearServiceLevelProducts()
 
     def setPopulationToFacilitiesDistances(self, data: np.array):
         self._distancesPopByFacs = data
+        self._clearDenominatorProducts()
 
     def setZeroDistanceEffort(self, data: np.array):
         self._ZdeArray = data
+        self._clearDenominatorProducts()
 
     def setEffortPerDistanceArray(self, data: np.array):
         self._EpfArray = data
+        self._clearDenominatorProducts()
 
     def setServiceLevelArray(self, data: np.array):
         self._serviceLevelArray = data
+        self._clearServiceLevelProducts()
 
     def setAttainFactorArray(self, data: np.array):
+        # the burden depends on it, but is only recalculated by calculateBurden
         self._attainFactorArray = data
+        self._incrementalBenefits = None
 
     def setPopulationArray(self, data: np.array):
         self._populationArray = data
+        self._burdenAggregates = {}
+        self._incrementalBenefits = None
+
+    def setMemoizeReciprocalDenominators(self, setting: bool):
+        """
+        Whether to keep the (num population groups, num facilities) reciprocal
+        denominators between calculations (default False). They are as big as the
+        distance matrix, so keeping them doubles the peak memory of the gemm path;
+        turn this on only to speed up repeated changes to the service levels.
+        """
+        self._memoizeReciprocalDenominators = bool(setting)
+        if not setting:
+            self._reciprocalDenominators = None
+
+    def setPopulationTileSize(self, size):
+        """
+        Number of population groups to calculate at once (positive int), or None
+        to calculate all population groups at once.
+        """
+        self._populationTileSize = size
+
+    def setBenefitKernel(self, kernel: str):
+        """
+        Either "broadcast" (the original calculation) or "gemm"
+        (matrix-product calculation; faster, equal to within rounding).
+        """
+        if kernel not in burdenKernels.BENEFIT_KERNELS:
+            raise ValueError(
+                f"Unknown benefit kernel {kernel}; options are {list(burdenKernels.BENEFIT_KERNELS)}."
+            )
+        self._benefitKernel = kernel
+
+    def setDistanceKernel(self, kernel: str):
+        """
+        Either "haversine" (the original calculation) or "unitVector"
+        (dot products of unit vectors; faster, equal to within a centimeter or so
+        at very short distances, see burdenKernels.unitVectorFeetDistances)
+        for latitudes and longitudes, or "planar" for projected coordinates
+        (see setFeetPerMapUnit). Clears any distances already calculated.
+        """
+        if kernel not in burdenKernels.DISTANCE_KERNELS:
+            raise ValueError(
+                f"Unknown distance kernel {kernel}; options are {list(burdenKernels.DISTANCE_KERNELS)}."
+            )
+        if kernel != self._distanceKernel:
+            self.setPopulationToFacilitiesDistances(None)
+        self._distanceKernel = kernel
+
+    def setFeetPerMapUnit(self, feetPerUnit: float):
+        """
+        Length of one map unit, in feet, for the "planar" distance kernel
+        (e.g. 3.28084 for meters, or 1.000002 for US survey feet).
+        Clears any distances already calculated.
+        """
+        if feetPerUnit != self._feetPerMapUnit:
+            self.setPopulationToFacilitiesDistances(None)
+        self._feetPerMapUnit = feetPerUnit
+
+    def setWorkers(self, workers: int):
+        """
+        Number of threads to split the population groups across. Results do not
+        depend on this number.
+        """
+        if workers is None or int(workers) < 1:
+            raise ValueError(f"Number of workers must be a positive integer, not {workers}.")
+        self._workers = int(workers)
+
+    def setBackend(self, backend: str):
+        """
+        "threads" (default): tiles are spread over a thread pool of self._workers threads.
+        "processes": population shards are spread over self._workers worker processes
+            sharing their inputs through shared memory (see burdenProcessPool).
+            The distance matrix is never built in this process.
+        """
+        if backend not in ["threads", "processes"]:
+            raise ValueError(f"Unknown backend {backend}; options are 'threads' and 'processes'.")
+        self._backend = backend
+
+    def setDistanceCache(self, cache):
+        """
+        A distanceCache.DistanceCache to keep distance matrices in between runs,
+        or None (the default) to calculate them every time.
+        """
+        self._distanceCache = cache
+
+    def setDistanceProvider(self, provider):
+        """
+        A distanceProviders.DistanceProvider to take the distances from (e.g. an
+        ODMatrixDistanceProvider of road network distances), or None (the default)
+        for straight-line distances from the coordinates. Its shape must match the
+        population groups and facilities. Clears any distances already calculated.
+        """
+        self._distanceProvider = provider
+        self.setPopulationToFacilitiesDistances(None)
+
+    def setDistanceCutoff(self, maxDistance):
+        """
+        Only count facilities within maxDistance feet of each population group.
+        None (the default) counts all facilities. Clears any nearest-per-sector limit
+        and far-field approximation.
+        """
+        self._maxDistance = maxDistance
+        if maxDistance is not None:
+            self._nearestPerSector = None
+            self._farFieldTolerance = None
+
+    def setNearestPerSector(self, k):
+        """
+        Only count the k nearest facilities of each sector for each population group.
+        None (the default) counts all facilities. Clears any distance cutoff and
+        far-field approximation.
+        """
+        self._nearestPerSector = k
+        if k is not None:
+            self._maxDistance = None
+            self._farFieldTolerance = None
+
+    def setFarFieldTolerance(self, tolerance):
+        """
+        Count distant clusters of facilities as single points, keeping each burden
+        within this relative error of the exact one (e.g. 1e-3). None (the default)
+        is the exact calculation. Clears any distance cutoff.
+        """
+        if tolerance is not None and tolerance < 0:
+            raise ValueError(f"The far field tolerance must not be negative, not {tolerance}.")
+        self._farFieldTolerance = tolerance
+        if tolerance is not None:
+            self._maxDistance = None
+            self._nearestPerSector = None
+
+    def setFacilitySectors(self, sectors):
+        self._facilitySectors = sectors
+
+    def setPopulationCoordinates(self, latitudes: np.array, longitudes: np.array):
+        """
+        Clears any distances already calculated.
+        """
+        self._populationLatitudes = latitudes
+        self._populationLongitudes = longitudes
+        self.setPopulationToFacilitiesDistances(None)
+
+    def setFacilityCoordinates(self, latitudes: np.array, longitudes: np.array):
+        """
+        Clears any distances already calculated.
+        """
+        self._facilityLatitudes = latitudes
+        self._facilityLongitudes = longitudes
+        self.setPopulationToFacilitiesDistances(None)
 
     def setSaveFacilityLevelBenefits(self, setting:bool): 
         self._saveFacilityLevelBenefits = setting
     
     def setPerFacilityBenefits(self,data: np.array): 
-        self._facilityLevelBenefits = data
\ No newline at end of file
+        self._facilityLevelBenefits = data
+
+
+class SBCalculator(SBEngine):
+    """
+    The engine, with its inputs taken from the QGIS layers through a
+    QgsSBCalcDataBridge (see importFromDataBridge).
+    """
+
+    def __init__(self, dataBridge: "QgsSBCalcDataBridge.QgsSBCalcDataBridge"):
+        super().__init__(dataBridge)
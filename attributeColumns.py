@@ -0,0 +1,146 @@
+"""
+Typed numpy columns of layer attributes, with their nulls, for the data bridges.
+
+A layer's attributes are read once, row by row, for only the fields that are
+needed (see QgsSBCalcDataBridge._extractColumns); the rows are then split into one
+AttributeColumn per field: int64 or float64 values for numeric fields, and python
+objects for everything else, each with a boolean mask of the nulls. The getters
+then convert whole columns at once instead of checking every cell.
+
+The sector to service table is joined to the facilities the same way, by
+gathering rows with firstMatchingRows.
+
+Nothing in here depends on QGIS; how a null looks (e.g. a NULL QVariant) is up to
+the caller.
+"""
+
+import numpy as np
+
+
+# kinds of column, by the type of field they are read from
+COLUMN_KINDS = ["int", "float", "string"]
+
+
+class AttributeColumn:
+    """
+    One field's values, and which of them are null.
+    """
+
+    def __init__(self, values: np.array, null: np.array):
+        self._values = values  # int64, float64 or object; nulls are 0 (or None)
+        self._null = null  # bool
+
+    def getValues(self):
+        return self._values
+
+    def getNullMask(self):
+        return self._null
+
+    def asList(self, nullValue=None):
+        """
+        Values as a python list, with nullValue in place of the nulls.
+        """
+        values = self._values.astype(object)
+        values[self._null] = nullValue
+        return values.tolist()
+
+    def asNumeric(self, dtype=None):
+        """
+        Values as a numpy array, nulls being 0s. Numeric columns keep their type
+        unless dtype is given; other columns are converted to dtype (float64 by
+        default), and raise a ValueError if they have values that are not numbers.
+        """
+        if self._values.dtype != object:
+            return self._values if dtype is None else self._values.astype(dtype)
+        numeric = np.zeros(self._values.shape[0], dtype=np.float64 if dtype is None else dtype)
+        try:
+            numeric[~self._null] = self._values[~self._null].astype(numeric.dtype)
+        except (ValueError, TypeError):
+            raise ValueError("Column has values that are not numbers.")
+        return numeric
+
+    def take(self, rows: np.array):
+        """
+        A new AttributeColumn of the values at rows (integer indices); rows of -1
+        give nulls, as for the unmatched rows of firstMatchingRows.
+        """
+        fill = np.array([None if self._values.dtype == object else 0], dtype=self._values.dtype)
+        return AttributeColumn(
+            np.append(self._values, fill)[rows], np.append(self._null, True)[rows]
+        )
+
+
+def columnFromValues(values, kind: str, isNull):
+    """
+    An AttributeColumn from a sequence of raw values.
+
+    Inputs:
+        values: sequence of one field's values, one per feature
+        kind: one of COLUMN_KINDS
+        isNull: called with a value, says whether it is a null
+    """
+    if kind not in COLUMN_KINDS:
+        raise ValueError(f"Unknown column kind {kind}; expected one of {COLUMN_KINDS}.")
+    objects = np.empty(len(values), dtype=object)
+    objects[:] = values
+    null = np.frompyfunc(isNull, 1, 1)(objects).astype(bool)
+    if kind == "string":
+        objects[null] = None
+        return AttributeColumn(objects, null)
+    typed = np.zeros(objects.shape[0], dtype=np.int64 if kind == "int" else np.float64)
+    typed[~null] = objects[~null].astype(typed.dtype)
+    return AttributeColumn(typed, null)
+
+
+def columnsFromRows(rows, fieldnames, kinds, isNull):
+    """
+    {field name: AttributeColumn} from rows of raw values, each row holding the
+    values of fieldnames in order; see columnFromValues.
+    """
+    if not rows:
+        return {
+            name: columnFromValues([], kind, isNull) for name, kind in zip(fieldnames, kinds)
+        }
+    columns = list(zip(*rows))
+    return {
+        name: columnFromValues(column, kind, isNull)
+        for name, kind, column in zip(fieldnames, kinds, columns)
+    }
+
+
+def firstMatchingRows(keys, tableKeys):
+    """
+    Joins a table to keys, as native:joinattributestable does with one-to-one
+    matching: each key gets the first row of the table with an equal key (compared
+    as strings), and keys that are null or not in the table get -1.
+
+    The keys are encoded as integer codes with np.unique, so each distinct key is
+    looked up once, and the rows are gathered by indexing with the codes.
+
+    Inputs:
+        keys: sequence of keys, e.g. the facilities' sectors, with None for nulls
+        tableKeys: sequence of the table's keys, e.g. the sector to service table's
+
+    Returns:
+        tuple ((len(keys),) int array of rows, {unmatched key: number of keys}),
+        with None as the key of the nulls
+    """
+    null = np.array([i is None for i in keys], dtype=bool)
+    strings = np.array(["" if i is None else str(i) for i in keys], dtype=str)
+    distinct, codes = np.unique(strings, return_inverse=True)
+    firstRows = {}
+    for row, key in enumerate(tableKeys):
+        if key is not None:
+            firstRows.setdefault(str(key), row)
+    distinctRows = np.array([firstRows.get(i, -1) for i in distinct], dtype=np.int64)
+    rows = distinctRows[codes.reshape(-1)]
+    rows[null] = -1
+
+    counts = np.bincount(codes.reshape(-1)[~null], minlength=distinct.shape[0])
+    unmatched = {
+        str(distinct[i]): int(counts[i])
+        for i in np.flatnonzero((distinctRows < 0) & (counts > 0))
+    }
+    if null.any():
+        unmatched[None] = int(null.sum())
+    return rows, unmatched
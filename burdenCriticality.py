@@ -0,0 +1,104 @@
+"""
+Facility criticality: how much population-weighted burden would go up, per service,
+if each facility were removed on its own.
+
+With T[i,k] the summed per-capita benefit of population group i for service k (before
+the attainment factor a[i]) and b[i,j,k] = SLR[j,k] / (ZDE[j] + EPF[j]*distance[i,j])
+facility j's part of it, removing facility j changes the burden of group i by
+    1/(a[i]*(T[i,k] - b[i,j,k])) - 1/(a[i]*T[i,k]) = b[i,j,k] / (a[i] * T[i,k] * (T[i,k] - b[i,j,k]))
+and the population-weighted increase for facility j and service k is that, weighted by
+population and summed over i.
+
+Each tile of population groups gets its own T from its own distances, and adds its
+groups' increases into an (m,s) table, so nothing (n,m,s) (or even (n,m)) is ever
+built: memory is O(n*s + m*s) plus one (tile size, m) block.
+
+If facility j is the only one providing service k to a group, T - b is 0 up to
+rounding; remainders that cancel to a negligible fraction of T are taken to be 0,
+so the increase is infinite, as a recalculation without the facility would show.
+
+Nothing in here depends on QGIS.
+"""
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+# a benefit that cancels to less than this fraction of itself is taken to be 0
+CANCELLATION_TOLERANCE = 1e-12
+
+
+def _tileCriticality(distances, zde, epf, SLR, attainFactors, population):
+    """
+    (m,s) population-weighted burden increases from one tile of population groups.
+    """
+    reciprocal_denominator = 1 / (zde + epf * distances)  # (t,m)
+    total = reciprocal_denominator @ SLR  # (t,s)
+    weight = burdenKernels.populationWeights(attainFactors, population)
+
+    out = np.empty(SLR.shape)
+    for service in range(SLR.shape[1]):
+        benefit = reciprocal_denominator * SLR[:, service]  # (t,m)
+        serviceTotal = total[:, service : service + 1]  # (t,1)
+        remaining = serviceTotal - benefit
+        remaining[np.abs(remaining) <= CANCELLATION_TOLERANCE * np.abs(serviceTotal)] = 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            increase = benefit / (serviceTotal * remaining)
+        increase[benefit == 0] = 0  # facilities that provide nothing here change nothing
+        out[:, service] = weight @ increase
+    return out
+
+
+def facilityCriticality(
+    distanceTile,
+    numPopulations: int,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+    population: np.array,
+    tileSize=256,
+    workers=1,
+):
+    """
+    Population-weighted burden increase from removing each facility on its own.
+
+    Inputs:
+        distanceTile: called with a slice of population groups, returns their (t,m)
+            distances in feet (e.g. a block of a stored distance matrix, or a
+            distance provider's getFeetDistances)
+        numPopulations: n
+        zde, epf: (m,) zero distance effort and effort per foot
+        SLR: (m,s) reduced service levels
+        attainFactors, population: (n,)
+        tileSize: number of population groups per block
+        workers: number of threads; results are the same for any number (see
+            burdenKernels.sumOverTiles)
+
+    Returns:
+        (m,s) array of population-weighted burden increases
+    """
+    def tileCriticality(rows):
+        return (
+            _tileCriticality(
+                distanceTile(rows), zde, epf, SLR, attainFactors[rows], population[rows]
+            ),
+        )
+
+    (criticality,) = burdenKernels.sumOverTiles(
+        tileCriticality, (np.zeros(SLR.shape),), numPopulations, tileSize, workers
+    )
+    return criticality
+
+
+def topFacilities(criticality: np.array, k: int):
+    """
+    Indices of the k facilities with the largest total (over services) increase,
+    largest first. Infinite increases (sole providers) come first.
+    """
+    total = np.sum(criticality, axis=1)
+    return np.argsort(-total, kind="stable")[: int(k)]
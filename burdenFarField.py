@@ -0,0 +1,271 @@
+"""
+Far-field (Barnes-Hut style) approximation of the burden calculation.
+
+Rural population groups can depend on many distant facilities, so a distance
+cutoff (see burdenSparse) is not always acceptable. Instead, the facilities are
+grouped into a spatial tree. For every tree node we keep the summed reduced
+service levels (SLR) of its facilities, and the node's center and radius.
+When a node is far enough from a population group, its whole contribution is
+    summed SLR / (ZDE + EPF * distance to the node's center)
+instead of one term per facility.
+
+Every facility of a node is within the node's radius r of its center, so its
+distance d from a population group at distance dc from the center satisfies
+dc - r <= d <= dc + r. Each facility's term is then off by a relative error of at
+most EPF*r / (ZDE + EPF*(dc - r)), and a node is only approximated when that is no
+more than the requested tolerance. All terms are positive, so the sums (and
+the burdens) are within that same relative tolerance of the exact ones.
+
+The shortcut needs ZDE and EPF to be the same for every facility of a node, so a
+separate tree is built for each distinct (ZDE, EPF) pair. These come from the
+sector to service table, so there are only as many trees as there are sectors.
+
+Distances to facilities and node centers come from
+burdenKernels.greatCircleDistances, as in the exact calculation; the tree itself
+(node centers and radii) is built from unit vectors. With a tolerance of 0 no node
+is approximated and the result matches the exact calculation to rounding.
+
+How much is saved depends on how clustered the facilities are and on how quickly
+EPF*distance outgrows ZDE: the bound above is a worst case, and the actual errors
+are usually orders of magnitude below the tolerance.
+"""
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+_FEET_PER_RADIAN = burdenKernels.EARTH_RADIUS_METERS * burdenKernels.METERS_TO_FEET
+
+
+def _chordsToFeet(chords: np.array):
+    return 2 * np.arcsin(np.minimum(chords * 0.5, 1.0)) * _FEET_PER_RADIAN
+
+
+def _rowNorms(vectors: np.array):
+    """
+    Euclidean length of each row of an (k,3) array: the chord between two unit
+    vectors, from their difference (which, unlike 2 - 2*dot, keeps its accuracy
+    for nearby points).
+    """
+    return np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+
+
+class PointTree:
+    """
+    Binary spatial tree over a set of points on the unit sphere (facilities, or
+    population groups), split at the median of the widest coordinate until at
+    most leafSize points are left.
+
+    Node information is kept in arrays indexed by node number; node 0 is the root.
+    The points of node i are self.order[self.start[i]:self.stop[i]], all within
+    self.radii[i] feet of self.centers[i].
+    """
+
+    def __init__(self, vectors: np.array, SLR: np.array, leafSize=32):
+        """
+        vectors: (m,3) unit vectors of the points
+        SLR: (m,s) values to sum over each node, e.g. the facilities' reduced
+            service levels
+        """
+        self.order = np.arange(vectors.shape[0])
+        centers, radii, SLRsums, children, starts, stops = [], [], [], [], [], []
+
+        stack = [(0, vectors.shape[0], -1, 0)]  # (start, stop, parent, which child)
+        while stack:
+            start, stop, parent, side = stack.pop()
+            node = len(starts)
+            if parent >= 0:
+                children[parent][side] = node
+
+            members = self.order[start:stop]
+            points = vectors[members]
+            center = points.sum(axis=0)
+            norm = np.sqrt(center @ center)
+            center = center / norm if norm > 0 else points[0]
+
+            centers.append(center)
+            radii.append(_chordsToFeet(_rowNorms(points - center)).max())
+            SLRsums.append(SLR[members].sum(axis=0))
+            children.append([-1, -1])
+            starts.append(start)
+            stops.append(stop)
+
+            if stop - start > leafSize:
+                axis = np.argmax(points.max(axis=0) - points.min(axis=0))
+                self.order[start:stop] = members[np.argsort(points[:, axis], kind="stable")]
+                middle = (start + stop) // 2
+                stack.append((middle, stop, node, 1))
+                stack.append((start, middle, node, 0))
+
+        self.centers = np.array(centers).reshape((-1, 3))
+        self.radii = np.array(radii)
+        self.SLRsums = np.array(SLRsums).reshape((len(starts), SLR.shape[1]))
+        self.children = np.array(children, dtype=np.int64).reshape((-1, 2))
+        self.start = np.array(starts, dtype=np.int64)
+        self.stop = np.array(stops, dtype=np.int64)
+
+    def isLeaf(self, nodes: np.array):
+        return self.children[nodes, 0] < 0
+
+    def leaves(self):
+        return np.flatnonzero(self.isLeaf(np.arange(self.start.shape[0])))
+
+
+def _expandRanges(starts: np.array, stops: np.array):
+    """
+    All indices in the ranges [starts[i], stops[i]), concatenated, without a python loop.
+    """
+    counts = stops - starts
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def _vectorsToDegrees(vectors: np.array):
+    """
+    Inverse of burdenKernels.unitVectors.
+
+    Returns:
+        (latitudes, longitudes) in degrees
+    """
+    latitudes = np.rad2deg(np.arcsin(np.clip(vectors[:, 2], -1.0, 1.0)))
+    longitudes = np.rad2deg(np.arctan2(vectors[:, 1], vectors[:, 0]))
+    return latitudes, longitudes
+
+
+def _interactionLists(tree, tileCenter, tileRadius, zde, epf, tolerance):
+    """
+    Walks a facility tree for one tile of population groups (all within tileRadius
+    feet of tileCenter), splitting the facilities into nodes that are far enough
+    away from every population group of the tile to be approximated, and the
+    remaining facilities, which are evaluated exactly.
+
+    A population group at distance d from a node's center gets the node's
+    contribution as summed SLR / (zde + epf*d). Each of the node's facilities is
+    within the node's radius r of the center, so this is off from that facility's
+    exact term by a relative error of at most epf*r / (zde + epf*d). Since
+    d >= (tile to node center distance) - tileRadius, requiring
+        epf*r <= tolerance * (zde + epf*(tile to node center distance - tileRadius))
+    keeps that error within the tolerance for the whole tile.
+
+    Returns:
+        (far node numbers, near facility indices into the tree's points)
+    """
+    far, nearStarts, nearStops = [], [], []
+    nodes = np.zeros(1, dtype=np.int64)
+    while nodes.shape[0]:
+        centerDistance = _chordsToFeet(_rowNorms(tree.centers[nodes] - tileCenter))
+        closest = np.maximum(centerDistance - tileRadius, 0)
+        farEnough = epf * tree.radii[nodes] <= tolerance * (zde + epf * closest)
+        far.append(nodes[farEnough])
+
+        leaf = ~farEnough & tree.isLeaf(nodes)
+        nearStarts.append(tree.start[nodes[leaf]])
+        nearStops.append(tree.stop[nodes[leaf]])
+
+        nodes = tree.children[nodes[~farEnough & ~leaf]].ravel()
+    near = tree.order[_expandRanges(np.concatenate(nearStarts), np.concatenate(nearStops))]
+    return np.concatenate(far), near
+
+
+def _summedBenefits(popLat, popLong, lat, long, zde, epf, SLR):
+    """
+    (t,s) sum over the given points of SLR / (zde + epf*distance), as in
+    burdenKernels.gemmBenefits (without the attainment factors).
+    """
+    distances = (
+        burdenKernels.greatCircleDistances(popLat, lat, popLong, long)
+        * burdenKernels.METERS_TO_FEET
+    )
+    return (1 / (zde + epf * distances)) @ SLR
+
+
+def farFieldBurden(
+    populationLatitudes: np.array,
+    populationLongitudes: np.array,
+    facilityLatitudes: np.array,
+    facilityLongitudes: np.array,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+    tolerance=1e-2,
+    tileSize=256,
+    leafSize=32,
+    workers=1,
+):
+    """
+    Burden with distant groups of facilities approximated as single points.
+
+    The population groups are split into spatially compact tiles (the leaves of
+    a tree over the population groups), and each tile walks each facility tree
+    once. The nearby facilities and the far away nodes of a tile are then each
+    evaluated as one dense (t,k)@(k,s) product.
+
+    Inputs:
+        populationLatitudes, populationLongitudes: (n,) degrees
+        facilityLatitudes, facilityLongitudes: (m,) degrees
+        zde, epf: (m,) zero distance effort and effort per foot
+        SLR: (m,s) reduced service levels (see burdenKernels.reducedServiceLevels)
+        attainFactors: (n,)
+        tolerance: maximum relative error of each benefit (and so of each burden).
+            0 evaluates every facility exactly.
+        tileSize: maximum number of population groups handled at once; bounds memory.
+        leafSize: maximum number of facilities in a tree leaf.
+        workers: number of threads the tiles are spread over (see
+            burdenKernels.forEachTile). Each tile only writes its own rows, so
+            results are the same for any number.
+
+    Returns:
+        (n,s) burden array
+    """
+    if tolerance < 0:
+        raise ValueError(f"The far field tolerance must not be negative, not {tolerance}.")
+    SLR = np.asarray(SLR, dtype=np.float64)
+    populationVectors = burdenKernels.unitVectors(populationLatitudes, populationLongitudes)
+    facilityVectors = burdenKernels.unitVectors(facilityLatitudes, facilityLongitudes)
+
+    # one tree per distinct (zde, epf) pair
+    efforts, groupCodes = np.unique(
+        np.stack([zde, epf], axis=1), axis=0, return_inverse=True
+    )
+    groupCodes = groupCodes.ravel()
+    trees = []
+    for code in range(efforts.shape[0]):
+        members = np.flatnonzero(groupCodes == code)
+        tree = PointTree(facilityVectors[members], SLR[members], leafSize)
+        trees.append((tree, members, efforts[code], _vectorsToDegrees(tree.centers)))
+
+    numPopulations = populationLatitudes.shape[0]
+    benefit = np.zeros((numPopulations, SLR.shape[1]))
+    if numPopulations == 0:
+        return benefit
+    tiles = PointTree(populationVectors, np.zeros((numPopulations, 0)), int(tileSize))
+    leaves = tiles.leaves()
+
+    def tileBenefits(leafRange):
+        for tile in leaves[leafRange]:
+            rows = tiles.order[tiles.start[tile]:tiles.stop[tile]]
+            popLat, popLong = populationLatitudes[rows], populationLongitudes[rows]
+            for tree, members, (groupZde, groupEpf), (centerLat, centerLong) in trees:
+                far, near = _interactionLists(
+                    tree, tiles.centers[tile], tiles.radii[tile], groupZde, groupEpf, tolerance
+                )
+                near = members[near]
+                benefit[rows] += _summedBenefits(
+                    popLat, popLong, facilityLatitudes[near], facilityLongitudes[near],
+                    groupZde, groupEpf, SLR[near],
+                ) + _summedBenefits(
+                    popLat, popLong, centerLat[far], centerLong[far],
+                    groupZde, groupEpf, tree.SLRsums[far],
+                )
+
+    # one spatial tile at a time; the tiles' rows are not contiguous, so the
+    # thread pool hands out ranges of leaves rather than of rows
+    burdenKernels.forEachTile(tileBenefits, leaves.shape[0], 1, workers)
+
+    with np.errstate(divide="ignore"):
+        return 1 / (attainFactors.reshape((-1, 1)) * benefit)
@@ -0,0 +1,110 @@
+"""
+Incremental burden updates for what-if work on single facilities.
+
+The burden of population group i for service k is
+    1 / (attainment[i] * sum over facilities j of SLR[j,k] / (ZDE[j] + EPF[j]*distance[i,j]))
+so each facility adds its own (n,s) term to the summed benefits. Keeping those
+sums around, adding, removing or changing one facility is one (n,s) update:
+subtract the facility's old term and add its new one. Nothing about the other
+facilities is touched.
+
+Repeated updates accumulate floating point rounding, and taking away the only
+facility that provides a service can leave a tiny positive or negative
+leftover instead of an exact 0 (which would make the burden infinite, as a full
+recalculation does). Sums that cancel down to a negligible fraction of what
+they were are therefore set to exactly 0.
+
+Nothing in here depends on QGIS.
+"""
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+# a sum that cancels to less than this fraction of its previous value is taken to be 0
+CANCELLATION_TOLERANCE = 1e-12
+
+
+def facilityBenefits(distances: np.array, zde: float, epf: float, SLR: np.array):
+    """
+    One facility's (n,s) term of the summed benefits (before attainment factors).
+
+    Inputs:
+        distances: (n,) distances in feet from every population group to the facility
+        zde, epf: the facility's zero distance effort and effort per foot
+        SLR: (s,) the facility's reduced service levels
+    """
+    return SLR.reshape((1, -1)) / (zde + epf * distances).reshape((-1, 1))
+
+
+def benefitSums(
+    distances: np.array,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    tileSize=None,
+    workers=1,
+):
+    """
+    (n,s) benefits summed over all facilities, before attainment factors, calculated
+    from scratch one tile of population groups at a time (see burdenKernels.gemmBenefits).
+    """
+    numPopulations = distances.shape[0]
+    sums = np.empty((numPopulations, SLR.shape[1]))
+    ones = np.ones(numPopulations)
+
+    def sumTile(rows):
+        sums[rows] = burdenKernels.gemmBenefits(distances[rows], zde, epf, SLR, ones[rows])
+
+    burdenKernels.forEachTile(sumTile, numPopulations, tileSize, workers)
+    return sums
+
+
+class IncrementalBenefits:
+    def __init__(self, sums: np.array):
+        """
+        Inputs:
+            sums: (n,s) benefits summed over the facilities, before attainment
+                factors (see benefitSums). Kept (and updated) as is.
+        """
+        self._sums = sums
+
+    def getBenefitSums(self):
+        return self._sums
+
+    def getBurden(self, attainFactors: np.array):
+        """
+        (n,s) burden from the current sums, with the (n,) attainment factors as
+        they are now (the sums do not depend on them).
+        """
+        with np.errstate(divide="ignore"):
+            return 1 / (np.reshape(attainFactors, (-1, 1)) * self._sums)
+
+    def update(self, removed=None, added=None):
+        """
+        Takes the (n,s) term removed out of the sums and puts the (n,s) term added in,
+        either of which can be None.
+        """
+        before = self._sums.copy() if removed is not None else None
+        if removed is not None:
+            self._sums -= removed
+        if added is not None:
+            self._sums += added
+        if before is not None:
+            cancelled = np.abs(self._sums) <= CANCELLATION_TOLERANCE * np.abs(before)
+            self._sums[cancelled] = 0.0
+
+    def relativeDifference(self, sums: np.array):
+        """
+        Largest relative difference between the current sums and the given (e.g.
+        recalculated from scratch) ones, ignoring entries that are 0 in both.
+        """
+        scale = np.maximum(np.abs(self._sums), np.abs(sums))
+        nonzero = scale > 0
+        if not nonzero.any():
+            return 0.0
+        return float(np.max(np.abs(self._sums - sums)[nonzero] / scale[nonzero]))
@@ -0,0 +1,484 @@
+"""
+Array kernels for the social burden calculation.
+
+Nothing in here depends on QGIS; everything takes and returns plain numpy arrays,
+so these functions can be tested (and reused) without a running QGIS instance.
+SBCalculator is responsible for gathering the inputs and holding on to the results.
+
+Throughout, let:
+    n be the number of population groups
+    m be the number of facilities
+    s be the number of services
+"""
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+METERS_TO_FEET = 3.28084
+EARTH_RADIUS_METERS = 6.3781e6
+
+
+def populationTiles(numPopulations: int, tileSize=None):
+    """
+    Yields slices that walk over the population groups in blocks of
+    (at most) tileSize rows. If tileSize is None, a single slice covering all
+    population groups is yielded, which reproduces the untiled calculation.
+    """
+    if tileSize is None:
+        tileSize = max(numPopulations, 1)
+    tileSize = int(tileSize)
+    if tileSize < 1:
+        raise ValueError(f"Population tile size must be a positive integer, not {tileSize}.")
+    for start in range(0, numPopulations, tileSize):
+        yield slice(start, min(start + tileSize, numPopulations))
+
+
+def forEachTile(tileFunction, numPopulations: int, tileSize=None, workers=1):
+    """
+    Calls tileFunction(rows) for every population tile (see populationTiles).
+
+    If workers is more than 1, the tiles are handed out to a thread pool of
+    that many threads. Numpy releases the GIL inside its ufuncs and BLAS calls,
+    so the tiles really do run side by side. tileFunction must only write to
+    its own rows of any shared output; since every tile then does exactly the
+    same arithmetic as it would on one thread, results do not depend on the
+    number of workers.
+
+    If tileSize is None and there is more than one worker, the population
+    groups are split evenly across the workers.
+
+    Note that a multithreaded BLAS underneath the workers can oversubscribe the
+    cores; limit its threads (e.g. OMP_NUM_THREADS) when using many workers.
+    """
+    workers = 1 if workers is None else int(workers)
+    if workers < 1:
+        raise ValueError(f"Number of workers must be a positive integer, not {workers}.")
+    if tileSize is None and workers > 1:
+        tileSize = max(-(-numPopulations // workers), 1)  # ceiling division
+
+    tiles = list(populationTiles(numPopulations, tileSize))
+    if workers == 1 or len(tiles) <= 1:
+        for rows in tiles:
+            tileFunction(rows)
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tiles))) as pool:
+            # list() so that any exception raised in a worker is raised here
+            list(pool.map(tileFunction, tiles))
+
+
+# number of partial sums sumOverTiles adds up; fixed so that the order of the
+# additions does not depend on the number of workers
+REDUCTION_CHUNKS = 64
+
+
+def sumOverTiles(tileFunction, zeros: tuple, numPopulations: int, tileSize=None, workers=1):
+    """
+    Sums tileFunction(rows), a tuple of arrays, over the population tiles (see
+    populationTiles), on a thread pool of workers threads (see forEachTile).
+
+    The population groups are split into REDUCTION_CHUNKS contiguous chunks,
+    whatever the number of workers. Each chunk adds up its own tiles in order,
+    and then the chunks are added in order, so the sums are bit-for-bit the same
+    for any number of workers.
+
+    Inputs:
+        tileFunction: called with a slice of population groups
+        zeros: tuple of zero arrays (or 0s) of the shapes tileFunction returns;
+            also the result if there are no population groups
+
+    Returns:
+        tuple of sums
+    """
+    chunkSize = max(-(-numPopulations // REDUCTION_CHUNKS), 1)  # ceiling division
+    partials = [zeros] * len(range(0, numPopulations, chunkSize))
+
+    def chunkSum(chunk):
+        total = zeros
+        for rows in populationTiles(chunk.stop - chunk.start, tileSize):
+            rows = slice(chunk.start + rows.start, chunk.start + rows.stop)
+            total = tuple(i + j for i, j in zip(total, tileFunction(rows)))
+        partials[chunk.start // chunkSize] = total
+
+    forEachTile(chunkSum, numPopulations, chunkSize, workers)
+    total = zeros
+    for partial in partials:
+        total = tuple(i + j for i, j in zip(total, partial))
+    return total
+
+
+def blockedDistances(
+    distanceFunction,
+    lat1: np.array,
+    lat2: np.array,
+    long1: np.array,
+    long2: np.array,
+    tileSize=None,
+    workers=1,
+    out=None,
+):
+    """
+    Fills the (n,m) pairwise distance matrix one block of population groups at a
+    time, optionally on several threads (see forEachTile).
+
+    Inputs:
+        distanceFunction: called as distanceFunction(lat1, lat2, long1, long2) on
+            a block of population groups and all facilities; returns (t,m) distances.
+        lat1, long1: (n,) population coordinates
+        lat2, long2: (m,) facility coordinates
+        out: optional preallocated (n,m) array
+
+    Returns:
+        (n,m) array of whatever distanceFunction returns
+    """
+    if out is None:
+        out = np.empty((lat1.shape[0], lat2.shape[0]))
+
+    def distanceTile(rows):
+        out[rows] = distanceFunction(lat1[rows], lat2, long1[rows], long2)
+
+    forEachTile(distanceTile, lat1.shape[0], tileSize, workers)
+    return out
+
+
+def greatCircleDistances(lat1: np.array, lat2: np.array, long1: np.array, long2: np.array):
+    """
+    Array-based version of latlong great circle distance calculation.
+    In meters. See SBCalculator.calculatePairwiseDistances.
+
+    Inputs:
+        lat1, long1: (n,) coordinates of the 1st set of points, in degrees
+        lat2, long2: (m,) coordinates of the 2nd set of points, in degrees
+
+    Returns:
+        (n,m) array of pairwise distances, in meters
+    """
+    radlatdiff = np.deg2rad(
+        lat1.reshape(lat1.shape[0], 1) - lat2.reshape(lat2.shape[0], 1).T
+    )  # of shape (n,m)
+    radlatsum = np.deg2rad(
+        lat1.reshape(lat1.shape[0], 1) + lat2.reshape(lat2.shape[0], 1).T
+    )  # of shape(n,m)
+    radlongdiff = np.deg2rad(
+        long1.reshape(long1.shape[0], 1) - long2.reshape(long2.shape[0], 1).T
+    )  # of shape (n,m)
+    sinsquaredlatdiff = np.power(np.sin(radlatdiff * 0.5), 2)  # (n,m)
+    sinsquaredlatsum = np.power(np.sin(radlatsum * 0.5), 2)  # (n,m)
+    sinsquaredlongdiff = np.power(np.sin(radlongdiff * 0.5), 2)  # (n,m)
+    res = (
+        2
+        * np.arcsin(
+            np.sqrt(
+                sinsquaredlatdiff
+                + (1 - sinsquaredlatdiff - sinsquaredlatsum) * sinsquaredlongdiff
+            )
+        )
+        * EARTH_RADIUS_METERS
+    )  # had better be (n,m)
+    return res
+
+
+def unitVectors(latitudes: np.array, longitudes: np.array):
+    """
+    Converts latitudes and longitudes (degrees) to points on the unit sphere.
+
+    Returns:
+        (n,3) array of x, y, z
+    """
+    radlat = np.deg2rad(latitudes)
+    radlong = np.deg2rad(longitudes)
+    coslat = np.cos(radlat)
+    return np.stack(
+        [coslat * np.cos(radlong), coslat * np.sin(radlong), np.sin(radlat)], axis=1
+    )
+
+
+def unitVectorFeetDistances(
+    lat1: np.array, lat2: np.array, long1: np.array, long2: np.array
+):
+    """
+    Great circle distances from the dot products of unit vectors, in feet.
+
+    The points are converted to unit vectors (O(n+m) trig), so the pairwise step is
+    one (n,3)@(3,m) matrix product, and the chord to arc conversion
+        distance = 2 * radius * arcsin(|p - q| / 2), with |p - q|^2 = 2 - 2 p.q
+    is the only per-pair transcendental. The meters to feet conversion is folded
+    into the radius. Apart from the product, everything is done in place on the
+    one (n,m) array.
+
+    Accuracy: the same formula as greatCircleDistances, but 2 - 2 p.q loses
+    digits to cancellation for nearby points. Against greatCircleDistances, the
+    largest differences (seen over many random pairs in the continental US) are
+        about 10 cm for points 10 cm apart,
+        about 1 cm at 1 m,
+        about 0.1 mm at 100 m,
+        about 0.01 mm at 1 km and beyond.
+    Multiplied by an effort per foot, these are far below anything that shows in
+    the burden.
+
+    Inputs:
+        lat1, long1: (n,) coordinates of the 1st set of points, in degrees
+        lat2, long2: (m,) coordinates of the 2nd set of points, in degrees
+
+    Returns:
+        (n,m) array of pairwise distances, in feet
+    """
+    res = unitVectors(lat1, long1) @ unitVectors(lat2, long2).T  # (n,m) dot products
+    res *= -2
+    res += 2
+    np.maximum(res, 0, out=res)  # rounding can take 2 - 2 p.q just below 0
+    np.sqrt(res, out=res)
+    res *= 0.5
+    np.arcsin(res, out=res)
+    res *= 2 * EARTH_RADIUS_METERS * METERS_TO_FEET
+    return res
+
+
+def haversineFeetDistances(
+    lat1: np.array, lat2: np.array, long1: np.array, long2: np.array
+):
+    """
+    greatCircleDistances, in feet.
+    """
+    return greatCircleDistances(lat1, lat2, long1, long2) * METERS_TO_FEET
+
+
+def planarFeetDistances(
+    y1: np.array, y2: np.array, x1: np.array, x2: np.array, feetPerUnit=1.0
+):
+    """
+    Euclidean distances between points in a projected (planar) coordinate system,
+    in feet. Takes the same argument order as the lat/long kernels, with northings
+    in place of latitudes and eastings in place of longitudes.
+
+    Uses |p - q|^2 = |p|^2 + |q|^2 - 2 p.q, so the pairwise step is one
+    (n,2)@(2,m) matrix product and there is no trig at all. State plane coordinates
+    are large numbers (millions of feet), so both sets of points are first shifted
+    by the mean of the 2nd set, which keeps the cancellation in that expansion small.
+    The shift only depends on the 2nd set, so tiles of the 1st set all get the same one.
+
+    Inputs:
+        y1, x1: (n,) coordinates of the 1st set of points, in map units
+        y2, x2: (m,) coordinates of the 2nd set of points, in map units
+        feetPerUnit: length of one map unit, in feet
+
+    Returns:
+        (n,m) array of pairwise distances, in feet
+    """
+    yOffset = y2.mean() if y2.shape[0] else 0.0
+    xOffset = x2.mean() if x2.shape[0] else 0.0
+    p = np.stack([y1 - yOffset, x1 - xOffset], axis=1)  # (n,2)
+    q = np.stack([y2 - yOffset, x2 - xOffset], axis=1)  # (m,2)
+
+    res = p @ q.T  # (n,m)
+    res *= -2
+    res += np.einsum("ij,ij->i", p, p).reshape((-1, 1))
+    res += np.einsum("ij,ij->i", q, q)
+    np.maximum(res, 0, out=res)  # rounding can take nearby pairs just below 0
+    np.sqrt(res, out=res)
+    res *= feetPerUnit
+    return res
+
+
+# the pairwise distance (in feet) kernels SBCalculator can choose between, by name.
+# "planar" is for projected coordinates; the others expect latitudes and longitudes.
+DISTANCE_KERNELS = {
+    "haversine": haversineFeetDistances,
+    "unitVector": unitVectorFeetDistances,
+    "planar": planarFeetDistances,
+}
+
+
+def reducedServiceLevels(SLReduce: np.array, serviceLevels: np.array):
+    """
+    Service levels after the service level reduction has been applied, i.e.
+    service level * (1 - reduction/100).
+
+    Inputs:
+        SLReduce: (m,) array of percent reductions (0-100)
+        serviceLevels: (m,s) array of service levels
+
+    Returns:
+        (m,s) array. This is called SLR in the comments below.
+    """
+    # why multiply by 0.01 instead of dividing by 100? Because division is expensive.
+    return (1 - SLReduce * 1e-2).reshape((-1, 1)) * serviceLevels
+
+
+def populationWeights(attainFactors: np.array, population: np.array):
+    """
+    (n,) population divided by attainment factor, the weight of a group's summed
+    benefits in the population-weighted burden. Groups with an attainment factor
+    of 0 have infinite burden whatever the facilities do, and count for 0.
+    """
+    weight = np.zeros(population.shape[0])
+    attained = attainFactors != 0
+    weight[attained] = population[attained] / attainFactors[attained]
+    return weight
+
+
+def perFacilityBenefits(
+    distances: np.array,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+):
+    """
+    Per-person benefits from each facility/population pairing for each service type.
+    That is, service level * (1- reduction/100) * attainment factor, all divided by
+    zero distance effort + (distance in feet * effort per foot).
+
+    Inputs:
+        distances: (t,m) distances in feet, for some block of t population groups
+        zde: (m,) zero distance effort
+        epf: (m,) effort per foot
+        SLR: (m,s) reduced service levels (see reducedServiceLevels)
+        attainFactors: (t,) attainment factors for the same t population groups
+
+    Returns:
+        (t,m,s) array of per-capita, per-facility, per-service benefits.
+        Note that this is t*m*s in size; callers should keep t small.
+    """
+    # Starting with the denominator:
+    # We broadcast-multiply effort per foot and the distance in feet matrix, so that
+    # each population group's effort in traveling the given distance to the m facilities is now known.
+    # We broadcast-add the zero-distance efforts (which cover each facility) over all those
+    # population groups. Our denominator is (t,m).
+    denominator = zde + epf * distances
+
+    # In the numerator, SLR is (m,s). Due to numpy broadcasting rules, to result in an
+    # array of shape (t,m,s), it is easiest to first transpose SLR (to (s,m)), then
+    # broadcast-multiply the result by the attainment factors, and then transpose the
+    # ultimate result. This yields an array of shape (t,m,s), which can be safely divided by our
+    # denominator (t,m).
+    SLR = SLR.transpose()
+    numerator = (SLR.reshape((SLR.shape[0], SLR.shape[1], 1)) * attainFactors).transpose()
+
+    return numerator / (denominator.reshape((denominator.shape[0], denominator.shape[1], 1)))
+
+
+def broadcastBenefits(
+    distances: np.array,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+):
+    """
+    Per-capita benefits summed over the facilities, by building the (t,m,s)
+    per-facility benefits and reducing them over the facilities.
+
+    Returns:
+        (t,s) array of benefits
+    """
+    return np.sum(perFacilityBenefits(distances, zde, epf, SLR, attainFactors), axis=1)
+
+
+def gemmBenefits(
+    distances: np.array,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+):
+    """
+    Per-capita benefits summed over the facilities, as a matrix product.
+
+    The benefit separates as
+        attainment[t] * sum over m of (1/denominator[t,m]) * SLR[m,s]
+    so the reduction over the facilities is a single (t,m)@(m,s) product, which
+    BLAS can do multithreaded without ever building the (t,m,s) array.
+
+    The multiplication by the attainment factor happens after the sum rather
+    than before, so results differ from broadcastBenefits by floating point
+    rounding only (relative differences on the order of 1e-15 per facility summed).
+
+    Returns:
+        (t,s) array of benefits
+    """
+    reciprocal_denominator = 1 / (zde + epf * distances)  # (t,m)
+    return attainFactors.reshape((-1, 1)) * (reciprocal_denominator @ SLR)
+
+
+# the kernels SBCalculator can choose between, by name
+BENEFIT_KERNELS = {
+    "broadcast": broadcastBenefits,
+    "gemm": gemmBenefits,
+}
+
+
+def blockedBurden(
+    distances: np.array,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+    tileSize=None,
+    out=None,
+    facilityBenefitsOut=None,
+    kernel="broadcast",
+    workers=1,
+):
+    """
+    Calculates the (n,s) burden array one block of population groups at a time.
+
+    Within each block of (at most) tileSize population groups the benefits are
+    reduced over the facilities and inverted straight into the output array, so the
+    largest temporary is (tileSize,m,s) (or (tileSize,m) for the gemm kernel)
+    rather than (n,m,s).
+
+    Each population group's reduction over the facilities is the same sequence of
+    operations whatever block it lands in, so for the broadcast kernel the result is
+    identical (bit-for-bit) to the untiled calculation for any tile size and any
+    number of workers.
+
+    Inputs:
+        distances: (n,m) distances in feet
+        zde, epf: (m,) zero distance effort and effort per foot
+        SLR: (m,s) reduced service levels
+        attainFactors: (n,)
+        tileSize: number of population groups per block. None means one block.
+        out: optional preallocated (n,s) array to write the burdens into.
+        facilityBenefitsOut: optional preallocated (n,m,s) array. If given, the
+            per-facility benefits are also written into it (this is the
+            memory-expensive researcher option; see SBCalculator). Only the
+            broadcast kernel builds those benefits, so this requires it.
+        kernel: name of the benefit kernel, a key of BENEFIT_KERNELS.
+        workers: number of threads to spread the tiles over (see forEachTile).
+
+    Returns:
+        (n,s) burden array
+    """
+    try:
+        benefitKernel = BENEFIT_KERNELS[kernel]
+    except KeyError:
+        raise ValueError(
+            f"Unknown benefit kernel {kernel}; options are {list(BENEFIT_KERNELS)}."
+        )
+    if facilityBenefitsOut is not None and kernel != "broadcast":
+        raise ValueError(
+            "Per-facility benefits are only available from the broadcast kernel."
+        )
+
+    numPopulations = distances.shape[0]
+    if out is None:
+        out = np.empty((numPopulations, SLR.shape[1]))
+
+    def burdenTile(rows):
+        if facilityBenefitsOut is not None:
+            per_capita_per_facility_benefit_arr = perFacilityBenefits(
+                distances[rows], zde, epf, SLR, attainFactors[rows]
+            )
+            facilityBenefitsOut[rows] = per_capita_per_facility_benefit_arr
+            benefit_arr = np.sum(per_capita_per_facility_benefit_arr, axis=1)
+        else:
+            benefit_arr = benefitKernel(
+                distances[rows], zde, epf, SLR, attainFactors[rows]
+            )
+
+        # invert to find partial burdens.
+        out[rows] = 1 / benefit_arr
+
+    forEachTile(burdenTile, numPopulations, tileSize, workers)
+    return out
@@ -0,0 +1,376 @@
+"""
+Monte Carlo uncertainty in the burden.
+
+Service levels, zero distance effort (ZDE), effort per foot (EPF) and attainment
+factors are expert estimates. Here they are drawn, many times, from distributions
+around their usual values, and the burden is calculated for every draw. The
+distances do not change between draws, so they are read once per batch of draws:
+each tile of population groups gets its (t,m) distances once, and then
+    - if ZDE and EPF are fixed, one (t,m)@(m, draws*s) product against every draw's
+      service levels (as in burdenScenarios), or
+    - if they vary, a (draws,t,m)@(draws,m,s) batched product.
+
+The draws are summarised as they come in, by streaming accumulators whose memory
+does not grow with the number of draws: Welford's running mean and variance, and
+P-squared quantile estimates (Jain & Chlamtac, 1985), each kept for every
+population group and service, and for the population-weighted totals.
+
+Uncertain inputs are given as specs of multiplicative noise around the usual value:
+    ("normal", sd): 1 + sd * standard normal, cut off at 0
+    ("uniform", low, high): uniform between low and high
+    ("triangular", low, mode, high): triangular
+    ("lognormal", sigma): lognormal with mean 1 and log standard deviation sigma
+Facility inputs are drawn once per facility group (e.g. sector, since the
+sector to service table is where they come from), so that all facilities of a
+sector move together; attainment factors are drawn per population group.
+
+Nothing in here depends on QGIS.
+"""
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+def _normalFactors(rng, shape, sd):
+    return np.maximum(1 + sd * rng.standard_normal(shape), 0)
+
+
+def _uniformFactors(rng, shape, low, high):
+    return rng.uniform(low, high, shape)
+
+
+def _triangularFactors(rng, shape, low, mode, high):
+    return rng.triangular(low, mode, high, shape)
+
+
+def _lognormalFactors(rng, shape, sigma):
+    return rng.lognormal(-0.5 * sigma**2, sigma, shape)
+
+
+# name: (function(rng, shape, *parameters), number of parameters)
+FACTOR_DISTRIBUTIONS = {
+    "normal": (_normalFactors, 1),
+    "uniform": (_uniformFactors, 2),
+    "triangular": (_triangularFactors, 3),
+    "lognormal": (_lognormalFactors, 1),
+}
+
+# inputs that can be uncertain
+UNCERTAIN_INPUTS = ["serviceLevels", "zde", "epf", "attainFactors"]
+
+
+def checkSpecs(specs: dict):
+    """
+    Raises ValueError unless specs maps input names (see UNCERTAIN_INPUTS) to
+    valid distribution specs (see the module docstring).
+    """
+    for name, spec in specs.items():
+        if name not in UNCERTAIN_INPUTS:
+            raise ValueError(f"Unknown uncertain input {name}; options are {UNCERTAIN_INPUTS}.")
+        if not isinstance(spec, (tuple, list)) or not spec or spec[0] not in FACTOR_DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown distribution {spec} for {name}; options are "
+                f"{list(FACTOR_DISTRIBUTIONS.keys())}."
+            )
+        if len(spec) - 1 != FACTOR_DISTRIBUTIONS[spec[0]][1]:
+            raise ValueError(
+                f"The {spec[0]} distribution takes {FACTOR_DISTRIBUTIONS[spec[0]][1]} "
+                f"parameters, not {len(spec) - 1}."
+            )
+
+
+def sampleFactors(rng, spec, shape):
+    """
+    Multiplicative factors of the given shape, drawn from spec; ones if spec is None.
+    """
+    if spec is None:
+        return np.ones(shape)
+    function, _ = FACTOR_DISTRIBUTIONS[spec[0]]
+    return function(rng, shape, *spec[1:])
+
+
+class StreamingMoments:
+    def __init__(self, shape):
+        """
+        Running mean and variance (Welford's algorithm) of every entry of arrays of
+        the given shape. Infinite values (e.g. the burden of a population group with
+        no provider) are counted separately, and left out of the mean and variance.
+        """
+        self._count = 0
+        self._finiteCount = np.zeros(shape)
+        self._mean = np.zeros(shape)
+        self._M2 = np.zeros(shape)
+
+    def update(self, x: np.array):
+        self._count += 1
+        finite = np.isfinite(x)
+        self._finiteCount += finite
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = np.where(finite, x - self._mean, 0)
+            self._mean += np.where(finite, delta / self._finiteCount, 0)
+            self._M2 += np.where(finite, delta * (x - self._mean), 0)
+
+    def getCount(self):
+        return self._count
+
+    def getInfiniteFraction(self):
+        """
+        Fraction of the draws that were infinite, per entry.
+        """
+        if self._count == 0:
+            return np.zeros(self._mean.shape)
+        return 1 - self._finiteCount / self._count
+
+    def getMean(self):
+        """
+        Mean of the finite draws, per entry (NaN if there were none).
+        """
+        return np.where(self._finiteCount > 0, self._mean, np.nan)
+
+    def getVariance(self):
+        """
+        Sample variance of the finite draws, per entry (NaN if there were fewer than two).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self._finiteCount > 1, self._M2 / (self._finiteCount - 1), np.nan)
+
+    def getStd(self):
+        return np.sqrt(self.getVariance())
+
+
+class StreamingQuantiles:
+    def __init__(self, shape, quantiles=(0.05, 0.5, 0.95)):
+        """
+        P-squared estimates of the given quantiles (fractions between 0 and 1) of
+        every entry of arrays of the given shape. Each quantile of each entry keeps
+        five markers, so memory is 5 * (number of quantiles) * (number of entries)
+        doubles, however many values come in.
+        """
+        self._quantiles = np.asarray(quantiles, dtype=np.float64)
+        self._shape = tuple(int(size) for size in np.atleast_1d(shape))
+        self._count = 0
+        numEntries = int(np.prod(self._shape))
+        numQuantiles = self._quantiles.shape[0]
+        self._heights = np.empty((numQuantiles, 5, numEntries))
+        self._positions = np.tile(np.arange(5.0).reshape((1, 5, 1)), (numQuantiles, 1, numEntries))
+        p = self._quantiles.reshape((-1, 1))
+        # desired marker positions (0-based) and their increments; the same for every entry
+        self._desired = np.hstack([np.zeros_like(p), 2 * p, 4 * p, 2 + 2 * p, 4 * np.ones_like(p)])
+        self._increments = np.hstack([np.zeros_like(p), p / 2, p, (1 + p) / 2, np.ones_like(p)])
+
+    def update(self, x: np.array):
+        x = np.asarray(x, dtype=np.float64).reshape((1, -1))
+        heights, positions = self._heights, self._positions
+        if self._count < 5:
+            heights[:, self._count, :] = x
+            self._count += 1
+            if self._count == 5:
+                heights.sort(axis=1)
+            return
+        self._count += 1
+
+        # extend the outer markers, and find the cell x falls in (0 to 3)
+        np.minimum(heights[:, 0, :], x, out=heights[:, 0, :])
+        np.maximum(heights[:, 4, :], x, out=heights[:, 4, :])
+        cell = np.clip(np.sum(heights[:, 1:4, :] <= x[:, None, :], axis=1), 0, 3)
+        # markers above the cell move up one position
+        positions[:, 1:, :] += np.arange(1, 5).reshape((1, 4, 1)) > cell[:, None, :]
+        self._desired += self._increments
+
+        for i in range(1, 4):
+            offset = self._desired[:, i : i + 1] - positions[:, i, :]
+            up = (offset >= 1) & (positions[:, i + 1, :] - positions[:, i, :] > 1)
+            down = (offset <= -1) & (positions[:, i - 1, :] - positions[:, i, :] < -1)
+            move = up | down
+            if not move.any():
+                continue
+            d = np.where(up, 1.0, -1.0)
+            q, qBelow, qAbove = heights[:, i, :], heights[:, i - 1, :], heights[:, i + 1, :]
+            n, nBelow, nAbove = positions[:, i, :], positions[:, i - 1, :], positions[:, i + 1, :]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                parabolic = q + d / (nAbove - nBelow) * (
+                    (n - nBelow + d) * (qAbove - q) / (nAbove - n)
+                    + (nAbove - n - d) * (q - qBelow) / (n - nBelow)
+                )
+                neighbour = np.where(up, qAbove, qBelow)
+                linear = q + d * (neighbour - q) / (np.where(up, nAbove, nBelow) - n)
+            adjusted = np.where((qBelow < parabolic) & (parabolic < qAbove), parabolic, linear)
+            # infinite values (population groups with no provider) give NaN; keep the height
+            adjusted = np.where(np.isnan(adjusted), q, adjusted)
+            heights[:, i, :] = np.where(move, adjusted, q)
+            positions[:, i, :] += np.where(move, d, 0)
+
+    def getCount(self):
+        return self._count
+
+    def getQuantiles(self):
+        """
+        (number of quantiles, *shape) array of the estimates; exact while fewer than
+        five values have come in (NaN if none have).
+        """
+        out_shape = (self._quantiles.shape[0],) + self._shape
+        if self._count == 0:
+            return np.full(out_shape, np.nan)
+        if self._count < 5:
+            sample = self._heights[0, : self._count, :]
+            return np.quantile(sample, self._quantiles, axis=0).reshape(out_shape)
+        return self._heights[:, 2, :].reshape(out_shape)
+
+
+class BurdenDistributions:
+    def __init__(self, numPopulations: int, numServices: int, quantiles=(0.05, 0.5, 0.95)):
+        """
+        Streaming summary of Monte Carlo burdens: per population group and service,
+        and population-weighted totals (summed over population groups) per service.
+        """
+        self._quantiles = tuple(quantiles)
+        self._populationMoments = StreamingMoments((numPopulations, numServices))
+        self._populationQuantiles = StreamingQuantiles((numPopulations, numServices), quantiles)
+        # per service, and over all services in the last entry
+        self._aggregateMoments = StreamingMoments((numServices + 1,))
+        self._aggregateQuantiles = StreamingQuantiles((numServices + 1,), quantiles)
+
+    def update(self, burden: np.array, population: np.array):
+        """
+        Adds one draw's (n,s) burden.
+        """
+        self._populationMoments.update(burden)
+        self._populationQuantiles.update(burden)
+        aggregate = population @ burden
+        aggregate = np.append(aggregate, np.sum(aggregate))
+        self._aggregateMoments.update(aggregate)
+        self._aggregateQuantiles.update(aggregate)
+
+    def getNumDraws(self):
+        return self._populationMoments.getCount()
+
+    def getQuantileLevels(self):
+        return self._quantiles
+
+    def getPopulationMoments(self):
+        """
+        StreamingMoments of the (n,s) burdens.
+        """
+        return self._populationMoments
+
+    def getPopulationQuantiles(self):
+        """
+        (number of quantiles, n, s) array of burden quantile estimates.
+        """
+        return self._populationQuantiles.getQuantiles()
+
+    def getAggregateMoments(self):
+        """
+        StreamingMoments of the (s+1,) population-weighted totals: one per service
+        (as SBCalculator.getAggregatedWeightedBurden), then the total over services
+        (as getAggregatedWeightedTotalBurden).
+        """
+        return self._aggregateMoments
+
+    def getAggregateQuantiles(self):
+        """
+        (number of quantiles, s+1) array of quantile estimates of the totals.
+        """
+        return self._aggregateQuantiles.getQuantiles()
+
+
+def _drawBatch(rng, specs, numDraws, serviceLevels, zde, epf, attainFactors, facilityGroups):
+    """
+    One batch of numDraws drawn inputs; zde and epf are None if they are not uncertain.
+    """
+    numGroups = int(facilityGroups.max()) + 1 if facilityGroups.shape[0] else 0
+    numServices = serviceLevels.shape[1]
+
+    factors = sampleFactors(rng, specs.get("serviceLevels"), (numDraws, numGroups, numServices))
+    drawnLevels = serviceLevels * factors[:, facilityGroups, :]  # (K,m,s)
+    drawnZde, drawnEpf = None, None
+    if "zde" in specs or "epf" in specs:
+        drawnZde = zde * sampleFactors(rng, specs.get("zde"), (numDraws, numGroups))[:, facilityGroups]
+        drawnEpf = epf * sampleFactors(rng, specs.get("epf"), (numDraws, numGroups))[:, facilityGroups]
+    drawnAttain = attainFactors * sampleFactors(
+        rng, specs.get("attainFactors"), (numDraws, attainFactors.shape[0])
+    )
+    return drawnLevels, drawnZde, drawnEpf, drawnAttain
+
+
+def monteCarloBurden(
+    distanceTile,
+    numPopulations: int,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+    population: np.array,
+    specs: dict,
+    numDraws: int,
+    facilityGroups=None,
+    batchSize=8,
+    quantiles=(0.05, 0.5, 0.95),
+    seed=None,
+    tileSize=256,
+    workers=1,
+):
+    """
+    Monte Carlo burden distributions.
+
+    Inputs:
+        distanceTile: called with a slice of population groups, returns their (t,m)
+            distances in feet
+        numPopulations: n
+        zde, epf: (m,) usual zero distance effort and effort per foot
+        SLR: (m,s) usual reduced service levels
+        attainFactors, population: (n,)
+        specs: dict from input name ("serviceLevels", "zde", "epf", "attainFactors")
+            to its distribution spec (see the module docstring). Inputs that are
+            not in it are fixed.
+        numDraws: number of draws
+        facilityGroups: (m,) integer group of each facility (e.g. sector index);
+            facility inputs are drawn once per group. None draws them per facility.
+        batchSize: number of draws calculated together. Peak memory is about
+            batchSize * n * s doubles, plus batchSize * tileSize * m if ZDE or EPF vary.
+        quantiles: quantile levels (fractions between 0 and 1) to estimate
+        seed: seed for numpy's random generator. Runs with the same seed and batch
+            size give the same draws.
+        tileSize, workers: population groups per block, and threads
+
+    Returns:
+        BurdenDistributions
+    """
+    checkSpecs(specs)
+    if int(batchSize) < 1:
+        raise ValueError(f"Batch size must be a positive integer, not {batchSize}.")
+    numFacilities, numServices = SLR.shape
+    if facilityGroups is None:
+        facilityGroups = np.arange(numFacilities)
+    facilityGroups = np.asarray(facilityGroups, dtype=int)
+    rng = np.random.default_rng(seed)
+    summary = BurdenDistributions(numPopulations, numServices, quantiles)
+
+    for batch in burdenKernels.populationTiles(int(numDraws), int(batchSize)):
+        K = batch.stop - batch.start
+        drawnLevels, drawnZde, drawnEpf, drawnAttain = _drawBatch(
+            rng, specs, K, SLR, zde, epf, attainFactors, facilityGroups
+        )
+        benefits = np.empty((K, numPopulations, numServices))
+
+        def benefitTile(rows):
+            distances = distanceTile(rows)  # read once for the whole batch
+            if drawnZde is None:
+                reciprocal = 1 / (zde + epf * distances)  # (t,m)
+                tile = reciprocal @ drawnLevels.transpose((1, 0, 2)).reshape((numFacilities, K * numServices))
+                benefits[:, rows, :] = tile.reshape((-1, K, numServices)).transpose((1, 0, 2))
+            else:
+                reciprocal = 1 / (drawnZde[:, None, :] + drawnEpf[:, None, :] * distances)  # (K,t,m)
+                benefits[:, rows, :] = np.matmul(reciprocal, drawnLevels)
+
+        burdenKernels.forEachTile(benefitTile, numPopulations, tileSize, workers)
+        with np.errstate(divide="ignore"):
+            burdens = 1 / (drawnAttain[:, :, None] * benefits)
+        for draw in range(K):
+            summary.update(burdens[draw], population)
+
+    return summary
@@ -0,0 +1,233 @@
+"""
+Process-pool backend for the social burden calculation.
+
+For very large runs (national facility inventories against census blocks) a lot
+of the time goes to elementwise trig in the distance calculation, which does not
+get much help from threads. This module spreads disjoint shards of population
+groups over worker processes instead.
+
+All the inputs (coordinates, zero distance effort, effort per foot, reduced
+service levels and attainment factors) and the (n,s) burden result are put into
+shared memory once, before the workers start. Each worker attaches to them when
+it starts up, so a task is only a (start, stop) pair of population rows: nothing
+big is pickled per task, and no inputs are copied. Each worker computes the
+distances of its shard and writes its burdens straight into the shared result.
+
+Nothing in here depends on QGIS, so processPoolBurden can be called from a plain
+python script as well as from the plugin.
+"""
+
+import os
+import sys
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+# arrays attached to shared memory in a worker process, by name.
+# Filled in once per process by _attachSharedArrays.
+_workerArrays = {}
+_workerSharedMemory = []
+_workerSettings = {}
+
+
+def _shareArray(arr: np.array):
+    """
+    Copies arr into a new shared memory block.
+
+    Returns:
+        (the SharedMemory object, (block name, shape, dtype string)) - the latter is what
+        gets sent to the workers.
+    """
+    arr = np.ascontiguousarray(arr, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def _attachSharedArrays(descriptors: dict, settings: dict):
+    """
+    Worker process initializer: attaches to the shared memory blocks
+    described in descriptors and keeps numpy views of them.
+    """
+    for name, (shmName, shape, dtype) in descriptors.items():
+        # the parent process owns (and unlinks) these blocks. Spawned workers share
+        # the parent's resource tracker, so attaching only re-registers a block the
+        # tracker already knows about; from python 3.13 on we can skip even that.
+        try:
+            shm = shared_memory.SharedMemory(name=shmName, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=shmName)
+        _workerSharedMemory.append(shm)
+        _workerArrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _workerSettings.update(settings)
+
+
+def _burdenShard(rows: tuple):
+    """
+    Worker task: calculates the burden of population rows [start, stop) into the
+    shared result, working through the shard in tiles.
+    """
+    start, stop = rows
+    a = _workerArrays
+    benefitKernel = burdenKernels.BENEFIT_KERNELS[_workerSettings["kernel"]]
+    distanceKernel = burdenKernels.DISTANCE_KERNELS[_workerSettings["distanceKernel"]]
+    distanceOptions = _workerSettings["distanceOptions"]
+
+    for tile in burdenKernels.populationTiles(stop - start, _workerSettings["tileSize"]):
+        tile = slice(start + tile.start, start + tile.stop)
+        distances = distanceKernel(
+            a["populationLatitudes"][tile],
+            a["facilityLatitudes"],
+            a["populationLongitudes"][tile],
+            a["facilityLongitudes"],
+            **distanceOptions,
+        )
+        a["burden"][tile] = 1 / benefitKernel(
+            distances, a["zde"], a["epf"], a["SLR"], a["attainFactors"][tile]
+        )
+    return rows
+
+
+def _pythonExecutable():
+    """
+    The python interpreter to start worker processes with.
+
+    Inside QGIS, sys.executable can be the QGIS application itself rather than
+    python, in which case a python interpreter next to the QGIS python install is used.
+    """
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    for folder in [sys.exec_prefix, os.path.join(sys.exec_prefix, "bin")]:
+        for name in ["python.exe", "python3", "python"]:
+            candidate = os.path.join(folder, name)
+            if os.path.isfile(candidate):
+                return candidate
+    return sys.executable
+
+
+def _processContext():
+    """
+    Spawn (rather than fork) context, so the workers do not inherit a copy of
+    whatever the parent has in memory (e.g. all of QGIS).
+    """
+    ctx = multiprocessing.get_context("spawn")
+    ctx.set_executable(_pythonExecutable())
+    return ctx
+
+
+def _shards(numPopulations: int, workers: int, tileSize=None):
+    """
+    Splits the population groups into contiguous (start, stop) shards: a few per
+    worker, so a slow shard does not hold the others up.
+    """
+    shardSize = max(-(-numPopulations // (4 * workers)), 1)  # ceiling division
+    if tileSize is not None:
+        shardSize = max(shardSize, int(tileSize))
+    return [
+        (i.start, i.stop) for i in burdenKernels.populationTiles(numPopulations, shardSize)
+    ]
+
+
+def processPoolBurden(
+    populationLatitudes: np.array,
+    populationLongitudes: np.array,
+    facilityLatitudes: np.array,
+    facilityLongitudes: np.array,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+    workers=None,
+    tileSize=256,
+    kernel="broadcast",
+    distanceKernel="haversine",
+    distanceOptions=None,
+):
+    """
+    Calculates the (n,s) burden array on a pool of worker processes.
+
+    Inputs:
+        populationLatitudes, populationLongitudes: (n,) population centroids, degrees
+        facilityLatitudes, facilityLongitudes: (m,) facility locations, degrees
+        zde, epf: (m,) zero distance effort and effort per foot
+        SLR: (m,s) reduced service levels (see burdenKernels.reducedServiceLevels)
+        attainFactors: (n,)
+        workers: number of processes; None means one per CPU.
+        tileSize: number of population groups each worker handles at once.
+        kernel: benefit kernel name, a key of burdenKernels.BENEFIT_KERNELS.
+        distanceKernel: distance kernel name, a key of burdenKernels.DISTANCE_KERNELS.
+        distanceOptions: dict of extra keyword arguments for the distance kernel,
+            e.g. {"feetPerUnit": ...} for the planar kernel.
+
+    Returns:
+        (n,s) burden array. Each population group's burden is calculated by the same
+        sequence of operations whatever shard it lands in, so results do not
+        depend on the number of workers.
+    """
+    if kernel not in burdenKernels.BENEFIT_KERNELS:
+        raise ValueError(
+            f"Unknown benefit kernel {kernel}; options are {list(burdenKernels.BENEFIT_KERNELS)}."
+        )
+    if distanceKernel not in burdenKernels.DISTANCE_KERNELS:
+        raise ValueError(
+            f"Unknown distance kernel {distanceKernel}; options are {list(burdenKernels.DISTANCE_KERNELS)}."
+        )
+    if workers is None:
+        workers = os.cpu_count() or 1
+    numPopulations = populationLatitudes.shape[0]
+
+    inputs = {
+        "populationLatitudes": populationLatitudes,
+        "populationLongitudes": populationLongitudes,
+        "facilityLatitudes": facilityLatitudes,
+        "facilityLongitudes": facilityLongitudes,
+        "zde": zde,
+        "epf": epf,
+        "SLR": SLR,
+        "attainFactors": attainFactors,
+        "burden": np.zeros((numPopulations, SLR.shape[1])),
+    }
+
+    blocks = []
+    descriptors = {}
+    try:
+        for name, arr in inputs.items():
+            shm, descriptor = _shareArray(arr)
+            blocks.append(shm)
+            descriptors[name] = descriptor
+        result = np.ndarray(
+            (numPopulations, SLR.shape[1]), dtype=np.float64, buffer=blocks[-1].buf
+        )
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=_processContext(),
+            initializer=_attachSharedArrays,
+            initargs=(
+                descriptors,
+                {
+                    "tileSize": tileSize,
+                    "kernel": kernel,
+                    "distanceKernel": distanceKernel,
+                    "distanceOptions": distanceOptions or {},
+                },
+            ),
+        ) as pool:
+            # list() so that any exception raised in a worker is raised here
+            list(pool.map(_burdenShard, _shards(numPopulations, workers, tileSize)))
+
+        burden = result.copy()
+        del result
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return burden
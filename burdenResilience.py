@@ -0,0 +1,216 @@
+"""
+Worst-case multiple facility loss (N-k): which k facilities, lost together, raise
+population-weighted burden the most.
+
+Trying every set of k out of m facilities is out of the question, so the search is
+greedy: it removes, one at a time, the facility whose loss raises the burden the
+most given the facilities already lost, and reports the burden after each removal.
+
+The state kept between removals is the (n,s) table of summed benefits T (before
+attainment factors), as in burdenIncremental. With b[i,j,k] facility j's part of
+T[i,k], w[i] = population[i]/attainment[i], losing facility j raises the
+population-weighted burden by
+    sum over i,k of w[i] * b[i,j,k] / (T[i,k] * (T[i,k] - b[i,j,k]))
+which is O(n*s) for one candidate, and removing it is one O(n*s) update of T.
+
+Losing the only provider of a service to a group makes that group's burden
+infinite, and after that every further loss would be "infinitely bad" too. Gains
+are therefore compared as (population left without any provider, increase in the
+finite weighted burden of everybody else), first element first: the greedy search
+first strands as many people as it can, then raises the burden of the rest.
+
+By default the search is exact: every step recalculates every remaining
+candidate's gain, in one blocked O(n*m*s) pass over the population groups (as in
+burdenCriticality).
+
+Lazy evaluation (lazy=True) is a faster approximation. Every candidate's gain is
+calculated once, up front, and kept in a priority queue. Each step pops the best
+candidate; if its gain was calculated for the current set of lost facilities it
+is taken, otherwise its gain is recalculated and it is pushed back. Most steps
+only recalculate a handful of candidates, rather than all m.
+
+That is only sound when gains are diminishing (as in e.g. coverage problems),
+and here they are not: since 1/T is convex, losing one facility raises what
+losing a nearby one would cost. A gain calculated earlier is then a lower bound,
+not an upper one, and the lazy search can take a facility whose up-to-date gain
+is below another's, whose old gain was never refreshed. There is no cheap upper
+bound on how much a gain grows, so the lazy search cannot tell when to stop
+refreshing: it can find a milder worst case than the exact search, and should
+only be used to get a quick estimate on problems too large for the exact one.
+
+Nothing in here depends on QGIS.
+"""
+
+import heapq
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+    from . import burdenIncremental
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+    import burdenIncremental
+
+
+# a benefit that cancels to less than this fraction of itself is taken to be 0
+CANCELLATION_TOLERANCE = burdenIncremental.CANCELLATION_TOLERANCE
+
+
+def _tileGains(distances, zde, epf, SLR, weight, population, sums):
+    """
+    Gains from losing each of a block of facilities, from one tile of population groups.
+
+    Inputs:
+        distances: (t,c) distances in feet to the c candidate facilities
+        zde, epf: (c,); SLR: (c,s) the candidates' reduced service levels
+        weight, population: (t,)
+        sums: (t,s) the tile's current summed benefits
+
+    Returns:
+        ((c,) population newly left without a provider, summed over services,
+         (c,) increase in the finite weighted burden)
+    """
+    reciprocal_denominator = 1 / (zde + epf * distances)  # (t,c)
+    unserved = np.zeros(SLR.shape[0])
+    increase = np.zeros(SLR.shape[0])
+    for service in range(SLR.shape[1]):
+        benefit = reciprocal_denominator * SLR[:, service]  # (t,c)
+        serviceSums = sums[:, service : service + 1]  # (t,1)
+        remaining = serviceSums - benefit
+        stranded = np.abs(remaining) <= CANCELLATION_TOLERANCE * np.abs(serviceSums)
+        stranded &= benefit != 0
+        remaining[stranded] = 1  # placeholder; handled below
+        with np.errstate(divide="ignore", invalid="ignore"):
+            serviceIncrease = benefit / (serviceSums * remaining)
+            burden = np.where(serviceSums[:, 0] > 0, weight / serviceSums[:, 0], 0)
+        serviceIncrease[stranded | (benefit == 0)] = 0
+        # stranded groups leave the finite burden (and count as unserved instead)
+        unserved += population @ stranded
+        increase += weight @ serviceIncrease - burden @ stranded
+    return unserved, increase
+
+
+def _allGains(distanceTile, numPopulations, zde, epf, SLR, weight, population, sums, tileSize, workers):
+    """
+    (unserved, increase) gains of every facility, in one blocked pass; see _tileGains.
+    """
+    def tileGains(rows):
+        return _tileGains(
+            distanceTile(rows), zde, epf, SLR, weight[rows], population[rows], sums[rows]
+        )
+
+    zeros = (np.zeros(SLR.shape[0]), np.zeros(SLR.shape[0]))
+    return burdenKernels.sumOverTiles(tileGains, zeros, numPopulations, tileSize, workers)
+
+
+def burdenAndUnserved(sums, weight, population):
+    """
+    (weighted burden of the population groups that still have a provider, summed
+    over services, population left without a provider, summed over services).
+    """
+    served = sums > 0
+    with np.errstate(divide="ignore"):
+        burden = np.where(served, weight.reshape((-1, 1)) / sums, 0)
+    return float(np.sum(burden)), float(population @ np.sum(~served, axis=1))
+
+
+def worstCaseRemovals(
+    distanceTile,
+    facilityDistances,
+    numPopulations: int,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+    population: np.array,
+    k: int,
+    lazy=False,
+    tileSize=256,
+    workers=1,
+):
+    """
+    Greedy search for the k facilities whose loss raises population-weighted burden
+    the most.
+
+    Inputs:
+        distanceTile: called with a slice of population groups, returns their (t,m)
+            distances in feet (see burdenCriticality.facilityCriticality)
+        facilityDistances: called with a facility index, returns its (n,) distances in feet
+        numPopulations: n
+        zde, epf: (m,) zero distance effort and effort per foot
+        SLR: (m,s) reduced service levels
+        attainFactors, population: (n,)
+        k: number of facilities to remove (at most m)
+        lazy: use lazy (priority queue) re-evaluation, a faster approximation of
+            the exact greedy search; see the module docstring
+        tileSize, workers: population groups per block, and threads, for the
+            passes over all facilities
+
+    Returns:
+        (removed, burden, unserved):
+            removed: (k,) facility indices, in the order they were removed
+            burden: (k+1,) population-weighted burden (summed over population groups
+                and services) of the groups that still have a provider, before any
+                removal and after each one
+            unserved: (k+1,) population (counted once per service) left without any
+                provider, before any removal and after each one
+    """
+    numFacilities = SLR.shape[0]
+    k = min(int(k), numFacilities)
+    if k < 0:
+        raise ValueError(f"Number of facilities to remove must not be negative, not {k}.")
+    weight = burdenKernels.populationWeights(attainFactors, population)
+
+    sums = np.empty((numPopulations, SLR.shape[1]))
+    for rows in burdenKernels.populationTiles(numPopulations, tileSize):
+        sums[rows] = (1 / (zde + epf * distanceTile(rows))) @ SLR
+    incremental = burdenIncremental.IncrementalBenefits(sums)
+
+    def facilityGain(j):
+        unserved, increase = _tileGains(
+            facilityDistances(j).reshape((-1, 1)), zde[j : j + 1], epf[j : j + 1],
+            SLR[j : j + 1], weight, population, incremental.getBenefitSums(),
+        )
+        return unserved[0], increase[0]
+
+    def allGains(removedSoFar):
+        remainingSLR = SLR.copy()
+        remainingSLR[removedSoFar] = 0
+        return _allGains(
+            distanceTile, numPopulations, zde, epf, remainingSLR, weight, population,
+            incremental.getBenefitSums(), tileSize, workers,
+        )
+
+    removed = []
+    burden, unserved = burdenAndUnserved(sums, weight, population)
+    burdens, unserveds = [burden], [unserved]
+    if k > 0 and lazy:
+        gainUnserved, gainIncrease = allGains(removed)
+        # (-unserved, -increase, facility, step the gain was calculated at)
+        queue = [(-gainUnserved[j], -gainIncrease[j], j, 0) for j in range(numFacilities)]
+        heapq.heapify(queue)
+
+    while len(removed) < k:
+        if lazy:
+            _, _, best, step = heapq.heappop(queue)
+            if step != len(removed):
+                gainUnserved, gainIncrease = facilityGain(best)
+                heapq.heappush(queue, (-gainUnserved, -gainIncrease, best, len(removed)))
+                continue
+        else:
+            gainUnserved, gainIncrease = allGains(removed)
+            gainUnserved[removed] = -np.inf
+            best = int(np.lexsort((-gainIncrease, -gainUnserved))[0])
+
+        incremental.update(
+            removed=burdenIncremental.facilityBenefits(
+                facilityDistances(best), zde[best], epf[best], SLR[best]
+            )
+        )
+        removed.append(int(best))
+        burden, unserved = burdenAndUnserved(incremental.getBenefitSums(), weight, population)
+        burdens.append(burden)
+        unserveds.append(unserved)
+
+    return np.array(removed, dtype=int), np.array(burdens), np.array(unserveds)
@@ -0,0 +1,119 @@
+"""
+Batched evaluation of many facility status scenarios.
+
+Outage studies evaluate hundreds of scenarios that differ only in each facility's
+status, i.e. in the service level reduction. Writing a scenario's status factors as
+    factor[k,j] = 1 - reduction[k,j]/100
+the benefit of population group i for service s in scenario k is
+    attainment[i] * sum over j of (1/denominator[i,j]) * factor[k,j] * serviceLevel[j,s]
+The reciprocal denominators 1/(ZDE + EPF*distance) do not depend on the scenario, so
+they are calculated once, and a whole batch of K scenarios is then a single
+(n,m)@(m,K*s) matrix product against the service levels scaled by each scenario's
+factors.
+
+Nothing in here depends on QGIS.
+"""
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+def reciprocalDenominators(
+    distances: np.array, zde: np.array, epf: np.array, tileSize=None, workers=1
+):
+    """
+    (n,m) array of 1/(zde + epf*distance), filled one tile of population groups at a time.
+    """
+    out = np.empty(distances.shape)
+
+    def reciprocalTile(rows):
+        np.divide(1.0, zde + epf * distances[rows], out=out[rows])
+
+    burdenKernels.forEachTile(reciprocalTile, distances.shape[0], tileSize, workers)
+    return out
+
+
+def _scenarioBatches(numScenarios: int, scenarioBatch: int):
+    scenarioBatch = int(scenarioBatch)
+    if scenarioBatch < 1:
+        raise ValueError(f"Scenario batch size must be a positive integer, not {scenarioBatch}.")
+    return burdenKernels.populationTiles(numScenarios, scenarioBatch)
+
+
+def _batchBurdens(reciprocal, serviceLevels, statusFactors, attainFactors):
+    """
+    (K,n,s) burdens of a batch of K scenarios.
+    """
+    numScenarios = statusFactors.shape[0]
+    numFacilities, numServices = serviceLevels.shape
+    # (m,K,s): every scenario's reduced service levels, side by side
+    scenarioSLR = statusFactors.T.reshape((numFacilities, numScenarios, 1)) * serviceLevels.reshape(
+        (numFacilities, 1, numServices)
+    )
+    benefit = reciprocal @ scenarioSLR.reshape((numFacilities, numScenarios * numServices))
+    benefit = benefit.reshape((-1, numScenarios, numServices)) * attainFactors.reshape((-1, 1, 1))
+    with np.errstate(divide="ignore"):
+        return np.transpose(1 / benefit, (1, 0, 2))
+
+
+def iterScenarioBurdens(
+    reciprocal: np.array,
+    serviceLevels: np.array,
+    statusFactors: np.array,
+    attainFactors: np.array,
+    scenarioBatch=32,
+):
+    """
+    Yields (scenario index, (n,s) burden array) for every scenario, in order,
+    evaluating scenarioBatch scenarios per matrix product. At most one batch of
+    burdens is held at a time, so the number of scenarios can be large.
+
+    Inputs:
+        reciprocal: (n,m) reciprocal denominators (see reciprocalDenominators)
+        serviceLevels: (m,s) service levels, before any reduction
+        statusFactors: (K,m) factors each facility's service levels are multiplied by
+            in each scenario, i.e. 1 - reduction/100 (1 is fully open, 0 is closed)
+        attainFactors: (n,)
+    """
+    statusFactors = np.asarray(statusFactors, dtype=np.float64)
+    if statusFactors.ndim != 2 or statusFactors.shape[1] != serviceLevels.shape[0]:
+        raise ValueError(
+            f"Status factors must be (number of scenarios, {serviceLevels.shape[0]} facilities), "
+            f"not {statusFactors.shape}."
+        )
+    for batch in _scenarioBatches(statusFactors.shape[0], scenarioBatch):
+        burdens = _batchBurdens(reciprocal, serviceLevels, statusFactors[batch], attainFactors)
+        for offset in range(burdens.shape[0]):
+            yield batch.start + offset, burdens[offset]
+
+
+def scenarioBurdens(reciprocal, serviceLevels, statusFactors, attainFactors, scenarioBatch=32):
+    """
+    (K,n,s) burdens of all scenarios; see iterScenarioBurdens.
+    """
+    out = np.empty((np.shape(statusFactors)[0], reciprocal.shape[0], serviceLevels.shape[1]))
+    for k, burden in iterScenarioBurdens(
+        reciprocal, serviceLevels, statusFactors, attainFactors, scenarioBatch
+    ):
+        out[k] = burden
+    return out
+
+
+def aggregatedWeightedScenarioBurdens(
+    reciprocal, serviceLevels, statusFactors, attainFactors, population, scenarioBatch=32
+):
+    """
+    (K,s) population-weighted burden of every scenario, summed over the population
+    groups (as SBCalculator.getAggregatedWeightedBurden), without keeping the (K,n,s)
+    burdens around.
+    """
+    out = np.empty((np.shape(statusFactors)[0], serviceLevels.shape[1]))
+    for k, burden in iterScenarioBurdens(
+        reciprocal, serviceLevels, statusFactors, attainFactors, scenarioBatch
+    ):
+        out[k] = np.sum(population.reshape((-1, 1)) * burden, axis=0)
+    return out
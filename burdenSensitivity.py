@@ -0,0 +1,111 @@
+"""
+Analytic sensitivity of the population-weighted total burden to each facility's inputs.
+
+The population-weighted total burden is
+    W = sum over i,k of population[i] / (a[i] * T[i,k]),
+    T[i,k] = sum over j of f[j] * SL[j,k] * R[i,j],   R[i,j] = 1 / (ZDE[j] + EPF[j]*distance[i,j])
+with a the attainment factors and f[j] = 1 - SLReduce[j]/100 facility j's status
+factor. With G[i,k] = dW/dT[i,k] = -population[i] / (a[i] * T[i,k]**2), the chain rule
+gives, for every facility j and service k,
+    dW/dSL[j,k]     = f[j] * (R^T G)[j,k]
+    dW/dZDE[j]      = -sum over k of f[j] * SL[j,k] * ((R*R)^T G)[j,k]
+    dW/dEPF[j]      = -sum over k of f[j] * SL[j,k] * ((R*R*distance)^T G)[j,k]
+    dW/dSLReduce[j] = -0.01 * sum over k of SL[j,k] * (R^T G)[j,k]
+so one blocked pass over the population groups gives both the burden (from T) and
+all the derivatives: besides the (t,m)@(m,s) product for T, each tile adds three
+(m,t)@(t,s) products, i.e. roughly twice the cost of the burden on its own.
+
+Population groups with no provider of a service (T = 0, infinite burden) and groups
+with an attainment factor of 0 have no finite derivative; they are left out.
+
+Nothing in here depends on QGIS.
+"""
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+# names of the inputs the derivatives are taken with respect to
+SENSITIVITY_INPUTS = ["serviceLevels", "zde", "epf", "SLReduce"]
+
+
+def _tileProducts(distances, zde, epf, SLR, attainFactors, population):
+    """
+    ((t,s) summed benefits T, and the (m,s) products R^T G, (R*R)^T G and
+    (R*R*distance)^T G) for one tile of population groups.
+    """
+    reciprocal = 1 / (zde + epf * distances)  # R, (t,m)
+    sums = reciprocal @ SLR  # T, (t,s)
+
+    weight = burdenKernels.populationWeights(attainFactors, population)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        G = np.where(sums > 0, -weight.reshape((-1, 1)) / sums**2, 0)  # (t,s)
+
+    RG = reciprocal.T @ G
+    reciprocal *= reciprocal  # R*R, in place
+    R2G = reciprocal.T @ G
+    reciprocal *= distances  # R*R*distance
+    R2dG = reciprocal.T @ G
+    return sums, RG, R2G, R2dG
+
+
+def burdenAndGradients(
+    distanceTile,
+    numPopulations: int,
+    zde: np.array,
+    epf: np.array,
+    SLReduce: np.array,
+    serviceLevels: np.array,
+    attainFactors: np.array,
+    population: np.array,
+    tileSize=256,
+    workers=1,
+):
+    """
+    Burden, and derivatives of the population-weighted total burden, in one blocked pass.
+
+    Inputs:
+        distanceTile: called with a slice of population groups, returns their (t,m)
+            distances in feet
+        numPopulations: n
+        zde, epf: (m,) zero distance effort and effort per foot
+        SLReduce: (m,) service level reductions, in percent
+        serviceLevels: (m,s) service levels, before reduction
+        attainFactors, population: (n,)
+        tileSize: number of population groups per block
+        workers: number of threads; results are the same for any number (see
+            burdenKernels.sumOverTiles)
+
+    Returns:
+        (burden, gradients): burden is the (n,s) burden array; gradients is a dict
+        with, for every facility, dW/dSL ("serviceLevels", (m,s)), dW/dZDE ("zde",
+        (m,)), dW/dEPF ("epf", (m,)) and dW/dSLReduce ("SLReduce", (m,), per
+        percentage point), W being the population-weighted total burden.
+    """
+    factors = 1 - SLReduce * 0.01
+    SLR = burdenKernels.reducedServiceLevels(SLReduce, serviceLevels)
+    burden = np.empty((numPopulations, SLR.shape[1]))
+
+    def tileProducts(rows):
+        sums, *products = _tileProducts(
+            distanceTile(rows), zde, epf, SLR, attainFactors[rows], population[rows]
+        )
+        with np.errstate(divide="ignore"):
+            burden[rows] = 1 / (attainFactors[rows].reshape((-1, 1)) * sums)
+        return products
+
+    zeros = tuple(np.zeros(SLR.shape) for _ in range(3))
+    RG, R2G, R2dG = burdenKernels.sumOverTiles(
+        tileProducts, zeros, numPopulations, tileSize, workers
+    )
+    gradients = {
+        "serviceLevels": factors.reshape((-1, 1)) * RG,
+        "zde": -np.sum(SLR * R2G, axis=1),
+        "epf": -np.sum(SLR * R2dG, axis=1),
+        "SLReduce": -0.01 * np.sum(serviceLevels * RG, axis=1),
+    }
+    return burden, gradients
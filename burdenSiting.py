@@ -0,0 +1,201 @@
+"""
+Facility siting: which p of a set of candidate sites, given a new facility of one
+sector each, lower population-weighted burden the most.
+
+The search is greedy: it adds, one at a time, the candidate that lowers the burden
+the most given the sites already picked, and reports the burden after each pick.
+
+The state kept between picks is the (n,s) table of summed benefits T (before
+attainment factors) of the existing facilities plus the sites picked so far, as in
+burdenIncremental. A new facility of the sector at candidate site c adds
+b[i,c,k] = SL[k] / (ZDE + EPF*distance[i,c]) to T[i,k], which lowers the
+population-weighted burden by
+    sum over i,k of w[i] * b[i,c,k] / (T[i,k] * (T[i,k] + b[i,c,k]))
+with w[i] = population[i]/attainment[i]; one O(n*s) evaluation per candidate, and
+one O(n*s) update per pick.
+
+Groups with no provider of a service at all have infinite burden, which a new
+facility brings down to a finite one. Gains are therefore compared as (population
+newly given a provider, decrease in the finite weighted burden), first element first.
+
+CELF (lazy) evaluation: every candidate's gain is calculated once, up front, in one
+blocked pass over the population groups, with (t, number of candidates) blocks of
+distances, and kept in a priority queue. Each step pops the best candidate; if its
+gain was calculated for the current picks it is taken, otherwise its gain is
+recalculated and it is pushed back. Stale candidates are taken off the top of the
+queue batchSize at a time and recalculated together, with one (n, batchSize) block
+of distances, since with many similar candidates a step can refresh thousands of
+them. Adding a facility only ever makes another
+candidate's decrease smaller (1/T is convex), and the same holds for the population
+it would newly serve, so older gains are upper bounds and the candidate taken is the
+one the exact greedy search would take. The exception is the finite part of the
+gain of a candidate that serves people nobody else does: their burden enters the
+finite total when they are first served, so that part is not monotone. lazy=False
+recalculates every candidate at every step.
+
+Nothing in here depends on QGIS.
+"""
+
+import heapq
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+    from . import burdenIncremental
+    from . import burdenResilience
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+    import burdenIncremental
+    import burdenResilience
+
+
+def _tileGains(distances, zde, epf, serviceLevels, weight, population, sums):
+    """
+    Gains from adding a facility at each of a block of candidate sites, from one
+    tile of population groups.
+
+    Inputs:
+        distances: (t,c) distances in feet to the c candidate sites
+        zde, epf: the new facility's zero distance effort and effort per foot
+        serviceLevels: (s,) the new facility's reduced service levels
+        weight, population: (t,)
+        sums: (t,s) the tile's current summed benefits
+
+    Returns:
+        ((c,) population newly given a provider, summed over services,
+         (c,) decrease in the finite weighted burden)
+    """
+    denominator = zde + epf * distances  # (t,c)
+    served = np.zeros(distances.shape[1])
+    decrease = np.zeros(distances.shape[1])
+    buffer = np.empty(distances.shape)
+    for service in range(serviceLevels.shape[0]):
+        if serviceLevels[service] == 0:
+            continue
+        serviceSums = sums[:, service]
+        unserved = serviceSums <= 0
+        # w/T - w/(T + b) for the groups that already have a provider, with the
+        # sum of w/T the same for every candidate
+        np.divide(serviceLevels[service], denominator, out=buffer)
+        buffer += serviceSums.reshape((-1, 1))
+        np.reciprocal(buffer, out=buffer)
+        buffer[unserved] = 0
+        with np.errstate(divide="ignore"):
+            burden = np.where(unserved, 0, weight / serviceSums)
+        decrease += np.sum(burden) - weight @ buffer
+        if unserved.any():
+            # newly served groups count as served, and their (finite) burden is added
+            served += np.sum(population[unserved])
+            decrease -= weight[unserved] @ (denominator[unserved] / serviceLevels[service])
+    return served, decrease
+
+
+def greedySiting(
+    candidateDistanceTile,
+    candidateDistances,
+    numPopulations: int,
+    zde: float,
+    epf: float,
+    serviceLevels: np.array,
+    sums: np.array,
+    attainFactors: np.array,
+    population: np.array,
+    p: int,
+    lazy=True,
+    batchSize=128,
+    tileSize=256,
+    workers=1,
+):
+    """
+    Greedy search for the p candidate sites at which a new facility lowers
+    population-weighted burden the most.
+
+    Inputs:
+        candidateDistanceTile: called with a slice of population groups, returns
+            their (t,c) distances in feet to every candidate site
+        candidateDistances: called with an array of candidate indices, returns
+            their (n, number of indices) distances in feet
+        numPopulations: n
+        zde, epf: the new facilities' zero distance effort and effort per foot
+        serviceLevels: (s,) the new facilities' (reduced) service levels
+        sums: (n,s) summed benefits of the existing facilities, before attainment
+            factors (see burdenIncremental.benefitSums). Not changed.
+        attainFactors, population: (n,)
+        p: number of sites to pick (at most the number of candidates)
+        lazy: use CELF lazy re-evaluation; see the module docstring
+        batchSize: number of stale candidates recalculated together
+        tileSize, workers: population groups per block, and threads, for the
+            passes over all candidates
+
+    Returns:
+        (picked, burden, unserved):
+            picked: (p,) candidate indices, in the order they were picked
+            burden: (p+1,) population-weighted burden (summed over population groups
+                and services) of the groups that have a provider, before any pick
+                and after each one
+            unserved: (p+1,) population (counted once per service) without any
+                provider, before any pick and after each one
+    """
+    serviceLevels = np.asarray(serviceLevels, dtype=np.float64)
+    weight = burdenKernels.populationWeights(attainFactors, population)
+    incremental = burdenIncremental.IncrementalBenefits(np.array(sums, dtype=np.float64))
+
+    def candidateGains(candidates):
+        return _tileGains(
+            candidateDistances(candidates), zde, epf, serviceLevels, weight, population,
+            incremental.getBenefitSums(),
+        )
+
+    def allGains():
+        def tileGains(rows):
+            return _tileGains(
+                candidateDistanceTile(rows), zde, epf, serviceLevels, weight[rows],
+                population[rows], incremental.getBenefitSums()[rows],
+            )
+
+        return burdenKernels.sumOverTiles(tileGains, (0, 0), numPopulations, tileSize, workers)
+
+    def burdenAndUnserved():
+        return burdenResilience.burdenAndUnserved(incremental.getBenefitSums(), weight, population)
+
+    picked = []
+    burden, unserved = burdenAndUnserved()
+    burdens, unserveds = [burden], [unserved]
+    if p > 0:
+        gainServed, gainDecrease = allGains()
+        numCandidates = np.shape(gainServed)[0]
+        p = min(int(p), numCandidates)
+        if lazy:
+            # (-served, -decrease, candidate, step the gain was calculated at)
+            queue = [(-gainServed[c], -gainDecrease[c], c, 0) for c in range(numCandidates)]
+            heapq.heapify(queue)
+
+    while len(picked) < p:
+        if lazy:
+            if queue[0][3] != len(picked):
+                stale = []
+                while queue and queue[0][3] != len(picked) and len(stale) < batchSize:
+                    stale.append(heapq.heappop(queue)[2])
+                gainServed, gainDecrease = candidateGains(np.array(stale))
+                for c, served, decrease in zip(stale, gainServed, gainDecrease):
+                    heapq.heappush(queue, (-served, -decrease, c, len(picked)))
+                continue
+            best = heapq.heappop(queue)[2]
+        else:
+            if picked:
+                gainServed, gainDecrease = allGains()
+            gainServed[picked] = -np.inf
+            best = int(np.lexsort((-gainDecrease, -gainServed))[0])
+
+        incremental.update(
+            added=burdenIncremental.facilityBenefits(
+                candidateDistances(np.array([best]))[:, 0], zde, epf, serviceLevels
+            )
+        )
+        picked.append(int(best))
+        burden, unserved = burdenAndUnserved()
+        burdens.append(burden)
+        unserveds.append(unserved)
+
+    return np.array(picked, dtype=int), np.array(burdens), np.array(unserveds)
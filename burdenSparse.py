@@ -0,0 +1,203 @@
+"""
+Distance-cutoff (sparse) burden calculation.
+
+Because the denominator ZDE + EPF*distance grows linearly with distance, far away
+facilities add very little benefit. Instead of evaluating all n*m population/facility
+pairs, this module keeps only
+    - the pairs within a maximum travel distance, or
+    - for every population group, the k nearest facilities of each sector,
+found with a KD-tree over the facilities' positions on the unit sphere. The kept
+pairs' reciprocal denominators go into a CSR sparse matrix, and the benefits are one
+sparse (n,m)@(m,s) product.
+
+Dropping pairs can only lower the benefits (and so raise the burdens), and an upper
+bound on the benefit that was dropped is returned alongside the burdens, so the
+size of the approximation is known:
+    1 / (kept benefit + discarded bound) <= exact burden <= 1 / kept benefit
+
+Distances between kept pairs are great circle distances from the chord between
+the unit vectors, which agree with burdenKernels.greatCircleDistances to
+floating point rounding.
+
+This needs scipy (scipy.spatial and scipy.sparse), which is only imported
+when a cutoff calculation is asked for.
+"""
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+def _importScipy():
+    try:
+        from scipy.spatial import cKDTree
+        from scipy import sparse
+    except ImportError:
+        raise ImportError(
+            "The distance cutoff calculation needs scipy, which is not installed "
+            "in this python environment."
+        )
+    return cKDTree, sparse
+
+
+def _chordsToFeet(chords: np.array):
+    """
+    Converts chord lengths on the unit sphere to great circle distances in feet.
+    """
+    return (
+        2
+        * np.arcsin(np.minimum(chords * 0.5, 1.0))
+        * burdenKernels.EARTH_RADIUS_METERS
+        * burdenKernels.METERS_TO_FEET
+    )
+
+
+def _feetToChord(distance: float):
+    """
+    Converts a great circle distance in feet to the chord length on the unit sphere.
+    """
+    angle = distance / (burdenKernels.EARTH_RADIUS_METERS * burdenKernels.METERS_TO_FEET)
+    return 2 * np.sin(min(angle, np.pi) * 0.5)
+
+
+def _pairsWithinDistance(populationVectors, facilityVectors, maxDistance):
+    """
+    All (population, facility) pairs no more than maxDistance feet apart.
+
+    Returns:
+        (rows, cols, distances in feet) as 1-d arrays
+    """
+    cKDTree, sparse = _importScipy()
+    chord = _feetToChord(maxDistance)
+    pairs = cKDTree(populationVectors).sparse_distance_matrix(
+        cKDTree(facilityVectors), chord, output_type="ndarray"
+    )
+    return (
+        pairs["i"].astype(np.int64),
+        pairs["j"].astype(np.int64),
+        _chordsToFeet(pairs["v"]),
+    )
+
+
+def _nearestPairsPerGroup(populationVectors, facilityVectors, facilityGroups, k):
+    """
+    For every population group, the k nearest facilities in each facility group
+    (e.g. sector), or all of that group's facilities if it has k or fewer.
+
+    Returns:
+        (rows, cols, distances in feet, cutoffs), where cutoffs is a list of
+        (facility indices of the group, (n,) distance in feet to the k-th nearest)
+        for the groups that had facilities left out.
+    """
+    cKDTree, sparse = _importScipy()
+    numPopulations = populationVectors.shape[0]
+    groupCodes = np.unique(np.asarray(facilityGroups), return_inverse=True)[1]
+
+    rows, cols, feet, cutoffs = [], [], [], []
+    for code in range(groupCodes.max() + 1 if groupCodes.size else 0):
+        members = np.flatnonzero(groupCodes == code)
+        numNearest = min(int(k), members.shape[0])
+        chords, nearest = cKDTree(facilityVectors[members]).query(
+            populationVectors, k=numNearest
+        )
+        chords = chords.reshape((numPopulations, numNearest))
+        nearest = nearest.reshape((numPopulations, numNearest))
+
+        rows.append(np.repeat(np.arange(numPopulations), numNearest))
+        cols.append(members[nearest].ravel())
+        feet.append(_chordsToFeet(chords).ravel())
+        if members.shape[0] > numNearest:
+            cutoffs.append((members, _chordsToFeet(chords[:, -1])))
+
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), cutoffs
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(feet), cutoffs
+
+
+def cutoffBurden(
+    populationLatitudes: np.array,
+    populationLongitudes: np.array,
+    facilityLatitudes: np.array,
+    facilityLongitudes: np.array,
+    zde: np.array,
+    epf: np.array,
+    SLR: np.array,
+    attainFactors: np.array,
+    maxDistance=None,
+    nearestPerGroup=None,
+    facilityGroups=None,
+):
+    """
+    Burden from only the nearby population/facility pairs.
+
+    Inputs:
+        populationLatitudes, populationLongitudes: (n,) degrees
+        facilityLatitudes, facilityLongitudes: (m,) degrees
+        zde, epf: (m,) zero distance effort and effort per foot
+        SLR: (m,s) reduced service levels (see burdenKernels.reducedServiceLevels)
+        attainFactors: (n,)
+        maxDistance: keep pairs no more than this many feet apart, or
+        nearestPerGroup: keep the this-many nearest facilities of each group, where
+        facilityGroups: (m,) labels of the facilities' groups (e.g. their sectors).
+            Exactly one of maxDistance and nearestPerGroup must be given.
+
+    Returns:
+        (burden, discardedBenefitBound): both (n,s) arrays. The second is an upper
+        bound on the per-capita benefit left out of each population group's total
+        for each service, so that 1/(1/burden + discardedBenefitBound) is a lower
+        bound on the exact burden.
+    """
+    cKDTree, sparse = _importScipy()
+    if (maxDistance is None) == (nearestPerGroup is None):
+        raise ValueError("Give exactly one of a maximum distance or a number of nearest facilities.")
+
+    numPopulations = populationLatitudes.shape[0]
+    numFacilities = facilityLatitudes.shape[0]
+    populationVectors = burdenKernels.unitVectors(populationLatitudes, populationLongitudes)
+    facilityVectors = burdenKernels.unitVectors(facilityLatitudes, facilityLongitudes)
+    SLR = np.asarray(SLR, dtype=np.float64)
+
+    if maxDistance is not None:
+        rows, cols, feet = _pairsWithinDistance(populationVectors, facilityVectors, maxDistance)
+    else:
+        if facilityGroups is None:
+            facilityGroups = np.zeros(numFacilities, dtype=np.int64)
+        rows, cols, feet, cutoffs = _nearestPairsPerGroup(
+            populationVectors, facilityVectors, facilityGroups, nearestPerGroup
+        )
+
+    # the kept reciprocal denominators, (n,m) but sparse
+    reciprocal_denominator = sparse.csr_matrix(
+        (1 / (zde[cols] + epf[cols] * feet), (rows, cols)),
+        shape=(numPopulations, numFacilities),
+    )
+    attain = attainFactors.reshape((-1, 1))
+    with np.errstate(divide="ignore"):
+        burden = 1 / (attain * np.asarray(reciprocal_denominator @ SLR))
+
+    # upper bound on the benefit of the pairs that were left out
+    kept = sparse.csr_matrix(
+        (np.ones(rows.shape[0]), (rows, cols)), shape=(numPopulations, numFacilities)
+    )
+    if maxDistance is not None:
+        # every discarded pair is at least maxDistance apart
+        boundPerFacility = SLR / (zde + epf * maxDistance).reshape((-1, 1))  # (m,s)
+        discarded = boundPerFacility.sum(axis=0) - np.asarray(kept @ boundPerFacility)
+    else:
+        # every discarded facility of a group is at least as far away as that group's
+        # k-th nearest. Using the group's smallest ZDE and EPF keeps this a bound even
+        # if they vary within the group.
+        discarded = np.zeros((numPopulations, SLR.shape[1]))
+        for members, cutoff in cutoffs:
+            inGroup = np.zeros(numFacilities)
+            inGroup[members] = 1
+            keptSLR = np.asarray((kept.multiply(inGroup)) @ SLR)  # (n,s)
+            discarded += (SLR[members].sum(axis=0) - keptSLR) / (
+                zde[members].min() + epf[members].min() * cutoff
+            ).reshape((-1, 1))
+
+    return burden, attain * np.maximum(discarded, 0)
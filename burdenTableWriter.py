@@ -2,9 +2,11 @@ import tempfile
 import json
 import pandas as pd
 import numpy as np
+from typing import TYPE_CHECKING
 
-from . import QgsSBCalcDataBridge
-from . import SBCalculator
+if TYPE_CHECKING:  # the writer works with any data bridge and engine, without QGIS
+    from . import QgsSBCalcDataBridge
+    from . import SBCalculator
 
 
 class burdenTableWriter:
@@ -15,8 +17,8 @@ class burdenTableWriter:
 
     def __init__(
         self,
-        dataBridge: QgsSBCalcDataBridge.QgsSBCalcDataBridge,
-        SBC: SBCalculator.SBCalculator,
+        dataBridge: "QgsSBCalcDataBridge.QgsSBCalcDataBridge",
+        SBC: "SBCalculator.SBEngine",
     ):
         self._dataBridge = dataBridge
         self._SBCalculator = SBC
@@ -112,6 +114,44 @@ class burdenTableWriter:
         )
         return ret
 
+    def generateSensitivityTable(self):
+        """
+        Creates the table (as pandas dataframe) of how sensitive the population-weighted
+        total burden is to each facility's inputs. Relies on
+        SBCalculator.calculateBurdenSensitivity having been run.
+
+        The table has one row per facility, and the columns are:
+            - the facility index and sector
+            - dW_total_dZDE, dW_total_dEPF: derivatives of the population-weighted
+                total burden with respect to zero-distance effort and effort per foot
+            - dW_total_dSLReduce: with respect to the service level reduction, per
+                percentage point
+            - dW_total_d<service>: with respect to the service level of each service
+        """
+        sensitivity = self._SBCalculator.getBurdenSensitivity()
+        ret = pd.DataFrame(
+            sensitivity["serviceLevels"],
+            columns=[f"dW_total_d{i}" for i in self._dataBridge.getServiceNames()],
+        )
+        ret.insert(0, "dW_total_dZDE", sensitivity["zde"])
+        ret.insert(1, "dW_total_dEPF", sensitivity["epf"])
+        ret.insert(2, "dW_total_dSLReduce", sensitivity["SLReduce"])
+        ret.insert(
+            0,
+            self._dataBridge.getFacilitySectorField(),
+            self._dataBridge.getFacilityDataByFieldName(
+                self._dataBridge.getFacilitySectorField(), expected_type=str
+            ),
+        )
+        ret.insert(
+            0,
+            self._dataBridge.getFacilityIndexField(),
+            self._dataBridge.getFacilityDataByFieldName(
+                self._dataBridge.getFacilityIndexField(), expected_type=str
+            ),
+        )
+        return ret
+
     def exportTableAsTempFile(self, table: pd.DataFrame):
         """
         Exports as CSV to temporary file.
@@ -0,0 +1,148 @@
+"""
+On-disk cache of population to facility distance matrices.
+
+Scenario work reruns the calculation many times against the same population
+centroids and facility points, changing only e.g. the exclusion profile. The
+(n,m) distance matrix only depends on the coordinates (and on the distance
+kernel), so it is stored as a .npy file named after a hash of those, and
+repeat runs memory-map the file instead of recomputing it. Only the pages
+that are actually touched get read from disk.
+
+The cache directory is kept under a size cap: when a new matrix would take it
+over the cap, the least recently used matrices (by file modification time,
+which is bumped on every load) are deleted first.
+
+Nothing in here depends on QGIS.
+"""
+
+import os
+import hashlib
+
+import numpy as np
+
+
+DEFAULT_MAX_BYTES = 4 * 1024**3  # 4 GiB
+
+
+class DistanceCache:
+    def __init__(self, directory: str, maxBytes=DEFAULT_MAX_BYTES):
+        """
+        Inputs:
+            directory: folder the cached matrices are kept in; created if needed.
+            maxBytes: size cap for all cached matrices together.
+        """
+        self._directory = directory
+        self._maxBytes = int(maxBytes)
+        os.makedirs(directory, exist_ok=True)
+
+    def getDirectory(self):
+        return self._directory
+
+    def getMaxBytes(self):
+        return self._maxBytes
+
+    def key(self, *arrays, label=""):
+        """
+        Hash of the contents and shapes of the given arrays (e.g. the population and
+        facility coordinates), and of label (e.g. the distance kernel name).
+        """
+        digest = hashlib.sha256(label.encode("utf-8"))
+        for arr in arrays:
+            arr = np.ascontiguousarray(arr, dtype=np.float64)
+            digest.update(str(arr.shape).encode("utf-8"))
+            digest.update(arr.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str):
+        return os.path.join(self._directory, f"{key}.npy")
+
+    def _entries(self):
+        """
+        (modification time, size, path) of every cached matrix, oldest first.
+        """
+        entries = []
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            if not name.endswith(".npy") or name.endswith(".tmp.npy"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:  # removed by another run in the meantime
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def totalBytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def load(self, key: str):
+        """
+        The cached matrix for key, memory-mapped read-only, or None if there is none.
+        Marks the matrix as recently used.
+        """
+        path = self._path(key)
+        try:
+            arr = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):  # missing, or a partly written/corrupt file
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return arr
+
+    def evict(self, neededBytes=0):
+        """
+        Deletes least recently used matrices until neededBytes more fit under the cap.
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total + neededBytes <= self._maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # e.g. still mapped by another process on Windows
+                continue
+            total -= size
+
+    def store(self, key: str, shape: tuple, fill):
+        """
+        Creates the cached matrix for key by calling fill(out) on a writable
+        memory-mapped (shape) float64 array, and returns it memory-mapped read-only.
+
+        If the matrix alone is bigger than the cap, nothing is cached and fill is
+        called on an ordinary in-memory array instead, which is returned.
+        """
+        nbytes = int(np.prod(shape)) * np.dtype(np.float64).itemsize
+        if nbytes > self._maxBytes:
+            out = np.empty(shape)
+            fill(out)
+            return out
+        self.evict(nbytes)
+
+        # written under a temporary name first, so that a run that is interrupted (or
+        # another run reading the cache) never sees a half-written matrix
+        temporaryPath = os.path.join(self._directory, f"{key}.{os.getpid()}.tmp.npy")
+        out = np.lib.format.open_memmap(temporaryPath, mode="w+", dtype=np.float64, shape=shape)
+        try:
+            fill(out)
+            out.flush()
+            del out
+            os.replace(temporaryPath, self._path(key))
+        except BaseException:
+            out = None
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+            raise
+        return self.load(key)
+
+    def clear(self):
+        """
+        Deletes every cached matrix.
+        """
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,254 @@
+"""
+Distance providers: where SBCalculator gets its population to facility distances from.
+
+A provider hands out blocks of the (n,m) distance matrix, in feet, one block of
+population groups (rows) at a time, so the calculator never needs to know how the
+distances were made:
+    - CoordinateDistanceProvider calculates straight-line distances from
+      coordinates with a distance function (see burdenKernels.DISTANCE_KERNELS).
+      This is what SBCalculator uses unless told otherwise.
+    - ODMatrixDistanceProvider reads precomputed origin-destination distances
+      (e.g. road network travel distances) from a CSV or Parquet table, and falls
+      back to another provider for the pairs the table does not have.
+
+Nothing in here depends on QGIS.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+class DistanceProvider:
+    """
+    Interface for distance providers. Subclasses implement getShape and getFeetDistances.
+    """
+
+    def getShape(self):
+        """
+        (number of population groups, number of facilities)
+        """
+        raise NotImplementedError
+
+    def getFeetDistances(self, rows: slice):
+        """
+        Distances in feet from the population groups in rows (a slice) to every facility.
+
+        Returns:
+            (t,m) array, t being the number of rows in the slice. It must be safe to
+            call this from several threads at once for different rows.
+        """
+        raise NotImplementedError
+
+
+class CoordinateDistanceProvider(DistanceProvider):
+    def __init__(
+        self,
+        populationLatitudes: np.array,
+        populationLongitudes: np.array,
+        facilityLatitudes: np.array,
+        facilityLongitudes: np.array,
+        distanceFunction,
+    ):
+        """
+        distanceFunction: called as distanceFunction(lat1, lat2, long1, long2) with
+            a block of population coordinates and all facility coordinates; returns
+            (t,m) distances in feet.
+        """
+        self._populationLatitudes = populationLatitudes
+        self._populationLongitudes = populationLongitudes
+        self._facilityLatitudes = facilityLatitudes
+        self._facilityLongitudes = facilityLongitudes
+        self._distanceFunction = distanceFunction
+
+    def getShape(self):
+        return (self._populationLatitudes.shape[0], self._facilityLatitudes.shape[0])
+
+    def getFeetDistances(self, rows: slice):
+        return self._distanceFunction(
+            self._populationLatitudes[rows],
+            self._facilityLatitudes,
+            self._populationLongitudes[rows],
+            self._facilityLongitudes,
+        )
+
+
+def _readTableInChunks(path: str, columns: list, idColumns: list, chunkRows: int):
+    """
+    Yields pandas DataFrames of at most chunkRows rows of the given columns of a
+    CSV or Parquet (.parquet, .pq) file, with the id columns as text.
+    Only one chunk is in memory at a time.
+    """
+    if os.path.splitext(path)[1].lower() in [".parquet", ".pq"]:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "Reading Parquet origin-destination tables needs pyarrow, which is not "
+                "installed in this python environment. Convert the table to CSV instead."
+            )
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunkRows, columns=columns):
+            chunk = batch.to_pandas()
+            for column in idColumns:
+                chunk[column] = chunk[column].astype(str)
+            yield chunk
+    else:
+        yield from pd.read_csv(
+            path,
+            usecols=columns,
+            dtype={column: str for column in idColumns},
+            chunksize=chunkRows,
+        )
+
+
+class ODMatrixDistanceProvider(DistanceProvider):
+    def __init__(
+        self,
+        path: str,
+        populationIds,
+        facilityIds,
+        originField: str,
+        destinationField: str,
+        distanceField: str,
+        fallback=None,
+        feetPerUnit=1.0,
+        storage="dense",
+        matrixPath=None,
+        chunkRows=1000000,
+    ):
+        """
+        Streams an origin-destination table into a matrix aligned with the population
+        groups and facilities.
+
+        Inputs:
+            path: CSV or Parquet file with one row per (origin, destination) pair.
+            populationIds: (n,) values of the population index field, in the
+                calculator's population order. Matched to the origins as text.
+            facilityIds: (m,) values of the facility index field, in the calculator's
+                facility order. Matched to the destinations as text.
+            originField, destinationField, distanceField: column names in the table.
+            fallback: DistanceProvider for the pairs missing from the table (e.g. a
+                CoordinateDistanceProvider for straight-line distances). If None,
+                every pair must be in the table.
+            feetPerUnit: length of one unit of the table's distances, in feet.
+            storage: "dense" keeps an (n,m) memory-mapped .npy file (at matrixPath, or
+                a temporary file); "sparse" keeps only the pairs in the table, in
+                compressed sparse row form, which is smaller when most pairs are missing.
+            chunkRows: number of table rows read at a time.
+
+        Table rows with an origin or destination that is not one of the ids are
+        ignored; if a pair is in the table more than once, its last row is used.
+        """
+        if storage not in ["dense", "sparse"]:
+            raise ValueError(f"Unknown storage {storage}; options are 'dense' and 'sparse'.")
+        self._populationIndex = pd.Index(np.asarray(populationIds).astype(str))
+        self._facilityIndex = pd.Index(np.asarray(facilityIds).astype(str))
+        self._fallback = fallback
+        self._storage = storage
+        self._matrixPath = None
+        self._temporaryMatrix = False
+
+        chunks = _readTableInChunks(
+            path,
+            [originField, destinationField, distanceField],
+            [originField, destinationField],
+            chunkRows,
+        )
+        if storage == "dense":
+            self._loadDense(chunks, originField, destinationField, distanceField, feetPerUnit, matrixPath)
+        else:
+            self._loadSparse(chunks, originField, destinationField, distanceField, feetPerUnit)
+
+    def __del__(self):
+        if self._temporaryMatrix:
+            self._matrix = None
+            try:
+                os.remove(self._matrixPath)
+            except OSError:
+                pass
+
+    def _alignChunk(self, chunk, originField, destinationField, distanceField, feetPerUnit):
+        """
+        (row indices, column indices, distances in feet) of the chunk's known pairs.
+        """
+        rows = self._populationIndex.get_indexer(chunk[originField])
+        cols = self._facilityIndex.get_indexer(chunk[destinationField])
+        known = (rows >= 0) & (cols >= 0)
+        distances = chunk[distanceField].to_numpy(dtype=np.float64)[known] * feetPerUnit
+        return rows[known], cols[known], distances
+
+    def _loadDense(self, chunks, originField, destinationField, distanceField, feetPerUnit, matrixPath):
+        if matrixPath is None:
+            handle, matrixPath = tempfile.mkstemp(suffix=".npy")
+            os.close(handle)
+            self._temporaryMatrix = True
+        self._matrixPath = matrixPath
+        matrix = np.lib.format.open_memmap(
+            matrixPath, mode="w+", dtype=np.float64, shape=self.getShape()
+        )
+        matrix[...] = np.nan  # missing pairs
+        for chunk in chunks:
+            rows, cols, distances = self._alignChunk(
+                chunk, originField, destinationField, distanceField, feetPerUnit
+            )
+            matrix[rows, cols] = distances
+        matrix.flush()
+        self._matrix = matrix
+
+    def _loadSparse(self, chunks, originField, destinationField, distanceField, feetPerUnit):
+        numFacilities = self.getShape()[1]
+        keys, values = [], []
+        for chunk in chunks:
+            rows, cols, distances = self._alignChunk(
+                chunk, originField, destinationField, distanceField, feetPerUnit
+            )
+            keys.append(rows.astype(np.int64) * numFacilities + cols)
+            values.append(distances)
+        keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+        values = np.concatenate(values) if values else np.zeros(0)
+
+        # keep the last row of each pair, sorted by (row, column)
+        keys, lastFromEnd = np.unique(keys[::-1], return_index=True)
+        values = values[::-1][lastFromEnd]
+        rows = keys // numFacilities
+        self._cols = keys - rows * numFacilities
+        self._values = values
+        self._indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(rows, minlength=self.getShape()[0]))]
+        )
+
+    def getShape(self):
+        return (self._populationIndex.shape[0], self._facilityIndex.shape[0])
+
+    def getFeetDistances(self, rows: slice):
+        start, stop, _ = rows.indices(self.getShape()[0])
+        if self._storage == "dense":
+            block = np.array(self._matrix[start:stop])
+        else:
+            block = np.full((stop - start, self.getShape()[1]), np.nan)
+            first, last = self._indptr[start], self._indptr[stop]
+            localRows = np.repeat(np.arange(stop - start), np.diff(self._indptr[start:stop + 1]))
+            block[localRows, self._cols[first:last]] = self._values[first:last]
+
+        missing = np.isnan(block)
+        if missing.any():
+            if self._fallback is None:
+                raise ValueError(
+                    "Some population group/facility pairs are not in the origin-destination "
+                    "table, and there is no fallback distance provider."
+                )
+            block[missing] = self._fallback.getFeetDistances(slice(start, stop))[missing]
+        return block
+
+    def getMissingPairCount(self):
+        """
+        Number of population group/facility pairs not in the table.
+        """
+        if self._storage == "sparse":
+            return int(np.prod(self.getShape())) - self._values.shape[0]
+        count = 0
+        for start in range(0, self.getShape()[0], 1024):
+            count += int(np.isnan(self._matrix[start:start + 1024]).sum())
+        return count
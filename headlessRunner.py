@@ -0,0 +1,139 @@
+"""
+Command line runner for the burden calculation, without QGIS.
+
+Reads the population, facilities and sector to service tables from CSV or
+GeoPackage files (see HeadlessSBCalcDataBridge), calculates burden with
+SBCalculator.SBEngine and writes the same per-area and totals tables as the
+plugin (see burdenTableWriter), and with --sensitivity-csv the table of each
+facility's sensitivities. For example:
+
+    python headlessRunner.py blockgroups.gpkg facilities.csv sectors.csv \\
+        --population-index-field GEOID --population-field pop \\
+        --attain-factor-field income --facility-index-field id \\
+        --facility-sector-field sector --facility-lat-field lat \\
+        --facility-long-field lon --sector-field sector --epf-field epf \\
+        --zde-field zde --per-area-csv perArea.csv --totals-csv totals.csv
+
+Each run is independent, so many scenarios can be run as separate jobs at once.
+"""
+
+import argparse
+import sys
+
+try:
+    from . import burdenKernels
+    from . import burdenTableWriter
+    from . import HeadlessSBCalcDataBridge
+    from . import SBCalculator
+except ImportError:  # run as a script
+    import burdenKernels
+    import burdenTableWriter
+    import HeadlessSBCalcDataBridge
+    import SBCalculator
+
+
+def argumentParser():
+    parser = argparse.ArgumentParser(
+        description="Calculate social burden from CSV or GeoPackage files, without QGIS."
+    )
+
+    population = parser.add_argument_group("population groups")
+    population.add_argument("population", help="CSV or GeoPackage file of the population groups")
+    population.add_argument("--population-layer", help="layer of the GeoPackage to use")
+    population.add_argument("--population-index-field", required=True)
+    population.add_argument("--population-field", required=True, help="population counts")
+    population.add_argument("--attain-factor-field", required=True)
+    population.add_argument(
+        "--population-lat-field",
+        help="latitude field (northing with --feet-per-map-unit); "
+        "without it, the centroids of the geometries are used",
+    )
+    population.add_argument("--population-long-field", help="longitude (or easting) field")
+
+    facilities = parser.add_argument_group("facilities")
+    facilities.add_argument("facilities", help="CSV or GeoPackage file of the facilities")
+    facilities.add_argument("--facilities-layer", help="layer of the GeoPackage to use")
+    facilities.add_argument("--facility-index-field", required=True)
+    facilities.add_argument("--facility-sector-field", required=True)
+    facilities.add_argument(
+        "--facility-lat-field",
+        help="latitude field (northing with --feet-per-map-unit); "
+        "without it, the point geometries are used",
+    )
+    facilities.add_argument("--facility-long-field", help="longitude (or easting) field")
+    facilities.add_argument(
+        "--sl-reduce-field", help="service level reduction of each facility, in percent"
+    )
+
+    exclusion = parser.add_argument_group("exclusion profile")
+    exclusion.add_argument(
+        "--exclusion", help="GeoPackage file of polygons reducing the service levels of facilities in them"
+    )
+    exclusion.add_argument("--exclusion-layer", help="layer of the GeoPackage to use")
+    exclusion.add_argument(
+        "--sl-reduction", type=float, default=0.0, help="service level reduction in the polygons, in percent"
+    )
+    exclusion.add_argument(
+        "--sl-reduction-field", help="field of each polygon's own reduction, e.g. for hazard zones"
+    )
+
+    sectors = parser.add_argument_group("sector to service table")
+    sectors.add_argument("sector_to_service", help="CSV or GeoPackage file of the sector to service table")
+    sectors.add_argument("--sector-to-service-layer", help="layer of the GeoPackage to use")
+    sectors.add_argument("--sector-field", required=True)
+    sectors.add_argument("--epf-field", required=True, help="effort per foot")
+    sectors.add_argument("--zde-field", required=True, help="zero-distance effort")
+
+    outputs = parser.add_argument_group("outputs")
+    outputs.add_argument("--per-area-csv", required=True, help="per population group table")
+    outputs.add_argument("--totals-csv", required=True, help="totals table")
+    outputs.add_argument(
+        "--sensitivity-csv",
+        help="derivatives of the weighted total burden with respect to each facility's inputs",
+    )
+
+    options = parser.add_argument_group("calculation")
+    options.add_argument(
+        "--feet-per-map-unit",
+        type=float,
+        help="treat the coordinates as planar, in units of this many feet",
+    )
+    options.add_argument("--workers", type=int, default=1)
+    options.add_argument("--processes", action="store_true", help="use processes rather than threads")
+    options.add_argument("--distance-cache", help="folder to cache distance matrices in")
+    options.add_argument(
+        "--benefit-kernel", choices=sorted(burdenKernels.BENEFIT_KERNELS), default="broadcast"
+    )
+    options.add_argument("--population-tile-size", type=int, default=256)
+    return parser
+
+
+def main(argv=None):
+    args = argumentParser().parse_args(argv)
+
+    dataBridge = HeadlessSBCalcDataBridge.HeadlessSBCalcDataBridge()
+    dataBridge.importDataFromArguments(args)
+    dataBridge.createPopulationCentroids()
+    dataBridge.createFacilitiesAsPointsLayer()
+    dataBridge.createSLReductionArray()
+    dataBridge.createFacilityServiceLayer()
+
+    SBE = SBCalculator.SBEngine(dataBridge)
+    SBE.setBenefitKernel(args.benefit_kernel)
+    SBE.setPopulationTileSize(args.population_tile_size)
+    if dataBridge.getSensitivityCsvOutputPath():
+        # calculates the burden in the same pass
+        SBE.calculateBurdenSensitivity()
+    else:
+        SBE.calculateBurden()
+
+    BTW = burdenTableWriter.burdenTableWriter(dataBridge, SBE)
+    BTW.exportTable(BTW.generatePerAreaTable(), dataBridge.getPerCapitaCsvOutputPath())
+    BTW.exportTable(BTW.generateTotalsTable(), dataBridge.getAggregatedCsvOutputPath())
+    if dataBridge.getSensitivityCsvOutputPath():
+        BTW.exportTable(BTW.generateSensitivityTable(), dataBridge.getSensitivityCsvOutputPath())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
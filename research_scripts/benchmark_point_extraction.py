@@ -0,0 +1,104 @@
+"""
+Benchmark of reading point locations: the original per-feature extraction
+(a geometry lookup, asPoint() and a tuple per feature) against the single pass
+over WKB that QgsSBCalcDataBridge._extractPointLocations now does, decoded all
+at once by wkbGeometry.pointLocations.
+
+Without QGIS, only the decoding is compared: a struct.unpack per point into a
+list of tuples, against the bulk numpy decode. With QGIS (run it with the QGIS
+python, e.g. from the OSGeo4W shell), the whole extraction from a memory layer
+is timed as well.
+
+    python benchmark_point_extraction.py --points 1000000
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import wkbGeometry
+
+
+def timed(function, repeats):
+    """(best time in seconds, result) of repeats calls."""
+    best, result = np.inf, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def decodeBenchmark(numPoints, repeats):
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(-180, 180, (numPoints, 2))
+    wkbs = [struct.pack("<bIdd", 1, 1, x, y) for x, y in xy]
+
+    def perPoint():
+        points = [struct.unpack_from("<dd", i, 5) for i in wkbs]
+        pointsArray = np.array([(y, x) for x, y in points])
+        return pointsArray[:, 0], pointsArray[:, 1]
+
+    def bulk():
+        return wkbGeometry.pointLocations(wkbs, "benchmark")
+
+    oldTime, old = timed(perPoint, repeats)
+    newTime, new = timed(bulk, repeats)
+    assert np.array_equal(old[0], new[0]) and np.array_equal(old[1], new[1])
+    print(f"WKB decode, {numPoints} points:")
+    print(f"    per point: {oldTime:.3f} s")
+    print(f"    bulk:      {newTime:.3f} s  ({oldTime / newTime:.1f}x)")
+
+
+def qgisBenchmark(numPoints, repeats):
+    try:
+        from qgis.core import QgsApplication, QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer
+        from qgis.core import QgsFeatureRequest
+    except ImportError:
+        print("QGIS is not available; skipping the layer benchmark.")
+        return
+
+    application = QgsApplication([], False)
+    application.initQgis()
+    layer = QgsVectorLayer("Point?crs=EPSG:4326", "points", "memory")
+    rng = np.random.default_rng(0)
+    features = []
+    for x, y in rng.uniform(-180, 180, (numPoints, 2)):
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+
+    def original():
+        geometryList = [layer.getGeometry(i.id()) for i in layer.getFeatures()]
+        pointList = [i.asPoint() for i in geometryList]
+        pointsArray = np.array([(i.y(), i.x()) for i in pointList])
+        return pointsArray[:, 0], pointsArray[:, 1]
+
+    def singlePass():
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes([])
+        wkbs = [bytes(i.geometry().asWkb()) for i in layer.getFeatures(request)]
+        return wkbGeometry.pointLocations(wkbs, "benchmark")
+
+    oldTime, old = timed(original, repeats)
+    newTime, new = timed(singlePass, repeats)
+    assert np.array_equal(old[0], new[0]) and np.array_equal(old[1], new[1])
+    print(f"Memory layer, {numPoints} points:")
+    print(f"    original:    {oldTime:.3f} s")
+    print(f"    single pass: {newTime:.3f} s  ({oldTime / newTime:.1f}x)")
+    application.exitQgis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--points", type=int, default=1000000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    decodeBenchmark(args.points, args.repeats)
+    qgisBenchmark(args.points, args.repeats)
@@ -1,4 +1,5 @@
 import os 
+import sys
 import argparse
 import pdb
 import json
@@ -8,9 +9,21 @@ import numpy as np
 import pandas as pd
 
 
-def importPerCapitaPerFacilityPerServiceBenefitFiles(datapath:str, indexpath:str): 
-    with open(datapath, 'rb') as f: 
-        tbl = np.load(f)
+# a benefit total that cancels to less than this fraction of itself when a facility is
+# taken out is taken to be 0 (so the burden is infinite, as it would be without that facility)
+CANCELLATION_TOLERANCE = 1e-12
+
+
+def importPerCapitaPerFacilityPerServiceBenefitFiles(datapath:str, indexpath:str, mmap=False): 
+    """
+    If mmap is True, the (n,m,s) benefits are memory-mapped read-only instead of
+    read into memory, so that they can be processed a few population groups at a time.
+    """
+    if mmap: 
+        tbl = np.load(datapath, mmap_mode="r")
+    else: 
+        with open(datapath, 'rb') as f: 
+            tbl = np.load(f)
     with open(indexpath, 'r') as f: 
         indices = json.load(f)
     return(tbl, indices)
@@ -39,18 +52,17 @@ def calculateNminus1PopulationServiceBurdens(benefits:np.array):
     with an array of shape (n,m,s) because we want an (n,s)-size 
     array for all m facilities.
     
+    The total benefit over all facilities is summed once; the benefit without
+    facility j is then just (total - benefit_j), so the burden without it is 
+    1/(total - benefit_j). No facility's benefits get summed more than once.
     '''
-    ret = np.zeros_like(benefits)
-    mask = np.ones(benefits.shape[1], dtype=bool)
-    
-    #for all m facilities, calculate burden without that facility
-    for i in range(benefits.shape[1]): 
-        mask[i] = False
-        facilityslice = benefits[:,mask, :]
-        ret[:,i,:] = 1/(np.sum(facilityslice, axis=1))
-
-        mask[i] = True
-    return ret
+    total = np.sum(benefits, axis=1, keepdims=True) #(n,1,s)
+    remaining = total - benefits #(n,m,s)
+    
+    #if facility j was the only one providing a service, what's left is rounding error
+    remaining[np.abs(remaining) <= CANCELLATION_TOLERANCE * np.abs(total)] = 0
+    with np.errstate(divide="ignore"): 
+        return 1/remaining
     
 def calculateFacilityMarginalBurdenImprovement(baseline_burden, nminus1_burden): 
     """
@@ -70,18 +82,21 @@ def calculateFacilityMarginalBurdenImprovement(baseline_burden, nminus1_burden):
     
 def formatMarginalBurdenImprovement(
         marginal_improvements:np.array,
-        indexdata:dict
+        indexdata:dict,
+        population_rows=slice(None)
     ): 
     """
     Reformat the marginal burden improvement numpy array into a pandas dataframe 
     whose 0th axis is a joint index of population and facility, and the columns 
     are services.
     
+    population_rows: which population groups marginal_improvements is for, if
+    it is only for some of them (see iterMarginalBurdenImprovements).
     """
     
     reshaped_improvements = marginal_improvements.reshape((-1, marginal_improvements.shape[2]))
     
-    population_index = indexdata["population indices"]
+    population_index = indexdata["population indices"][population_rows]
     facility_index = indexdata["facility indices"]
     service_index = indexdata["service indices"]
     
@@ -98,6 +113,29 @@ def formatMarginalBurdenImprovement(
     return df
 
 
+def iterMarginalBurdenImprovements(benefits:np.array, indexdata:dict, chunk_size=256): 
+    """
+    The whole n-1 pipeline (baseline burden, n-1 burdens, marginal improvements,
+    formatting), a chunk of chunk_size population groups at a time. 
+    
+    benefits can be memory-mapped (see importPerCapitaPerFacilityPerServiceBenefitFiles),
+    in which case only a (chunk_size, m, s) block of it is ever in memory.
+    
+    Yields a dataframe (as formatMarginalBurdenImprovement) per chunk, in population order.
+    """
+    for start in range(0, benefits.shape[0], chunk_size): 
+        rows = slice(start, min(start + chunk_size, benefits.shape[0]))
+        chunk = np.asarray(benefits[rows])
+        with np.errstate(divide="ignore"): 
+            baseline_burden = calculatePopulationServiceBurden(chunk)
+        nMinus1_burden = calculateNminus1PopulationServiceBurdens(chunk)
+        yield formatMarginalBurdenImprovement(
+            calculateFacilityMarginalBurdenImprovement(baseline_burden, nMinus1_burden),
+            indexdata,
+            rows
+        )
+
+
 if __name__ == "__main__": 
     p = argparse.ArgumentParser(
         prog="n-1 burden evaluator",
@@ -112,30 +150,24 @@ if __name__ == "__main__":
     p.add_argument("tabledata")
     p.add_argument("indexdata")
     p.add_argument("-o", "--outpath") 
+    p.add_argument(
+        "-c", "--chunksize", type=int, default=256,
+        help="number of population groups processed at a time"
+    )
     
     args = p.parse_args()
     
-    #read in the data
-    benefits, indices = importPerCapitaPerFacilityPerServiceBenefitFiles(args.tabledata, args.indexdata)
-    
-    #get baseline burden incorporating all facilities
-    baseline_burden = calculatePopulationServiceBurden(benefits)
-    
-    #get n-1 burden over all populations, facilities, and services
-    nMinus1_burden = calculateNminus1PopulationServiceBurdens(benefits)
-    
-    #get the difference between the baseline and n-1 burden
-    marginal_burden_improvement = calculateFacilityMarginalBurdenImprovement(baseline_burden, nMinus1_burden)
-    
-    #format that marginal burden improvement for export to csv
-    out = formatMarginalBurdenImprovement(
-        marginal_burden_improvement, 
-        indices
+    #memory-map the data, so it never has to fit in memory all at once
+    benefits, indices = importPerCapitaPerFacilityPerServiceBenefitFiles(
+        args.tabledata, args.indexdata, mmap=True
     )
-   
     
-    #export to csv
-    if args.outpath: 
-        out.to_csv(args.outpath)
-    else: 
-        out.to_csv()
+    #baseline burden, n-1 burden and the difference between them, a chunk of 
+    #population groups at a time, each chunk appended to the csv as soon as it is done
+    outfile = open(args.outpath, "w", newline="") if args.outpath else sys.stdout
+    try: 
+        for i, out in enumerate(iterMarginalBurdenImprovements(benefits, indices, args.chunksize)): 
+            out.to_csv(outfile, header=(i == 0))
+    finally: 
+        if args.outpath: 
+            outfile.close()
@@ -207,6 +207,12 @@ class SocialBurdenCalculator:
         )
         self.dlg.lineEdit_outFileRencatOutput.setText(filename)
 
+    def select_output_file_sensitivity(self):
+        filename, _filter = QFileDialog.getSaveFileName(
+            self.dlg, "Select facility sensitivity output file ", "", "*.csv"
+        )
+        self.dlg.lineEdit_outFileSensitivity.setText(filename)
+
     def run(self):
         """Run method that performs all the real work"""
 
@@ -227,6 +233,9 @@ class SocialBurdenCalculator:
             self.dlg.pushButton_rencatOutput.clicked.connect(
                 self.select_output_file_rencat_output
             )
+            self.dlg.pushButton_sensitivityOutput.clicked.connect(
+                self.select_output_file_sensitivity
+            )
 
         # show the dialog
         self.dlg.show()
@@ -257,7 +266,11 @@ class SocialBurdenCalculator:
             # Use the dataBridge object, and the information it has access to or contains
             # to calculate burden values, which are stored for later access.
             SBC = SBCalculator.SBCalculator(dataBridge)
-            SBC.calculateBurden()
+            if dataBridge.getExportSensitivity():
+                # calculates the burden in the same pass
+                SBC.calculateBurdenSensitivity()
+            else:
+                SBC.calculateBurden()
 
             # Export burden information and other useful details
             # to temporary files that can be loaded as a layer. This
@@ -277,6 +290,16 @@ class SocialBurdenCalculator:
                 BTW.exportTable(perAreaDf, dataBridge.getPerCapitaCsvOutputPath())
                 BTW.exportTable(allAreaDf, dataBridge.getAggregatedCsvOutputPath())
 
+            # Per-facility sensitivities of the weighted total burden, if requested
+            if dataBridge.getExportSensitivity():
+                sensitivityDf = BTW.generateSensitivityTable()
+                tempfile_sensitivity = BTW.exportTableAsTempFile(sensitivityDf)
+                dataBridge.importLayerFromBurdenTempFile(
+                    tempfile_sensitivity, "facilitySensitivity"
+                )
+                if dataBridge.getSensitivityCsvOutputPath():
+                    BTW.exportTable(sensitivityDf, dataBridge.getSensitivityCsvOutputPath())
+
             # Export inputs for rencat, if desired
             if dataBridge.getExportToRencat():
                 rencatIO.rencatInputWriter(dataBridge).createRencatInputFile()
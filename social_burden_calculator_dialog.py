@@ -112,6 +112,9 @@ class SocialBurdenCalculatorDialog(QtWidgets.QDialog, FORM_CLASS):
     def getExclusionServiceLevelReduction(self): 
         #this needs to stay as a string for downstream reasons
         return str(self.spinBox_exclusionPctReduction.value())
+
+    def getExclusionReductionField(self): 
+        return str(self.FieldComboBox_exclusionReduction.currentText()) #empty for none
         
         
         
@@ -137,4 +140,20 @@ class SocialBurdenCalculatorDialog(QtWidgets.QDialog, FORM_CLASS):
         return self.checkBox_exportAsRencatOutput.isChecked()
         
     def getExportAsRencatOutputPath(self): 
-        return self.lineEdit_outFileRencatOutput.text()
\ No newline at end of file
+        return self.lineEdit_outFileRencatOutput.text()
+        
+    def exportSensitivity(self): 
+        return self.checkBox_exportSensitivity.isChecked()
+        
+    def getSensitivityCsvOutputPath(self): 
+        return self.lineEdit_outFileSensitivity.text()
+
+    # ----------- performance getters ------------
+    def getWorkers(self): 
+        return int(self.spinBox_workers.value())
+
+    def getUseProcesses(self): 
+        return self.checkBox_useProcesses.isChecked()
+
+    def getCacheDistances(self): 
+        return self.checkBox_cacheDistances.isChecked()
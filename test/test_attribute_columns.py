@@ -0,0 +1,84 @@
+# coding=utf-8
+"""Tests for attributeColumns: typed columns, their null masks, and the row
+gathering used to join the sector to service table.
+"""
+
+import unittest
+
+import numpy as np
+
+import attributeColumns
+
+
+class FakeNull:
+    """Stands in for a NULL QVariant."""
+
+
+NULL = FakeNull()
+
+
+def isNull(value):
+    return value is None or isinstance(value, FakeNull)
+
+
+class AttributeColumnsTest(unittest.TestCase):
+    """Test typed columns and their null masks."""
+
+    def test_numeric_columns(self):
+        """Numeric columns are typed, with nulls as 0s, as the old getters gave."""
+        rows = [(1, 2.5, "a"), (NULL, NULL, NULL), (3, None, "c")]
+        columns = attributeColumns.columnsFromRows(
+            rows, ["count", "level", "name"], ["int", "float", "string"], isNull
+        )
+        count, level, name = columns["count"], columns["level"], columns["name"]
+
+        self.assertEqual(count.getValues().dtype, np.int64)
+        np.testing.assert_array_equal(count.asNumeric(), [1, 0, 3])
+        np.testing.assert_array_equal(count.getNullMask(), [False, True, False])
+        self.assertEqual(level.getValues().dtype, np.float64)
+        np.testing.assert_array_equal(level.asNumeric(), [2.5, 0, 0])
+        self.assertEqual(count.asNumeric(np.float64).dtype, np.float64)
+
+        self.assertEqual(name.asList(NULL), ["a", NULL, "c"])
+        self.assertEqual(count.asList(NULL), [1, NULL, 3])
+        self.assertIsInstance(count.asList()[0], int)
+
+    def test_string_numbers(self):
+        """Text fields holding numbers convert; other text raises ValueError."""
+        numbers = attributeColumns.columnFromValues(["1.5", NULL, "2"], "string", isNull)
+        np.testing.assert_array_equal(numbers.asNumeric(), [1.5, 0, 2])
+        words = attributeColumns.columnFromValues(["x", "2"], "string", isNull)
+        self.assertRaises(ValueError, words.asNumeric)
+        self.assertRaises(ValueError, attributeColumns.columnFromValues, [1], "date", isNull)
+
+    def test_empty(self):
+        """A layer without features gives empty columns."""
+        columns = attributeColumns.columnsFromRows([], ["a", "b"], ["int", "string"], isNull)
+        self.assertEqual(columns["a"].asNumeric().shape, (0,))
+        self.assertEqual(columns["b"].asList(), [])
+
+    def test_take(self):
+        """Taken rows keep their types; rows of -1 are nulls."""
+        level = attributeColumns.columnFromValues([2.5, NULL, 4.0], "float", isNull)
+        taken = level.take(np.array([2, -1, 0, 1]))
+        np.testing.assert_array_equal(taken.asNumeric(), [4.0, 0, 2.5, 0])
+        np.testing.assert_array_equal(taken.getNullMask(), [False, True, False, True])
+        name = attributeColumns.columnFromValues(["a", "b"], "string", isNull)
+        self.assertEqual(name.take(np.array([-1, 1])).asList(NULL), [NULL, "b"])
+
+    def test_first_matching_rows(self):
+        """Keys get the first matching table row, and unmatched keys are counted."""
+        rows, unmatched = attributeColumns.firstMatchingRows(
+            ["clinic", "bank", None, "grocery", "clinic", 3, "bank"],
+            ["grocery", "clinic", "clinic", "3", None],
+        )
+        np.testing.assert_array_equal(rows, [1, -1, -1, 0, 1, 3, -1])
+        self.assertEqual(unmatched, {"bank": 2, None: 1})
+        rows, unmatched = attributeColumns.firstMatchingRows([], ["grocery"])
+        self.assertEqual((rows.shape, unmatched), ((0,), {}))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(AttributeColumnsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,74 @@
+# coding=utf-8
+"""Tests for burdenCriticality: the facility criticality ranking, checked
+against recalculating the burden with each facility removed.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenCriticality
+
+from .utilities import makeProblem
+
+
+class BurdenCriticalityTest(unittest.TestCase):
+    """Test the facility criticality ranking."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeProblem(n=29, m=13, s=3)
+        p = self.problem
+        p["SLReduce"][:] = 0
+        # facility 6 is the only provider of service 2
+        p["serviceLevels"][:, 2] = 0
+        p["serviceLevels"][6, 2] = 4
+        self.SLR = burdenKernels.reducedServiceLevels(p["SLReduce"], p["serviceLevels"])
+        self.population = np.random.default_rng(1).integers(0, 1000, 29).astype(float)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def weightedBurden(self, keep):
+        p = self.problem
+        with np.errstate(divide="ignore"):
+            burden = burdenKernels.blockedBurden(
+                p["distances"][:, keep], p["zde"][keep], p["epf"][keep], self.SLR[keep],
+                p["attainFactors"],
+            )
+        return np.sum(self.population.reshape((-1, 1)) * burden, axis=0)
+
+    def criticality(self, **kwargs):
+        p = self.problem
+        return burdenCriticality.facilityCriticality(
+            lambda rows: p["distances"][rows], 29, p["zde"], p["epf"], self.SLR,
+            p["attainFactors"], self.population, **kwargs
+        )
+
+    def test_matches_removing_each_facility(self):
+        """Each entry is the increase a recalculation without that facility shows."""
+        allFacilities = np.arange(13)
+        baseline = self.weightedBurden(allFacilities)
+        criticality = self.criticality(tileSize=4)
+        for j in allFacilities:
+            increase = self.weightedBurden(np.delete(allFacilities, j)) - baseline
+            np.testing.assert_allclose(criticality[j, :2], increase[:2], rtol=1e-8)
+        self.assertTrue(np.isinf(criticality[6, 2]))
+        np.testing.assert_array_equal(np.delete(criticality[:, 2], 6), 0)
+
+    def test_workers_and_top_facilities(self):
+        """Threads give exactly what one thread does, and the sole provider ranks first."""
+        single = self.criticality(tileSize=5)
+        np.testing.assert_array_equal(self.criticality(tileSize=5, workers=3), single)
+        top = burdenCriticality.topFacilities(single, 4)
+        self.assertEqual(top[0], 6)
+        total = single[:, :2].sum(axis=1)
+        self.assertTrue(np.all(np.diff(total[top[1:]]) <= 0))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenCriticalityTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
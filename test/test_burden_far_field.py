@@ -0,0 +1,95 @@
+# coding=utf-8
+"""Tests for burdenFarField: the far-field burden approximation, checked against
+the exact burden and its error tolerance.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenFarField
+
+
+def makeLocatedProblem(n=90, m=700, s=3, seed=0):
+    """Population groups and facilities over a few states, with three sectors."""
+    rng = np.random.default_rng(seed)
+    sector = rng.integers(0, 3, m)
+    return {
+        "popLat": rng.uniform(30, 40, n),
+        "popLong": rng.uniform(-110, -95, n),
+        "facLat": rng.uniform(30, 40, m),
+        "facLong": rng.uniform(-110, -95, m),
+        "zde": np.array([1.0, 5.0, 10.0])[sector],
+        "epf": np.array([1e-3, 1e-4, 1e-5])[sector],
+        "SLR": rng.integers(0, 6, (m, s)).astype(float),
+        "attainFactors": rng.uniform(0.5, 2, n),
+    }
+
+
+def exactBurden(p):
+    distances = (
+        burdenKernels.greatCircleDistances(p["popLat"], p["facLat"], p["popLong"], p["facLong"])
+        * burdenKernels.METERS_TO_FEET
+    )
+    return burdenKernels.blockedBurden(
+        distances, p["zde"], p["epf"], p["SLR"], p["attainFactors"], kernel="gemm"
+    )
+
+
+def farField(p, **kwargs):
+    return burdenFarField.farFieldBurden(
+        p["popLat"], p["popLong"], p["facLat"], p["facLong"],
+        p["zde"], p["epf"], p["SLR"], p["attainFactors"], **kwargs
+    )
+
+
+class BurdenFarFieldTest(unittest.TestCase):
+    """Test the far-field (tree) burden approximation."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeLocatedProblem()
+        self.exact = exactBurden(self.problem)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def test_zero_tolerance_is_exact(self):
+        """With no tolerance every facility is evaluated, whatever the tile and leaf sizes."""
+        for tileSize, leafSize in [(7, 3), (256, 32), (1000, 1000)]:
+            result = farField(self.problem, tolerance=0, tileSize=tileSize, leafSize=leafSize)
+            np.testing.assert_allclose(result, self.exact, rtol=1e-12)
+
+    def test_error_within_tolerance(self):
+        """Every burden is within the requested relative error of the exact one."""
+        for tolerance in [1e-4, 1e-2, 0.2]:
+            result = farField(self.problem, tolerance=tolerance, tileSize=16, leafSize=4)
+            self.assertLessEqual(np.max(np.abs(result / self.exact - 1)), tolerance)
+
+    def test_threads_match_one_thread(self):
+        """Spreading the tiles over threads gives bit-for-bit the single-thread result."""
+        single = farField(self.problem, tolerance=1e-2, tileSize=16, leafSize=4)
+        for workers in [2, 5]:
+            threaded = farField(self.problem, tolerance=1e-2, tileSize=16, leafSize=4, workers=workers)
+            np.testing.assert_array_equal(threaded, single)
+
+    def test_tree_covers_every_point(self):
+        """Every facility is in exactly one leaf, within its leaf's radius of the center."""
+        p = self.problem
+        vectors = burdenKernels.unitVectors(p["facLat"], p["facLong"])
+        tree = burdenFarField.PointTree(vectors, p["SLR"], leafSize=5)
+        leaves = tree.leaves()
+        members = np.concatenate([tree.order[tree.start[i]:tree.stop[i]] for i in leaves])
+        np.testing.assert_array_equal(np.sort(members), np.arange(vectors.shape[0]))
+        self.assertTrue(np.all(tree.stop[leaves] - tree.start[leaves] <= 5))
+        np.testing.assert_allclose(tree.SLRsums[0], p["SLR"].sum(axis=0))
+        with self.assertRaises(ValueError):
+            farField(p, tolerance=-1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenFarFieldTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
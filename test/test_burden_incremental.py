@@ -0,0 +1,80 @@
+# coding=utf-8
+"""Tests for burdenIncremental: updates of the summed benefits when facilities
+are added, removed or changed, checked against full recalculations.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenIncremental
+
+from .utilities import makeProblem
+
+
+class BurdenIncrementalTest(unittest.TestCase):
+    """Test incremental updates of the summed benefits."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeProblem(n=31, m=12, s=3)
+        p = self.problem
+        self.SLR = burdenKernels.reducedServiceLevels(p["SLReduce"], p["serviceLevels"])
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def sumsWithout(self, facilities):
+        p = self.problem
+        keep = np.setdiff1d(np.arange(p["zde"].shape[0]), facilities)
+        return burdenIncremental.benefitSums(
+            p["distances"][:, keep], p["zde"][keep], p["epf"][keep], self.SLR[keep], tileSize=5
+        )
+
+    def facilityTerm(self, j):
+        p = self.problem
+        return burdenIncremental.facilityBenefits(
+            p["distances"][:, j], p["zde"][j], p["epf"][j], self.SLR[j]
+        )
+
+    def test_full_sums_give_the_burden(self):
+        """The summed benefits reproduce the full burden calculation."""
+        p = self.problem
+        incremental = burdenIncremental.IncrementalBenefits(self.sumsWithout([]))
+        expected = burdenKernels.blockedBurden(
+            p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"]
+        )
+        np.testing.assert_allclose(incremental.getBurden(p["attainFactors"]), expected, rtol=1e-12)
+
+    def test_updates_match_full_recalculation(self):
+        """Removing, re-adding and changing facilities matches recalculating from scratch."""
+        incremental = burdenIncremental.IncrementalBenefits(self.sumsWithout([]))
+        incremental.update(removed=self.facilityTerm(3))
+        incremental.update(removed=self.facilityTerm(7))
+        self.assertLess(incremental.relativeDifference(self.sumsWithout([3, 7])), 1e-12)
+
+        incremental.update(added=self.facilityTerm(3))
+        self.assertLess(incremental.relativeDifference(self.sumsWithout([7])), 1e-12)
+
+        # "changing" facility 0 to a copy of facility 7
+        incremental.update(removed=self.facilityTerm(0), added=self.facilityTerm(7))
+        self.assertLess(incremental.relativeDifference(self.sumsWithout([0])), 1e-12)
+
+    def test_removing_only_provider_gives_infinite_burden(self):
+        """Sums that cancel out are exactly 0, so the burden is infinite, as when recalculated."""
+        p = self.problem
+        p["serviceLevels"][:, 2] = 0
+        p["serviceLevels"][4, 2] = 3
+        self.SLR = burdenKernels.reducedServiceLevels(np.zeros(12), p["serviceLevels"])
+        incremental = burdenIncremental.IncrementalBenefits(self.sumsWithout([]))
+        incremental.update(removed=self.facilityTerm(4))
+        np.testing.assert_array_equal(incremental.getBenefitSums()[:, 2], 0)
+        self.assertTrue(np.all(np.isinf(incremental.getBurden(p["attainFactors"])[:, 2])))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenIncrementalTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,197 @@
+# coding=utf-8
+"""Tests for burdenKernels: the tiled, threaded and gemm burden kernels and the
+distance kernels, checked against the original untiled (n,m,s) calculation.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+
+from .utilities import makeProblem
+
+
+def referenceBurden(p):
+    """The untiled (n,m,s) calculation, as originally written in SBCalculator."""
+    denominator = p["zde"] + p["epf"] * p["distances"]
+    SLR = (
+        (1 - p["SLReduce"] * 1e-2).reshape((-1, 1)) * p["serviceLevels"]
+    ).transpose()
+    numerator = (
+        SLR.reshape((SLR.shape[0], SLR.shape[1], 1)) * p["attainFactors"]
+    ).transpose()
+    benefits = numerator / (
+        denominator.reshape((denominator.shape[0], denominator.shape[1], 1))
+    )
+    return 1 / np.sum(benefits, axis=1)
+
+
+class BurdenKernelsTest(unittest.TestCase):
+    """Test the numpy burden kernels."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeProblem()
+        self.SLR = burdenKernels.reducedServiceLevels(
+            self.problem["SLReduce"], self.problem["serviceLevels"]
+        )
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def test_population_tiles_cover_all_rows(self):
+        """Tiles are contiguous, in order, and cover every population group once."""
+        tiles = list(burdenKernels.populationTiles(10, 3))
+        self.assertEqual(
+            [(i.start, i.stop) for i in tiles], [(0, 3), (3, 6), (6, 9), (9, 10)]
+        )
+        self.assertEqual(len(list(burdenKernels.populationTiles(10, None))), 1)
+        with self.assertRaises(ValueError):
+            list(burdenKernels.populationTiles(10, 0))
+
+    def test_blocked_burden_matches_untiled(self):
+        """Any tile size gives bit-for-bit the untiled result."""
+        p = self.problem
+        expected = referenceBurden(p)
+        for tileSize in [None, 1, 7, 57, 1000]:
+            result = burdenKernels.blockedBurden(
+                p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"],
+                tileSize=tileSize,
+            )
+            np.testing.assert_array_equal(result, expected)
+
+    def test_blocked_burden_facility_benefits(self):
+        """The researcher per-facility benefits are still filled in when tiling."""
+        p = self.problem
+        benefits = np.empty(p["distances"].shape + (self.SLR.shape[1],))
+        burden = burdenKernels.blockedBurden(
+            p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"],
+            tileSize=10, facilityBenefitsOut=benefits,
+        )
+        np.testing.assert_array_equal(1 / np.sum(benefits, axis=1), burden)
+
+    def test_gemm_benefits_match_broadcast(self):
+        """The matrix-product kernel agrees with the broadcast kernel to rounding."""
+        p = self.problem
+        broadcast = burdenKernels.broadcastBenefits(
+            p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"]
+        )
+        gemm = burdenKernels.gemmBenefits(
+            p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"]
+        )
+        np.testing.assert_allclose(gemm, broadcast, rtol=1e-12)
+
+    def test_gemm_burden_matches_untiled(self):
+        """The blocked gemm path agrees with the original untiled burden to rounding."""
+        p = self.problem
+        result = burdenKernels.blockedBurden(
+            p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"],
+            tileSize=8, kernel="gemm",
+        )
+        np.testing.assert_allclose(result, referenceBurden(p), rtol=1e-12)
+        with self.assertRaises(ValueError):
+            burdenKernels.blockedBurden(
+                p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"],
+                kernel="no such kernel",
+            )
+
+    def test_threaded_burden_is_deterministic(self):
+        """Spreading the tiles over threads gives bit-for-bit the single-thread result."""
+        p = self.problem
+        expected = referenceBurden(p)
+        for kernel in ["broadcast", "gemm"]:
+            single = burdenKernels.blockedBurden(
+                p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"],
+                tileSize=5, kernel=kernel,
+            )
+            for workers in [2, 3, 8]:
+                threaded = burdenKernels.blockedBurden(
+                    p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"],
+                    tileSize=5, kernel=kernel, workers=workers,
+                )
+                np.testing.assert_array_equal(threaded, single)
+            np.testing.assert_allclose(single, expected, rtol=1e-12)
+
+    def test_threaded_sums_are_deterministic(self):
+        """Sums over the tiles are bit-for-bit the same for any number of threads."""
+        values = np.random.default_rng(3).uniform(-1, 1, (1000, 7)) * 10.0 ** np.arange(7)
+
+        def tileSums(rows):
+            return np.sum(values[rows], axis=0), len(range(1000)[rows])
+
+        zeros = (np.zeros(7), 0)
+        single = burdenKernels.sumOverTiles(tileSums, zeros, 1000, tileSize=9)
+        for workers in [2, 3, 8]:
+            threaded = burdenKernels.sumOverTiles(tileSums, zeros, 1000, tileSize=9, workers=workers)
+            np.testing.assert_array_equal(threaded[0], single[0])
+        np.testing.assert_allclose(single[0], values.sum(axis=0), rtol=1e-12)
+        self.assertEqual(single[1], 1000)
+        self.assertIs(burdenKernels.sumOverTiles(tileSums, zeros, 0, tileSize=9), zeros)
+
+    def test_threaded_distances_match(self):
+        """Tiled, threaded distance filling matches calling the distance function once."""
+        rng = np.random.default_rng(1)
+        lat1, long1 = rng.uniform(30, 40, 23), rng.uniform(-110, -100, 23)
+        lat2, long2 = rng.uniform(30, 40, 11), rng.uniform(-110, -100, 11)
+
+        def distanceFunction(la1, la2, lo1, lo2):
+            return np.hypot(la1.reshape((-1, 1)) - la2, lo1.reshape((-1, 1)) - lo2)
+
+        expected = distanceFunction(lat1, lat2, long1, long2)
+        for workers in [1, 4]:
+            result = burdenKernels.blockedDistances(
+                distanceFunction, lat1, lat2, long1, long2, tileSize=4, workers=workers
+            )
+            np.testing.assert_array_equal(result, expected)
+
+    def test_unit_vector_distances_match_haversine(self):
+        """The unit-vector kernel agrees with the haversine formula, in feet."""
+        rng = np.random.default_rng(2)
+        lat1, long1 = rng.uniform(25, 49, 31), rng.uniform(-124, -67, 31)
+        lat2, long2 = rng.uniform(25, 49, 17), rng.uniform(-124, -67, 17)
+        # include some very close pairs
+        lat2[:5], long2[:5] = lat1[:5] + 1e-6, long1[:5] - 1e-6
+
+        haversine = burdenKernels.DISTANCE_KERNELS["haversine"](lat1, lat2, long1, long2)
+        np.testing.assert_array_equal(
+            haversine,
+            burdenKernels.greatCircleDistances(lat1, lat2, long1, long2)
+            * burdenKernels.METERS_TO_FEET,
+        )
+        unitVector = burdenKernels.DISTANCE_KERNELS["unitVector"](lat1, lat2, long1, long2)
+        # within a few inches for the very close pairs, and to rounding for distant ones
+        np.testing.assert_allclose(unitVector, haversine, rtol=1e-9, atol=0.5)
+        self.assertTrue(np.all(unitVector >= 0))
+
+    def test_planar_distances(self):
+        """The planar kernel gives Euclidean distances, scaled to feet, even far from the origin."""
+        rng = np.random.default_rng(3)
+        # state plane style coordinates: millions of map units
+        y1, x1 = rng.uniform(1e6, 1.2e6, 19), rng.uniform(2e6, 2.2e6, 19)
+        y2, x2 = rng.uniform(1e6, 1.2e6, 13), rng.uniform(2e6, 2.2e6, 13)
+        y2[:3], x2[:3] = y1[:3] + 0.5, x1[:3]
+
+        expected = np.hypot(y1.reshape((-1, 1)) - y2, x1.reshape((-1, 1)) - x2)
+        result = burdenKernels.DISTANCE_KERNELS["planar"](y1, y2, x1, x2)
+        np.testing.assert_allclose(result, expected, rtol=1e-9, atol=1e-3)
+        np.testing.assert_allclose(
+            burdenKernels.planarFeetDistances(y1, y2, x1, x2, feetPerUnit=3.28084),
+            expected * 3.28084,
+            rtol=1e-9,
+            atol=1e-3,
+        )
+
+    def test_population_weights(self):
+        """Population over attainment, and 0 for groups with no attainment."""
+        weight = burdenKernels.populationWeights(
+            np.array([2.0, 0.0, 0.5]), np.array([10.0, 7.0, 3.0])
+        )
+        np.testing.assert_array_equal(weight, [5.0, 0.0, 6.0])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenKernelsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
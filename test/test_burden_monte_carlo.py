@@ -0,0 +1,119 @@
+# coding=utf-8
+"""Tests for burdenMonteCarlo: the streaming moment and quantile accumulators,
+and the Monte Carlo burden against a draw by draw calculation.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenMonteCarlo
+
+from .utilities import makeProblem
+
+
+class BurdenMonteCarloTest(unittest.TestCase):
+    """Test the streaming accumulators and the Monte Carlo burden."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeProblem(n=23, m=9, s=3, seed=6)
+        p = self.problem
+        self.SLR = burdenKernels.reducedServiceLevels(p["SLReduce"], p["serviceLevels"])
+        self.population = np.random.default_rng(7).integers(1, 1000, 23).astype(float)
+        self.groups = np.array([0, 1, 2, 0, 1, 2, 0, 1, 2])
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def run_monte_carlo(self, specs, numDraws, batchSize):
+        p = self.problem
+        return burdenMonteCarlo.monteCarloBurden(
+            lambda rows: p["distances"][rows], 23, p["zde"], p["epf"], self.SLR,
+            p["attainFactors"], self.population, specs, numDraws,
+            facilityGroups=self.groups, batchSize=batchSize, seed=3, tileSize=5, workers=2,
+        )
+
+    def reference_burdens(self, specs, numDraws):
+        """Every draw's burden, recalculated one draw at a time from the same random draws."""
+        p = self.problem
+        rng = np.random.default_rng(3)
+        levels, zde, epf, attain = burdenMonteCarlo._drawBatch(
+            rng, specs, numDraws, self.SLR, p["zde"], p["epf"], p["attainFactors"], self.groups
+        )
+        zde = np.tile(p["zde"], (numDraws, 1)) if zde is None else zde
+        epf = np.tile(p["epf"], (numDraws, 1)) if epf is None else epf
+        return np.array([
+            burdenKernels.blockedBurden(p["distances"], zde[k], epf[k], levels[k], attain[k])
+            for k in range(numDraws)
+        ])
+
+    def test_streaming_moments(self):
+        """Welford's mean and variance match numpy's; infinite values are counted apart."""
+        values = np.random.default_rng(0).normal(3, 2, (200, 4, 2))
+        values[::4, 0, 0] = np.inf
+        moments = burdenMonteCarlo.StreamingMoments((4, 2))
+        for value in values:
+            moments.update(value)
+        finite = values[:, 1:, :]
+        np.testing.assert_allclose(moments.getMean()[1:], finite.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(moments.getVariance()[1:], finite.var(axis=0, ddof=1), rtol=1e-10)
+        self.assertAlmostEqual(moments.getInfiniteFraction()[0, 0], 0.25)
+        self.assertAlmostEqual(moments.getMean()[0, 0], np.mean(np.delete(values[:, 0, 0], np.s_[::4])))
+
+    def test_streaming_quantiles(self):
+        """P-squared estimates are exact for few values and close to the sample quantiles for many."""
+        rng = np.random.default_rng(1)
+        quantiles = burdenMonteCarlo.StreamingQuantiles((50,), (0.1, 0.5, 0.9))
+        values = rng.normal(0, 1, (4000, 50))
+        for value in values[:3]:
+            quantiles.update(value)
+        np.testing.assert_allclose(
+            quantiles.getQuantiles(), np.quantile(values[:3], [0.1, 0.5, 0.9], axis=0)
+        )
+        for value in values[3:]:
+            quantiles.update(value)
+        exact = np.quantile(values, [0.1, 0.5, 0.9], axis=0)
+        np.testing.assert_allclose(quantiles.getQuantiles(), exact, atol=0.1)
+
+    def test_matches_draw_by_draw_calculation(self):
+        """Batched draws (with ZDE/EPF fixed or varying) match recalculating each draw."""
+        for specs in [
+            {"serviceLevels": ("triangular", 0.8, 1.0, 1.3), "attainFactors": ("normal", 0.1)},
+            {"zde": ("lognormal", 0.3), "epf": ("uniform", 0.5, 1.5)},
+        ]:
+            burdens = self.reference_burdens(specs, 12)
+            summary = self.run_monte_carlo(specs, 12, batchSize=12)
+            self.assertEqual(summary.getNumDraws(), 12)
+            np.testing.assert_allclose(
+                summary.getPopulationMoments().getMean(), burdens.mean(axis=0), rtol=1e-10
+            )
+            totals = np.einsum("i,kis->ks", self.population, burdens)
+            np.testing.assert_allclose(
+                summary.getAggregateMoments().getMean()[:3], totals.mean(axis=0), rtol=1e-10
+            )
+            np.testing.assert_allclose(
+                summary.getAggregateMoments().getMean()[3], totals.sum(axis=1).mean(), rtol=1e-10
+            )
+
+    def test_fixed_inputs_and_bad_specs(self):
+        """With nothing uncertain every draw is the usual burden; unknown specs are errors."""
+        p = self.problem
+        summary = self.run_monte_carlo({}, 7, batchSize=3)
+        burden = burdenKernels.blockedBurden(
+            p["distances"], p["zde"], p["epf"], self.SLR, p["attainFactors"]
+        )
+        np.testing.assert_allclose(summary.getPopulationQuantiles()[1], burden, rtol=1e-12)
+        np.testing.assert_allclose(summary.getPopulationMoments().getStd(), 0, atol=1e-12)
+        with self.assertRaises(ValueError):
+            self.run_monte_carlo({"distances": ("normal", 0.1)}, 2, 1)
+        with self.assertRaises(ValueError):
+            self.run_monte_carlo({"zde": ("uniform", 0.5)}, 2, 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenMonteCarloTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
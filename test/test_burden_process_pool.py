@@ -0,0 +1,66 @@
+# coding=utf-8
+"""Tests for burdenProcessPool: the shared-memory process pool, checked against
+the in-process burden calculation.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenProcessPool
+
+
+class BurdenProcessPoolTest(unittest.TestCase):
+    """Test the shared-memory process pool gives the same burdens as the in-process path."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(2)
+        n, m, s = 61, 17, 3
+        self.populationLatitudes = rng.uniform(35, 36, n)
+        self.populationLongitudes = rng.uniform(-107, -106, n)
+        self.facilityLatitudes = rng.uniform(35, 36, m)
+        self.facilityLongitudes = rng.uniform(-107, -106, m)
+        self.zde = rng.uniform(1, 10, m)
+        self.epf = rng.uniform(1e-5, 1e-3, m)
+        self.SLR = rng.integers(1, 6, (m, s)).astype(float)
+        self.attainFactors = rng.uniform(0.5, 2, n)
+
+    def tearDown(self):
+        """Runs after each test."""
+        pass
+
+    def test_process_pool_matches_in_process(self):
+        """Burden from worker processes equals the threaded in-process calculation."""
+        distances = (
+            burdenKernels.greatCircleDistances(
+                self.populationLatitudes,
+                self.facilityLatitudes,
+                self.populationLongitudes,
+                self.facilityLongitudes,
+            )
+            * burdenKernels.METERS_TO_FEET
+        )
+        expected = burdenKernels.blockedBurden(
+            distances, self.zde, self.epf, self.SLR, self.attainFactors, tileSize=8
+        )
+        result = burdenProcessPool.processPoolBurden(
+            self.populationLatitudes,
+            self.populationLongitudes,
+            self.facilityLatitudes,
+            self.facilityLongitudes,
+            self.zde,
+            self.epf,
+            self.SLR,
+            self.attainFactors,
+            workers=2,
+            tileSize=8,
+        )
+        np.testing.assert_array_equal(result, expected)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenProcessPoolTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
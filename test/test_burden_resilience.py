@@ -0,0 +1,99 @@
+# coding=utf-8
+"""Tests for burdenResilience: the greedy worst case facility loss search, exact
+and lazy, checked against recalculating the burden.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenResilience
+
+from .utilities import makeProblem
+
+
+class BurdenResilienceTest(unittest.TestCase):
+    """Test the greedy worst case facility loss search."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeProblem(n=31, m=17, s=3, seed=2)
+        p = self.problem
+        p["SLReduce"][:] = 0
+        p["serviceLevels"][p["serviceLevels"] == 0] = 1
+        # facility 4 is the only provider of service 2
+        p["serviceLevels"][:, 2] = 0
+        p["serviceLevels"][4, 2] = 3
+        self.SLR = burdenKernels.reducedServiceLevels(p["SLReduce"], p["serviceLevels"])
+        self.population = np.random.default_rng(3).integers(1, 1000, 31).astype(float)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def state(self, removed):
+        """(finite weighted burden, unserved population) recalculated without the removed facilities."""
+        p = self.problem
+        keep = np.delete(np.arange(17), removed)
+        with np.errstate(divide="ignore"):
+            burden = burdenKernels.blockedBurden(
+                p["distances"][:, keep], p["zde"][keep], p["epf"][keep], self.SLR[keep],
+                p["attainFactors"],
+            )
+        finite = np.isfinite(burden)
+        weighted = np.where(finite, self.population.reshape((-1, 1)) * burden, 0)
+        return np.sum(weighted), np.sum(self.population.reshape((-1, 1)) * ~finite)
+
+    def search(self, k, **kwargs):
+        p = self.problem
+        return burdenResilience.worstCaseRemovals(
+            lambda rows: p["distances"][rows], lambda j: p["distances"][:, j], 31,
+            p["zde"], p["epf"], self.SLR, p["attainFactors"], self.population, k,
+            tileSize=6, **kwargs
+        )
+
+    def test_exact_greedy_matches_recalculation(self):
+        """Each exact step takes the loss a recalculation rates worst, and the curve matches."""
+        removed, burden, unserved = self.search(5, lazy=False)
+        self.assertEqual(removed[0], 4)  # stranding people comes first
+        for step in range(6):
+            expected = self.state(removed[:step])
+            self.assertAlmostEqual(burden[step] / expected[0], 1, places=9)
+            self.assertEqual(unserved[step], expected[1])
+        for step in range(1, 5):
+            candidates = [j for j in range(17) if j not in removed[:step]]
+            best = max(candidates, key=lambda j: self.state(list(removed[:step]) + [j])[0])
+            self.assertEqual(removed[step], best)
+
+    def test_default_is_exact(self):
+        """The search is exact unless asked to be lazy."""
+        exact = self.search(10, lazy=False)
+        default = self.search(10)
+        for expected, result in zip(exact, default):
+            np.testing.assert_array_equal(result, expected)
+
+    def test_lazy_search(self):
+        """The lazy search gives a consistent curve, agrees on the first loss, and threads agree."""
+        removed, burden, unserved = self.search(6, lazy=True)
+        self.assertEqual(len(set(removed)), 6)
+        self.assertEqual(removed[0], 4)
+        for step in range(7):
+            expected = self.state(removed[:step])
+            self.assertAlmostEqual(burden[step] / expected[0], 1, places=9)
+            self.assertEqual(unserved[step], expected[1])
+        threaded = self.search(6, lazy=True, workers=3)
+        np.testing.assert_array_equal(threaded[0], removed)
+        self.assertEqual(len(self.search(40, lazy=True)[0]), 17)
+
+    def test_lazy_search_is_approximate(self):
+        """Gains grow as facilities are lost, so stale gains can mislead the lazy search."""
+        exact = self.search(6, lazy=False)[0]
+        lazy = self.search(6, lazy=True)[0]
+        np.testing.assert_array_equal(lazy[:4], exact[:4])
+        self.assertFalse(np.array_equal(lazy, exact))
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenResilienceTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
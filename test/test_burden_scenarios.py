@@ -0,0 +1,79 @@
+# coding=utf-8
+"""Tests for burdenScenarios: batched facility status scenarios, checked against
+separate burden calculations.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenScenarios
+
+from .utilities import makeProblem
+
+
+class BurdenScenariosTest(unittest.TestCase):
+    """Test batched evaluation of facility status scenarios."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeProblem(n=23, m=17, s=4)
+        p = self.problem
+        rng = np.random.default_rng(5)
+        self.reductions = rng.choice([0.0, 50.0, 100.0], (9, 17))
+        self.reciprocal = burdenScenarios.reciprocalDenominators(
+            p["distances"], p["zde"], p["epf"], tileSize=6
+        )
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def separateRun(self, reduction):
+        p = self.problem
+        return burdenKernels.blockedBurden(
+            p["distances"], p["zde"], p["epf"],
+            burdenKernels.reducedServiceLevels(reduction, p["serviceLevels"]),
+            p["attainFactors"],
+        )
+
+    def test_batched_matches_separate_runs(self):
+        """Each scenario's burden is what a separate run with its reductions gives."""
+        p = self.problem
+        for scenarioBatch in [1, 4, 100]:
+            burdens = burdenScenarios.scenarioBurdens(
+                self.reciprocal, p["serviceLevels"], 1 - self.reductions * 1e-2,
+                p["attainFactors"], scenarioBatch,
+            )
+            self.assertEqual(burdens.shape, (9, 23, 4))
+            for k in range(9):
+                np.testing.assert_allclose(burdens[k], self.separateRun(self.reductions[k]), rtol=1e-12)
+
+    def test_streamed_and_aggregated(self):
+        """Streaming yields the scenarios in order, and aggregation weights by population."""
+        p = self.problem
+        factors = 1 - self.reductions * 1e-2
+        population = np.arange(23.0)
+        streamed = list(burdenScenarios.iterScenarioBurdens(
+            self.reciprocal, p["serviceLevels"], factors, p["attainFactors"], 2
+        ))
+        self.assertEqual([k for k, _ in streamed], list(range(9)))
+
+        aggregated = burdenScenarios.aggregatedWeightedScenarioBurdens(
+            self.reciprocal, p["serviceLevels"], factors, p["attainFactors"], population, 2
+        )
+        for k, burden in streamed:
+            np.testing.assert_allclose(
+                aggregated[k], np.sum(population.reshape((-1, 1)) * burden, axis=0), rtol=1e-12
+            )
+        with self.assertRaises(ValueError):
+            list(burdenScenarios.iterScenarioBurdens(
+                self.reciprocal, p["serviceLevels"], factors[:, :5], p["attainFactors"]
+            ))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenScenariosTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
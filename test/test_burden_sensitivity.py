@@ -0,0 +1,87 @@
+# coding=utf-8
+"""Tests for burdenSensitivity: the analytic derivatives of the weighted total
+burden, checked against finite differences.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenSensitivity
+
+from .utilities import makeProblem
+
+
+class BurdenSensitivityTest(unittest.TestCase):
+    """Test the analytic derivatives of the weighted total burden."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeProblem(n=19, m=7, s=3, seed=8)
+        self.problem["SLReduce"] = np.array([0.0, 25.0, 50.0, 0.0, 10.0, 0.0, 75.0])
+        self.population = np.random.default_rng(9).integers(1, 1000, 19).astype(float)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def total(self, p):
+        SLR = burdenKernels.reducedServiceLevels(p["SLReduce"], p["serviceLevels"])
+        burden = burdenKernels.blockedBurden(
+            p["distances"], p["zde"], p["epf"], SLR, p["attainFactors"]
+        )
+        return np.sum(self.population.reshape((-1, 1)) * burden)
+
+    def gradients(self, **kwargs):
+        p = self.problem
+        return burdenSensitivity.burdenAndGradients(
+            lambda rows: p["distances"][rows], 19, p["zde"], p["epf"], p["SLReduce"],
+            p["serviceLevels"], p["attainFactors"], self.population, **kwargs
+        )
+
+    def central_difference(self, name, index, step):
+        p = {key: np.array(value, dtype=float) for key, value in self.problem.items()}
+        p[name][index] += step
+        up = self.total(p)
+        p[name][index] -= 2 * step
+        return (up - self.total(p)) / (2 * step)
+
+    def test_matches_finite_differences(self):
+        """Every derivative matches a central difference, and the burden is the usual one."""
+        burden, gradients = self.gradients(tileSize=4)
+        p = self.problem
+        SLR = burdenKernels.reducedServiceLevels(p["SLReduce"], p["serviceLevels"])
+        np.testing.assert_allclose(
+            burden, burdenKernels.blockedBurden(p["distances"], p["zde"], p["epf"], SLR, p["attainFactors"]),
+            rtol=1e-12,
+        )
+        for j in range(7):
+            for k in range(3):
+                self.assertAlmostEqual(
+                    gradients["serviceLevels"][j, k] / self.central_difference("serviceLevels", (j, k), 1e-4),
+                    1, places=5,
+                )
+            for name, step in [("zde", 1e-4), ("epf", 1e-8), ("SLReduce", 1e-3)]:
+                self.assertAlmostEqual(
+                    gradients[name][j] / self.central_difference(name, j, step), 1, places=5
+                )
+
+    def test_threads_and_unserved_groups(self):
+        """Threads agree with one thread; groups without a provider are left out."""
+        single = self.gradients(tileSize=3)[1]
+        threaded = self.gradients(tileSize=3, workers=4)[1]
+        for name in burdenSensitivity.SENSITIVITY_INPUTS:
+            np.testing.assert_allclose(threaded[name], single[name], rtol=1e-12)
+        self.problem["serviceLevels"][:, 2] = 0
+        burden, gradients = self.gradients()
+        self.assertTrue(np.all(np.isinf(burden[:, 2])))
+        np.testing.assert_array_equal(gradients["serviceLevels"][:, 2], 0)
+        for name in burdenSensitivity.SENSITIVITY_INPUTS:
+            self.assertTrue(np.all(np.isfinite(gradients[name])))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenSensitivityTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,86 @@
+# coding=utf-8
+"""Tests for burdenSiting: the greedy facility siting search, exact and lazy,
+checked against recalculating the burden.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenIncremental
+import burdenSiting
+
+from .utilities import makeProblem
+
+
+class BurdenSitingTest(unittest.TestCase):
+    """Test the greedy facility siting search."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.problem = makeProblem(n=37, m=11, s=3, seed=4)
+        p = self.problem
+        p["SLReduce"][:] = 0
+        p["serviceLevels"][:, 2] = 0  # nobody provides service 2 yet
+        self.SLR = burdenKernels.reducedServiceLevels(p["SLReduce"], p["serviceLevels"])
+        rng = np.random.default_rng(5)
+        self.candidates = rng.uniform(0, 5e4, (37, 23))  # distances to 23 candidate sites
+        self.newLevels = np.array([2.0, 0.0, 1.0])
+        self.zde, self.epf = 3.0, 2e-4
+        self.population = rng.integers(1, 1000, 37).astype(float)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.problem = None
+
+    def state(self, picked):
+        """(finite weighted burden, unserved population) recalculated with the picked sites added."""
+        p = self.problem
+        picked = list(picked)
+        distances = np.hstack([p["distances"], self.candidates[:, picked]])
+        zde = np.append(p["zde"], [self.zde] * len(picked))
+        epf = np.append(p["epf"], [self.epf] * len(picked))
+        SLR = np.vstack([self.SLR] + [self.newLevels.reshape((1, -1))] * len(picked))
+        with np.errstate(divide="ignore"):
+            burden = burdenKernels.blockedBurden(distances, zde, epf, SLR, p["attainFactors"])
+        finite = np.isfinite(burden)
+        weighted = np.where(finite, self.population.reshape((-1, 1)) * burden, 0)
+        return np.sum(weighted), np.sum(self.population.reshape((-1, 1)) * ~finite)
+
+    def search(self, numSites, **kwargs):
+        p = self.problem
+        sums = burdenIncremental.benefitSums(p["distances"], p["zde"], p["epf"], self.SLR)
+        return burdenSiting.greedySiting(
+            lambda rows: self.candidates[rows], lambda c: self.candidates[:, c], 37,
+            self.zde, self.epf, self.newLevels, sums, p["attainFactors"], self.population,
+            numSites, tileSize=8, **kwargs
+        )
+
+    def test_exact_greedy_matches_recalculation(self):
+        """Each exact pick is the one a recalculation rates best, and the curve matches."""
+        picked, burden, unserved = self.search(4, lazy=False)
+        for step in range(5):
+            expected = self.state(picked[:step])
+            self.assertAlmostEqual(burden[step] / expected[0], 1, places=9)
+            self.assertEqual(unserved[step], expected[1])
+        self.assertEqual(unserved[1], 0)
+        for step in range(1, 4):
+            candidates = [c for c in range(23) if c not in picked[:step]]
+            best = min(candidates, key=lambda c: self.state(list(picked[:step]) + [c])[0])
+            self.assertEqual(picked[step], best)
+
+    def test_lazy_matches_exact(self):
+        """CELF picks what the exact greedy search picks, in any batch size and thread count."""
+        exact = self.search(6, lazy=False)
+        for kwargs in [{}, {"batchSize": 1}, {"batchSize": 5, "workers": 3}]:
+            lazy = self.search(6, **kwargs)
+            np.testing.assert_array_equal(lazy[0], exact[0])
+            np.testing.assert_allclose(lazy[1], exact[1], rtol=1e-12)
+        self.assertEqual(len(self.search(40)[0]), 23)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenSitingTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
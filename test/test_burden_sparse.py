@@ -0,0 +1,84 @@
+# coding=utf-8
+"""Tests for burdenSparse: the distance cutoff burden, checked against the exact
+burden and the bounds it gives.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenSparse
+
+try:
+    import scipy  # noqa: F401
+    HAVE_SCIPY = True
+except ImportError:
+    HAVE_SCIPY = False
+
+
+@unittest.skipIf(not HAVE_SCIPY, "the distance cutoff calculation needs scipy")
+class BurdenSparseTest(unittest.TestCase):
+    """Test the cutoff burden against the exact burden."""
+
+    def setUp(self):
+        """Runs before each test."""
+        rng = np.random.default_rng(3)
+        n, m, s = 150, 90, 4
+        self.args = (
+            rng.uniform(35, 36, n),
+            rng.uniform(-107, -106, n),
+            rng.uniform(35, 36, m),
+            rng.uniform(-107, -106, m),
+            rng.uniform(1, 10, m),
+            rng.uniform(1e-5, 1e-3, m),
+            rng.integers(0, 6, (m, s)).astype(float),
+            rng.uniform(0.5, 2, n),
+        )
+        self.sectors = rng.integers(0, 3, m)
+        popLat, popLong, facLat, facLong, zde, epf, SLR, attain = self.args
+        distances = (
+            burdenKernels.greatCircleDistances(popLat, facLat, popLong, facLong)
+            * burdenKernels.METERS_TO_FEET
+        )
+        self.exact = burdenKernels.blockedBurden(distances, zde, epf, SLR, attain)
+
+    def tearDown(self):
+        """Runs after each test."""
+        pass
+
+    def test_no_cutoff_matches_exact(self):
+        """Keeping every pair reproduces the exact burden, with nothing discarded."""
+        burden, bound = burdenSparse.cutoffBurden(*self.args, maxDistance=1e9)
+        np.testing.assert_allclose(burden, self.exact, rtol=1e-12)
+        np.testing.assert_array_equal(bound, 0)
+        burden, bound = burdenSparse.cutoffBurden(
+            *self.args, nearestPerGroup=1000, facilityGroups=self.sectors
+        )
+        np.testing.assert_allclose(burden, self.exact, rtol=1e-12)
+        np.testing.assert_array_equal(bound, 0)
+
+    def test_cutoff_brackets_exact(self):
+        """With a real cutoff, the exact burden lies within the reported bounds."""
+        for kwargs in [
+            {"maxDistance": 5e4},
+            {"maxDistance": 2e5},
+            {"nearestPerGroup": 1, "facilityGroups": self.sectors},
+            {"nearestPerGroup": 10, "facilityGroups": self.sectors},
+        ]:
+            burden, bound = burdenSparse.cutoffBurden(*self.args, **kwargs)
+            self.assertTrue(np.all(burden >= self.exact * (1 - 1e-12)))
+            self.assertTrue(np.all(1 / (1 / burden + bound) <= self.exact * (1 + 1e-12)))
+
+    def test_exactly_one_cutoff(self):
+        """A cutoff needs either a distance or a number of facilities, not both."""
+        with self.assertRaises(ValueError):
+            burdenSparse.cutoffBurden(*self.args)
+        with self.assertRaises(ValueError):
+            burdenSparse.cutoffBurden(*self.args, maxDistance=1e4, nearestPerGroup=2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BurdenSparseTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
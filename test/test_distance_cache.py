@@ -0,0 +1,83 @@
+# coding=utf-8
+"""Tests for distanceCache: the on-disk distance matrix cache, its keys and its
+least recently used eviction.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import distanceCache
+
+
+class DistanceCacheTest(unittest.TestCase):
+    """Test the on-disk distance matrix cache."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.fills = 0
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def fill(self, value):
+        def fillOut(out):
+            self.fills += 1
+            out[...] = value
+        return fillOut
+
+    def test_store_then_load(self):
+        """A stored matrix is loaded (memory-mapped) rather than recalculated."""
+        cache = distanceCache.DistanceCache(self.directory)
+        coordinates = [np.arange(3.0), np.arange(3.0), np.arange(4.0), np.arange(4.0)]
+        key = cache.key(*coordinates, label="haversine")
+        self.assertIsNone(cache.load(key))
+
+        stored = cache.store(key, (3, 4), self.fill(7.0))
+        loaded = distanceCache.DistanceCache(self.directory).load(key)
+        self.assertIsInstance(loaded, np.memmap)
+        np.testing.assert_array_equal(loaded, np.full((3, 4), 7.0))
+        np.testing.assert_array_equal(stored, loaded)
+        self.assertEqual(self.fills, 1)
+        self.assertFalse(any(name.endswith(".tmp.npy") for name in os.listdir(self.directory)))
+
+    def test_key_depends_on_contents_and_label(self):
+        """Different coordinates or distance kernels get different keys."""
+        cache = distanceCache.DistanceCache(self.directory)
+        a, b = np.array([1.0, 2.0]), np.array([1.0, 2.5])
+        self.assertEqual(cache.key(a, label="x"), cache.key(a.copy(), label="x"))
+        self.assertNotEqual(cache.key(a, label="x"), cache.key(b, label="x"))
+        self.assertNotEqual(cache.key(a, label="x"), cache.key(a, label="y"))
+
+    def test_least_recently_used_are_evicted(self):
+        """Going over the size cap removes the least recently used matrices first."""
+        matrixBytes = 100 * 8
+        cache = distanceCache.DistanceCache(self.directory, maxBytes=2.5 * matrixBytes)
+        cache.store("a", (10, 10), self.fill(1.0))
+        cache.store("b", (10, 10), self.fill(2.0))
+        # make "a" the most recently used one
+        os.utime(os.path.join(self.directory, "b.npy"), (0, 0))
+        self.assertIsNotNone(cache.load("a"))
+
+        cache.store("c", (10, 10), self.fill(3.0))
+        self.assertIsNone(cache.load("b"))
+        self.assertIsNotNone(cache.load("a"))
+        self.assertIsNotNone(cache.load("c"))
+
+    def test_too_big_is_not_cached(self):
+        """A matrix bigger than the whole cap is calculated in memory only."""
+        cache = distanceCache.DistanceCache(self.directory, maxBytes=10)
+        result = cache.store("big", (10, 10), self.fill(1.0))
+        np.testing.assert_array_equal(result, np.ones((10, 10)))
+        self.assertIsNone(cache.load("big"))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DistanceCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
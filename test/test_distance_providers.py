@@ -0,0 +1,94 @@
+# coding=utf-8
+"""Tests for distanceProviders: distances from coordinates, and from an
+origin-destination table with and without a fallback.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import burdenKernels
+import distanceProviders
+
+
+class DistanceProvidersTest(unittest.TestCase):
+    """Test the coordinate and origin-destination distance providers."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.popLat, self.popLong = rng.uniform(30, 40, 6), rng.uniform(-110, -100, 6)
+        self.facLat, self.facLong = rng.uniform(30, 40, 4), rng.uniform(-110, -100, 4)
+        self.coordinates = distanceProviders.CoordinateDistanceProvider(
+            self.popLat, self.popLong, self.facLat, self.facLong,
+            burdenKernels.haversineFeetDistances,
+        )
+        self.populationIds = [101, 102, 103, 104, 105, 106]
+        self.facilityIds = ["a", "b", "c", "d"]
+
+        # every pair except (106, "d"), with one pair twice and a few unknown ids
+        table = pd.DataFrame(
+            [(p, f, 1000 * i + j) for i, p in enumerate(self.populationIds)
+             for j, f in enumerate(self.facilityIds)][:-1]
+            + [(101, "a", 5.0), (999, "a", 1.0), (101, "zz", 1.0)],
+            columns=["origin", "destination", "miles"],
+        )
+        self.expected = np.array(
+            [[1000 * i + j for j in range(4)] for i in range(6)], dtype=float
+        )
+        self.expected[0, 0] = 5.0
+        self.path = os.path.join(self.directory, "od.csv")
+        table.to_csv(self.path, index=False)
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def odProvider(self, storage, fallback):
+        return distanceProviders.ODMatrixDistanceProvider(
+            self.path, self.populationIds, self.facilityIds,
+            "origin", "destination", "miles",
+            fallback=fallback, feetPerUnit=5280.0, storage=storage, chunkRows=5,
+        )
+
+    def test_coordinate_provider(self):
+        """The coordinate provider hands out blocks of the straight-line distances."""
+        expected = burdenKernels.haversineFeetDistances(
+            self.popLat, self.facLat, self.popLong, self.facLong
+        )
+        self.assertEqual(self.coordinates.getShape(), (6, 4))
+        np.testing.assert_array_equal(self.coordinates.getFeetDistances(slice(2, 5)), expected[2:5])
+
+    def test_od_table_with_fallback(self):
+        """Table distances are aligned to the ids, and missing pairs use the fallback."""
+        straightLine = self.coordinates.getFeetDistances(slice(0, 6))
+        for storage in ["dense", "sparse"]:
+            provider = self.odProvider(storage, self.coordinates)
+            self.assertEqual(provider.getShape(), (6, 4))
+            self.assertEqual(provider.getMissingPairCount(), 1)
+            result = np.concatenate(
+                [provider.getFeetDistances(slice(0, 4)), provider.getFeetDistances(slice(4, 6))]
+            )
+            expected = self.expected * 5280.0
+            expected[5, 3] = straightLine[5, 3]
+            np.testing.assert_array_equal(result, expected)
+
+    def test_od_table_without_fallback(self):
+        """Without a fallback, asking for a block with a missing pair is an error."""
+        provider = self.odProvider("sparse", None)
+        np.testing.assert_array_equal(
+            provider.getFeetDistances(slice(0, 5)), self.expected[:5] * 5280.0
+        )
+        with self.assertRaises(ValueError):
+            provider.getFeetDistances(slice(5, 6))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DistanceProvidersTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,392 @@
+# coding=utf-8
+"""Tests for the QGIS-free path: wkbGeometry, HeadlessSBCalcDataBridge and
+headlessRunner, checked against SBEngine run on the same arrays.
+"""
+
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import headlessRunner
+import HeadlessSBCalcDataBridge
+import wkbGeometry
+from SBCalculator import SBEngine
+
+PROJECTED_WKT = (
+    'PROJCS["test",GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],'
+    'UNIT["degree",0.0174532925199433]],PROJECTION["Transverse_Mercator"],UNIT["metre",1]]'
+)
+
+
+def wkbPolygon(*rings, byteOrder="<"):
+    wkb = struct.pack(byteOrder + "bII", byteOrder == "<", 3, len(rings))
+    for ring in rings:
+        wkb += struct.pack(byteOrder + "I", len(ring)) + np.asarray(ring, dtype=byteOrder + "f8").tobytes()
+    return wkb
+
+
+def square(x, y, size):
+    return [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+
+
+def gpkgBlob(wkb, envelope=None):
+    """GeoPackage geometry blob: header (with an optional xy envelope) then WKB."""
+    flags = 1 if envelope is None else 1 | (1 << 1)
+    header = b"GP" + bytes([0, flags]) + struct.pack("<i", 1)
+    if envelope is not None:
+        header += struct.pack("<4d", *envelope)
+    return header + wkb
+
+
+def writeGeoPackage(path, table, columns, rows, geometries, definition):
+    """A minimal GeoPackage with one feature table."""
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT, srs_id INTEGER PRIMARY KEY, "
+            "organization TEXT, organization_coordsys_id INTEGER, definition TEXT)"
+        )
+        connection.execute("INSERT INTO gpkg_spatial_ref_sys VALUES ('test', 1, 'NONE', 1, ?)", (definition,))
+        connection.execute("CREATE TABLE gpkg_contents (table_name TEXT PRIMARY KEY, data_type TEXT)")
+        connection.execute("INSERT INTO gpkg_contents VALUES (?, 'features')", (table,))
+        connection.execute(
+            "CREATE TABLE gpkg_geometry_columns (table_name TEXT, column_name TEXT, srs_id INTEGER)"
+        )
+        connection.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', 1)", (table,))
+        connection.execute(
+            'CREATE TABLE "%s" (fid INTEGER PRIMARY KEY, geom BLOB, %s)' % (table, ", ".join(columns))
+        )
+        names = [column.split()[0] for column in columns]
+        for row, geometry in zip(rows, geometries):
+            connection.execute(
+                'INSERT INTO "%s" (geom, %s) VALUES (?, %s)'
+                % (table, ", ".join(names), ", ".join("?" * len(names))),
+                (gpkgBlob(geometry),) + tuple(row),
+            )
+    connection.close()
+
+
+class WkbGeometryTest(unittest.TestCase):
+    """Test point locations and centroids read from WKB."""
+
+    def test_square_centroid(self):
+        """Both ring orientations and byte orders give the same centroid."""
+        ring = square(10, 20, 4)
+        for wkb in (wkbPolygon(ring), wkbPolygon(ring[::-1]), wkbPolygon(ring, byteOrder=">")):
+            np.testing.assert_allclose(wkbGeometry.wkbCentroid(wkb), (12, 22))
+
+    def test_hole_and_multipolygon(self):
+        """Holes count negatively, and parts are weighted by area."""
+        withHole = wkbPolygon(square(0, 0, 4), square(0, 0, 2))
+        # the 4x4 square's centroid (2,2) less the 2x2 hole's (1,1): (16*2 - 4*1)/12
+        np.testing.assert_allclose(wkbGeometry.wkbCentroid(withHole), (7 / 3, 7 / 3))
+
+        first, second = wkbPolygon(square(0, 0, 1))[9:], wkbPolygon(square(10, 0, 3))[9:]
+        multi = struct.pack("<bII", 1, 6, 2)
+        multi += struct.pack("<bII", 1, 3, 1) + first + struct.pack("<bII", 1, 3, 1) + second
+        np.testing.assert_allclose(wkbGeometry.wkbCentroid(multi), ((0.5 + 9 * 11.5) / 10, (0.5 + 9 * 1.5) / 10))
+
+    def test_points_and_z(self):
+        """ISO and extended WKB points with Z; lines are refused."""
+        iso = struct.pack("<bI3d", 1, 1001, 3.0, 4.0, 99.0)
+        ewkb = struct.pack("<bIi3d", 1, 1 | 0x80000000 | 0x20000000, 4326, 3.0, 4.0, 99.0)
+        for wkb in (iso, ewkb, gpkgBlob(iso, envelope=(3, 3, 4, 4))):
+            self.assertEqual(wkbGeometry.wkbPoint(wkbGeometry.geometryBlobToWkb(wkb)), (3.0, 4.0))
+        line = struct.pack("<bII4d", 1, 2, 2, 0, 0, 1, 1)
+        self.assertRaises(TypeError, wkbGeometry.wkbCentroid, line)
+        self.assertRaises(TypeError, wkbGeometry.pointLocations, [wkbPolygon(square(0, 0, 1))], "facilities")
+        self.assertRaises(ValueError, wkbGeometry.centroidLocations, [None], "population centroids")
+
+        latitudes, longitudes = wkbGeometry.pointLocations([iso, gpkgBlob(ewkb)], "facilities")
+        np.testing.assert_array_equal(latitudes, [4.0, 4.0])
+        np.testing.assert_array_equal(longitudes, [3.0, 3.0])
+
+    def test_chunked_centroids(self):
+        """Centroids of chunks of polygons, on any number of threads, match one by one."""
+        rng = np.random.default_rng(4)
+        blobs = []
+        for i in range(40):
+            x, y, size = rng.uniform(0, 1000), rng.uniform(0, 1000), rng.uniform(1, 50)
+            outer = square(x, y, size)
+            if i % 4 == 0:
+                outer = outer[::-1]
+            rings = [outer] if i % 3 else [outer, square(x + size / 4, y + size / 4, size / 3)]
+            wkb = wkbPolygon(*rings)
+            if i % 5 == 0:  # a two-part multi-polygon
+                wkb = struct.pack("<bII", 1, 6, 2) + wkb + wkbPolygon(square(x - 90, y, size / 2))
+            blobs.append(gpkgBlob(wkb) if i % 2 else wkb)
+        blobs[7] = struct.pack("<bIdd", 1, 1, 5.0, 6.0)  # a point
+        blobs[8] = wkbPolygon([(0, 0), (1, 1), (2, 2), (0, 0)])  # no area
+
+        expected = np.array(
+            [wkbGeometry.wkbCentroid(wkbGeometry.geometryBlobToWkb(i)) for i in blobs]
+        )
+        for workers, chunkSize in [(1, 4096), (3, 7)]:
+            latitudes, longitudes = wkbGeometry.centroidLocations(
+                blobs, "population centroids", workers=workers, chunkSize=chunkSize
+            )
+            np.testing.assert_allclose(longitudes, expected[:, 0], rtol=1e-12)
+            np.testing.assert_allclose(latitudes, expected[:, 1], rtol=1e-12)
+
+    def test_bulk_point_decode(self):
+        """Plain 2D points are decoded all at once, with the same results."""
+        xy = np.random.default_rng(3).uniform(-100, 100, (50, 2))
+        for byteOrder in "<>":
+            wkbs = [struct.pack(byteOrder + "bIdd", byteOrder == "<", 1, x, y) for x, y in xy]
+            for blobs in (wkbs, [gpkgBlob(i) for i in wkbs], [bytearray(i) for i in wkbs]):
+                latitudes, longitudes = wkbGeometry.pointLocations(blobs, "facilities")
+                np.testing.assert_array_equal(latitudes, xy[:, 1])
+                np.testing.assert_array_equal(longitudes, xy[:, 0])
+            # one Z point sends everything down the general path
+            mixed = wkbs + [struct.pack(byteOrder + "bI3d", byteOrder == "<", 1001, 1.0, 2.0, 3.0)]
+            latitudes, _ = wkbGeometry.pointLocations(mixed, "facilities")
+            np.testing.assert_array_equal(latitudes, list(xy[:, 1]) + [2.0])
+            self.assertRaises(ValueError, wkbGeometry.pointLocations, wkbs + [b""], "facilities")
+
+    def test_polygon_values_at_points(self):
+        """Points get the largest value of the polygons they are in, holes excluded."""
+        polygons = [
+            wkbPolygon(square(0, 0, 10), square(4, 4, 2)),  # with a hole
+            gpkgBlob(wkbPolygon(square(8, 8, 4)[::-1]), envelope=(8, 12, 8, 12)),
+            None,
+        ]
+        x = np.array([1, 5, 9, 11, 10, 20, 4])
+        y = np.array([1, 5, 9, 11, 5, 20, 5])  # ..., on an edge, outside, on the hole's edge
+        values = wkbGeometry.polygonValuesAtPoints(y, x, polygons, [30, 80, 99], "exclusion profile")
+        np.testing.assert_array_equal(values, [30, 0, 80, 80, 30, 0, 30])
+
+        # against a plain crossing count, for random points and star-shaped polygons
+        rng = np.random.default_rng(4)
+        rings = []
+        for cx, cy in rng.uniform(0, 100, (20, 2)):
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 12))
+            radii = rng.uniform(5, 20, 12)
+            ring = np.c_[cx + radii * np.cos(angles), cy + radii * np.sin(angles)]
+            rings.append(np.r_[ring, ring[:1]])
+        points = rng.uniform(0, 100, (500, 2))
+        severities = rng.uniform(1, 100, 20)
+        expected = np.zeros(500)
+        for ring, severity in zip(rings, severities):
+            x0, y0, x1, y1 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+            for i, (px, py) in enumerate(points):
+                straddles = (y0 > py) != (y1 > py)
+                crossings = px < x0 + (py - y0) * (x1 - x0) / np.where(straddles, y1 - y0, 1)
+                if np.count_nonzero(straddles & crossings) % 2:
+                    expected[i] = max(expected[i], severity)
+        values = wkbGeometry.polygonValuesAtPoints(
+            points[:, 1], points[:, 0], [wkbPolygon(i) for i in rings], severities, "exclusion profile"
+        )
+        np.testing.assert_array_equal(values, expected)
+
+        point = struct.pack("<bIdd", 1, 1, 1.0, 1.0)
+        self.assertRaises(TypeError, wkbGeometry.polygonValuesAtPoints, [1], [1], [point], [5], "x")
+
+
+class HeadlessRunnerTest(unittest.TestCase):
+    """Test the command line runner against the engine on plain arrays."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        rng = np.random.default_rng(5)
+        self.n, self.m = 12, 5
+        self.corners = rng.uniform(0, 20000, (self.n, 2))
+        self.sizes = rng.uniform(100, 2000, self.n)
+        self.population = rng.integers(1, 500, self.n)
+        self.attain = rng.uniform(0.5, 2, self.n)
+        writeGeoPackage(
+            os.path.join(self.directory, "population.gpkg"),
+            "blocks",
+            ["GEOID TEXT", "pop INTEGER", "income REAL"],
+            [("0%d" % i, int(p), float(a)) for i, (p, a) in enumerate(zip(self.population, self.attain))],
+            [wkbPolygon(square(x, y, s)) for (x, y), s in zip(self.corners, self.sizes)],
+            PROJECTED_WKT,
+        )
+
+        self.facilityXY = rng.uniform(0, 20000, (self.m, 2))
+        self.sectors = ["grocery", "clinic", "grocery", "bank", "clinic"]
+        pd.DataFrame(
+            {
+                "id": range(self.m),
+                "sector": self.sectors,
+                "x": self.facilityXY[:, 0],
+                "y": self.facilityXY[:, 1],
+                "cut": [0, 50, 0, 0, 10],
+            }
+        ).to_csv(os.path.join(self.directory, "facilities.csv"), index=False)
+        pd.DataFrame(
+            {
+                "sector": ["grocery", "clinic", "bank", "clinic"],  # only the first clinic row counts
+                "epf": [0.01, 0.02, 0.03, 0.5],
+                "zde": [1.0, 2.0, 3.0, 5.0],
+                "food": [5, 1, 2, 0],
+                "medical": [0, 4, 0, 0],
+            }
+        ).to_csv(os.path.join(self.directory, "sectors.csv"), index=False)
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def run_headless(self, *extra):
+        path = lambda name: os.path.join(self.directory, name)
+        self.assertEqual(
+            headlessRunner.main(
+                [
+                    path("population.gpkg"), path("facilities.csv"), path("sectors.csv"),
+                    "--population-index-field", "GEOID", "--population-field", "pop",
+                    "--attain-factor-field", "income", "--facility-index-field", "id",
+                    "--facility-sector-field", "sector", "--facility-lat-field", "y",
+                    "--facility-long-field", "x", "--sl-reduce-field", "cut",
+                    "--sector-field", "sector", "--epf-field", "epf", "--zde-field", "zde",
+                    "--per-area-csv", path("perArea.csv"), "--totals-csv", path("totals.csv"),
+                ]
+                + list(extra)
+            ),
+            0,
+        )
+        return pd.read_csv(path("perArea.csv"), dtype={"GEOID": str}), pd.read_csv(path("totals.csv"))
+
+    def engine(self, SLReduce):
+        """The engine on the arrays the runner should read."""
+        # metres are 1/0.3048 feet
+        engine = SBEngine.fromArrays(
+            self.population,
+            self.attain,
+            self.corners[:, 1] + self.sizes / 2,
+            self.corners[:, 0] + self.sizes / 2,
+            self.facilityXY[:, 1],
+            self.facilityXY[:, 0],
+            zde=[1.0, 2.0, 1.0, 3.0, 2.0],
+            epf=[0.01, 0.02, 0.01, 0.03, 0.02],
+            serviceLevels=[[5, 0], [1, 4], [5, 0], [2, 0], [1, 4]],
+            SLReduce=SLReduce,
+        )
+        engine.setDistanceKernel("planar")
+        engine.setFeetPerMapUnit(1 / 0.3048)
+        engine.calculateBurden()
+        return engine
+
+    def test_matches_engine(self):
+        """The per-area and totals tables match the engine run on the same arrays."""
+        perArea, totals = self.run_headless()
+        engine = self.engine([0, 50, 0, 0, 10])
+
+        self.assertEqual(list(perArea.GEOID), ["0%d" % i for i in range(self.n)])
+        self.assertTrue(np.isfinite(engine.getBurdenArray()).all())
+        np.testing.assert_allclose(perArea[["food", "medical"]].to_numpy(), engine.getBurdenArray())
+        np.testing.assert_allclose(perArea["centroid_latitudes"], self.corners[:, 1] + self.sizes / 2)
+        np.testing.assert_allclose(totals["total"], [
+            engine.getPerCapitaAggregatedTotalBurden(), engine.getAggregatedWeightedTotalBurden()
+        ])
+        self.assertEqual(totals["population"][1], np.sum(self.population))
+
+    def test_exclusion_profile(self):
+        """Facilities in exclusion polygons get the largest of the polygons' reductions."""
+        (x0, y0), (x1, y1) = self.facilityXY[0], self.facilityXY[1]
+        writeGeoPackage(
+            os.path.join(self.directory, "hazards.gpkg"),
+            "zones",
+            ["severity REAL"],
+            [(70.0,), (None,), (20.0,)],
+            [
+                wkbPolygon(square(x0 - 1, y0 - 1, 2)),
+                wkbPolygon(square(x0 - 5, y0 - 5, 10)),
+                wkbPolygon(square(x1 - 1, y1 - 1, 2)),
+            ],
+            PROJECTED_WKT,
+        )
+        exclusion = ["--exclusion", os.path.join(self.directory, "hazards.gpkg"), "--sl-reduction", "40"]
+        perArea, _ = self.run_headless(*exclusion)
+        # facility 1 keeps its own, larger, reduction from the facilities table
+        np.testing.assert_allclose(
+            perArea[["food", "medical"]].to_numpy(), self.engine([40, 50, 0, 0, 10]).getBurdenArray()
+        )
+        perArea, _ = self.run_headless(*exclusion, "--sl-reduction-field", "severity")
+        np.testing.assert_allclose(
+            perArea[["food", "medical"]].to_numpy(), self.engine([70, 50, 0, 0, 10]).getBurdenArray()
+        )
+
+    def test_unmatched_sectors(self):
+        """Facilities of sectors the table doesn't have provide nothing, with a warning."""
+        pd.read_csv(os.path.join(self.directory, "sectors.csv")).iloc[:3].query(
+            "sector != 'bank'"
+        ).to_csv(os.path.join(self.directory, "sectors.csv"), index=False)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            perArea, _ = self.run_headless()
+        self.assertTrue(any("bank (1)" in str(i.message) for i in caught))
+
+        engine = SBEngine.fromArrays(
+            self.population,
+            self.attain,
+            self.corners[:, 1] + self.sizes / 2,
+            self.corners[:, 0] + self.sizes / 2,
+            self.facilityXY[[0, 1, 2, 4], 1],
+            self.facilityXY[[0, 1, 2, 4], 0],
+            zde=[1.0, 2.0, 1.0, 2.0],
+            epf=[0.01, 0.02, 0.01, 0.02],
+            serviceLevels=[[5, 0], [1, 4], [5, 0], [1, 4]],
+            SLReduce=[0, 50, 0, 10],
+        )
+        engine.setDistanceKernel("planar")
+        engine.setFeetPerMapUnit(1 / 0.3048)
+        engine.calculateBurden()
+        np.testing.assert_allclose(perArea[["food", "medical"]].to_numpy(), engine.getBurdenArray())
+
+    def test_lat_long_fields_are_geographic(self):
+        """Lat/long fields get great circle distances, even in a projected table."""
+        path = os.path.join(self.directory, "population.gpkg")
+        with sqlite3.connect(path) as connection:
+            connection.execute("ALTER TABLE blocks ADD COLUMN lat REAL")
+            connection.execute("ALTER TABLE blocks ADD COLUMN lon REAL")
+            connection.execute("UPDATE blocks SET lat = 35.1, lon = -106.6")
+        connection.close()
+        dataBridge = HeadlessSBCalcDataBridge.HeadlessSBCalcDataBridge()
+        dataBridge.setPopulationPath(path)
+        dataBridge.createPopulationCentroids()
+        self.assertEqual(dataBridge.getDistanceMode(), "planar")
+
+        dataBridge.setPopulationLatField("lat")
+        dataBridge.setPopulationLongField("lon")
+        dataBridge.createPopulationCentroids()
+        self.assertEqual(dataBridge.getDistanceMode(), "geographic")
+        np.testing.assert_array_equal(dataBridge.getPopulationLatitudes(), [35.1] * self.n)
+        dataBridge.setFeetPerMapUnit(1.0)
+        self.assertEqual(dataBridge.getDistanceMode(), "planar")
+
+    def test_sensitivity_table(self):
+        """--sensitivity-csv writes the engine's derivatives, one row per facility."""
+        path = os.path.join(self.directory, "sensitivity.csv")
+        perArea, _ = self.run_headless("--sensitivity-csv", path)
+        engine = self.engine([0, 50, 0, 0, 10])
+        engine.calculateBurdenSensitivity()
+        sensitivity = engine.getBurdenSensitivity()
+
+        table = pd.read_csv(path)
+        self.assertEqual(list(table.sector), self.sectors)
+        np.testing.assert_allclose(table.dW_total_dZDE, sensitivity["zde"])
+        np.testing.assert_allclose(table.dW_total_dSLReduce, sensitivity["SLReduce"])
+        np.testing.assert_allclose(
+            table[["dW_total_dfood", "dW_total_dmedical"]].to_numpy(), sensitivity["serviceLevels"]
+        )
+        np.testing.assert_allclose(perArea[["food", "medical"]].to_numpy(), engine.getBurdenArray())
+
+    def test_gemm_kernel(self):
+        """Other engine settings give the same tables."""
+        perArea, _ = self.run_headless()
+        gemm, _ = self.run_headless("--benefit-kernel", "gemm", "--workers", "2", "--population-tile-size", "5")
+        np.testing.assert_allclose(gemm[["food", "medical"]], perArea[["food", "medical"]], rtol=1e-12)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(WkbGeometryTest)
+    suite.addTests(unittest.makeSuite(HeadlessRunnerTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
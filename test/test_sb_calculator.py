@@ -0,0 +1,525 @@
+# coding=utf-8
+"""Tests for SBCalculator.SBEngine: the engine methods built on the burden
+modules, checked against a full recalculation on the same inputs.
+"""
+
+import unittest
+
+import numpy as np
+
+import burdenKernels
+import burdenMonteCarlo
+from distanceProviders import DistanceProvider
+from SBCalculator import SBEngine
+
+
+def makeInputs(n=60, m=25, s=4, seed=0):
+    """Engine inputs: population groups and facilities around Albuquerque."""
+    rng = np.random.default_rng(seed)
+    return {
+        "population": rng.integers(1, 1000, n).astype(float),
+        "attainFactors": rng.uniform(0.5, 2, n),
+        "populationLatitudes": rng.uniform(35.0, 35.3, n),
+        "populationLongitudes": rng.uniform(-106.8, -106.4, n),
+        "facilityLatitudes": rng.uniform(35.0, 35.3, m),
+        "facilityLongitudes": rng.uniform(-106.8, -106.4, m),
+        "zde": rng.uniform(1, 10, m),
+        "epf": rng.uniform(1e-5, 1e-3, m),
+        "serviceLevels": rng.integers(0, 6, (m, s)).astype(float),
+        "SLReduce": rng.choice([0.0, 25.0, 100.0], m),
+        "facilitySectors": list(rng.choice(["grocery", "clinic", "bank"], m)),
+    }
+
+
+def recalculated(inputs):
+    """A new engine on the inputs, with the burden calculated from scratch."""
+    engine = SBEngine.fromArrays(**inputs)
+    engine.calculateBurden()
+    return engine
+
+
+def withoutFacilities(inputs, removed):
+    """The inputs with the removed facilities taken out."""
+    keep = np.delete(np.arange(len(inputs["zde"])), removed)
+    result = dict(inputs)
+    for name in [
+        "facilityLatitudes", "facilityLongitudes", "zde", "epf", "serviceLevels", "SLReduce",
+    ]:
+        result[name] = inputs[name][keep]
+    result["facilitySectors"] = [inputs["facilitySectors"][j] for j in keep]
+    return result
+
+
+def servedWeightedBurden(engine, population):
+    """(population-weighted burden of the groups with a provider, population without one)."""
+    burden = engine.getBurdenArray()
+    finite = np.isfinite(burden)
+    weighted = np.where(finite, population.reshape((-1, 1)) * burden, 0)
+    return np.sum(weighted), np.sum(population.reshape((-1, 1)) * ~finite)
+
+
+def scaled(name, factor):
+    """A change scaling one input, and the setter call that makes it."""
+
+    def change(inputs):
+        inputs[name] = inputs[name] * factor
+        return (inputs[name],)
+
+    return change
+
+
+def moved(prefix, offset):
+    """A change moving the population groups or facilities, and its setter arguments."""
+
+    def change(inputs):
+        inputs[prefix + "Latitudes"] = inputs[prefix + "Latitudes"] + offset
+        inputs[prefix + "Longitudes"] = inputs[prefix + "Longitudes"] - offset
+        return inputs[prefix + "Latitudes"], inputs[prefix + "Longitudes"]
+
+    return change
+
+
+def newDistances(inputs):
+    """Moves the population groups, setting the distances rather than the coordinates."""
+    moved("population", 0.02)(inputs)
+    return (SBEngine.fromArrays(**inputs).getPopulationToFacilitiesDistances(),)
+
+
+def newSLReduce(inputs):
+    inputs["SLReduce"] = inputs["SLReduce"][::-1].copy()
+    return (inputs["SLReduce"],)
+
+
+def newServiceLevels(inputs):
+    inputs["serviceLevels"] = inputs["serviceLevels"][:, ::-1] + 1
+    return (inputs["serviceLevels"],)
+
+
+# setter name: change to the inputs, returning the setter arguments
+SETTER_CHANGES = {
+    "setSLReduce": newSLReduce,
+    "setZeroDistanceEffort": scaled("zde", 2.0),
+    "setEffortPerDistanceArray": scaled("epf", 0.5),
+    "setServiceLevelArray": newServiceLevels,
+    "setAttainFactorArray": scaled("attainFactors", np.linspace(0.5, 1.5, 60)),
+    "setPopulationArray": scaled("population", np.linspace(2, 0.5, 60)),
+    "setPopulationCoordinates": moved("population", 0.03),
+    "setFacilityCoordinates": moved("facility", 0.03),
+    "setPopulationToFacilitiesDistances": newDistances,
+}
+
+
+class MatrixDistanceProvider(DistanceProvider):
+    """Distances from a matrix in memory."""
+
+    def __init__(self, distances):
+        self._distances = distances
+
+    def getShape(self):
+        return self._distances.shape
+
+    def getFeetDistances(self, rows: slice):
+        return self._distances[rows]
+
+
+class SBEngineIncrementalTest(unittest.TestCase):
+    """Test the incremental facility updates of the engine."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.inputs = makeInputs()
+        self.engine = SBEngine.fromArrays(**self.inputs)
+        self.engine.setPopulationTileSize(16)
+        self.engine.calculateBurden()
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.engine = None
+
+    def assertMatchesRecalculation(self):
+        expected = recalculated(self.inputs)
+        np.testing.assert_allclose(
+            self.engine.getBurdenArray(), expected.getBurdenArray(), rtol=1e-9
+        )
+        self.assertAlmostEqual(
+            self.engine.getAggregatedWeightedTotalBurden()
+            / expected.getAggregatedWeightedTotalBurden(),
+            1,
+            places=9,
+        )
+
+    def test_add_update_remove(self):
+        """Adding, changing and removing facilities matches recalculating."""
+        i = self.inputs
+        added = self.engine.addFacility(35.1, -106.6, [3, 0, 2, 1], 4.0, 2e-4, sector="clinic")
+        self.assertEqual(added, 25)
+        for name, value in [
+            ("facilityLatitudes", 35.1), ("facilityLongitudes", -106.6), ("zde", 4.0),
+            ("epf", 2e-4), ("SLReduce", 0.0),
+        ]:
+            i[name] = np.append(i[name], value)
+        i["serviceLevels"] = np.vstack([i["serviceLevels"], [3, 0, 2, 1]])
+        i["facilitySectors"] = i["facilitySectors"] + ["clinic"]
+        self.assertMatchesRecalculation()
+
+        self.engine.updateFacility(3, serviceLevels=[1, 1, 1, 1], zde=2.0, SLReduce=50.0)
+        i["serviceLevels"][3], i["zde"][3], i["SLReduce"][3] = 1, 2.0, 50.0
+        self.assertMatchesRecalculation()
+
+        self.engine.removeFacility(7)
+        for name in ["facilityLatitudes", "facilityLongitudes", "zde", "epf", "SLReduce"]:
+            i[name] = np.delete(i[name], 7)
+        i["serviceLevels"] = np.delete(i["serviceLevels"], 7, axis=0)
+        del i["facilitySectors"][7]
+        self.assertMatchesRecalculation()
+        self.assertTrue(self.engine.checkIncrementalConsistency()[0])
+
+    def test_updates_after_setting_attainment(self):
+        """Updates after a new attainment array use the new array."""
+        i = self.inputs
+        self.engine.updateFacility(3, zde=2.0)
+        i["zde"][3] = 2.0
+        i["attainFactors"] = i["attainFactors"] * np.linspace(0.5, 1.5, 60)
+        self.engine.setAttainFactorArray(i["attainFactors"])
+        self.engine.updateFacility(4, epf=5e-4)
+        i["epf"][4] = 5e-4
+        self.assertMatchesRecalculation()
+
+    def test_updates_after_setting_efforts(self):
+        """Updates after new efforts start from sums of the new efforts."""
+        i = self.inputs
+        self.engine.updateFacility(3, zde=2.0)
+        i["zde"] = i["zde"] * 2
+        self.engine.setZeroDistanceEffort(i["zde"])
+        self.engine.updateFacility(4, epf=5e-4)
+        i["epf"][4] = 5e-4
+        self.assertMatchesRecalculation()
+
+    def test_setters_after_calculating(self):
+        """Every input setter drops what depends on it, so recalculating matches."""
+        for setter, change in SETTER_CHANGES.items():
+            with self.subTest(setter=setter):
+                self.setUp()
+                getattr(self.engine, setter)(*change(self.inputs))
+                self.engine.calculateBurden()
+                self.assertMatchesRecalculation()
+
+    def test_setters_between_updates(self):
+        """After any input setter, incremental updates start from the new inputs."""
+        for setter, change in SETTER_CHANGES.items():
+            with self.subTest(setter=setter):
+                self.setUp()
+                i = self.inputs
+                self.engine.updateFacility(3, zde=2.0)
+                i["zde"] = i["zde"].copy()
+                i["zde"][3] = 2.0
+                getattr(self.engine, setter)(*change(i))
+                self.engine.updateFacility(4, epf=5e-4)
+                i["epf"] = i["epf"].copy()
+                i["epf"][4] = 5e-4
+                self.assertMatchesRecalculation()
+
+
+class SBEngineResilienceTest(unittest.TestCase):
+    """Test the worst case facility loss search of the engine."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.inputs = makeInputs(n=40, m=12, seed=4)
+        self.engine = SBEngine.fromArrays(**self.inputs)
+        self.engine.setPopulationTileSize(16)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.engine = None
+
+    def test_worst_case_losses_are_exact(self):
+        """Each loss is the worst one a recalculation finds, and the curve matches."""
+        population = self.inputs["population"]
+        removed, burden, unserved = self.engine.findWorstCaseFacilityLosses(4)
+        for step in range(5):
+            expected = servedWeightedBurden(
+                recalculated(withoutFacilities(self.inputs, removed[:step])), population
+            )
+            self.assertAlmostEqual(burden[step] / expected[0], 1, places=9)
+            self.assertEqual(unserved[step], expected[1])
+        for step in range(4):
+            candidates = [j for j in range(12) if j not in removed[:step]]
+            states = {
+                j: servedWeightedBurden(
+                    recalculated(withoutFacilities(self.inputs, list(removed[:step]) + [j])),
+                    population,
+                )
+                for j in candidates
+            }
+            best = max(candidates, key=lambda j: (states[j][1], states[j][0]))
+            self.assertEqual(removed[step], best)
+
+
+class SBEngineSitingTest(unittest.TestCase):
+    """Test the facility siting search of the engine."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.inputs = makeInputs(n=40, m=10, seed=6)
+        self.engine = SBEngine.fromArrays(**self.inputs)
+        self.engine.setPopulationTileSize(16)
+        self.engine.calculateBurden()
+        rng = np.random.default_rng(7)
+        self.candidateLatitudes = rng.uniform(35.0, 35.3, 15)
+        self.candidateLongitudes = rng.uniform(-106.8, -106.4, 15)
+        self.levels = np.array([2.0, 0.0, 1.0, 3.0])
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.engine = None
+
+    def withSites(self, picked):
+        """The inputs with new facilities at the picked candidate sites."""
+        i = dict(self.inputs)
+        picked = list(picked)
+        for name, values in [
+            ("facilityLatitudes", self.candidateLatitudes[picked]),
+            ("facilityLongitudes", self.candidateLongitudes[picked]),
+            ("zde", [3.0] * len(picked)), ("epf", [2e-4] * len(picked)),
+            ("SLReduce", [0.0] * len(picked)),
+        ]:
+            i[name] = np.append(i[name], values)
+        i["serviceLevels"] = np.vstack([i["serviceLevels"]] + [self.levels] * len(picked))
+        i["facilitySectors"] = i["facilitySectors"] + ["clinic"] * len(picked)
+        return i
+
+    def site(self, numSites, **kwargs):
+        return self.engine.optimizeFacilitySiting(
+            self.candidateLatitudes, self.candidateLongitudes, self.levels, 3.0, 2e-4,
+            numSites, **kwargs
+        )
+
+    def assertMatchesRecalculation(self, result, numSites):
+        picked, burden, unserved = result
+        population = self.inputs["population"]
+        for step in range(numSites + 1):
+            expected = servedWeightedBurden(
+                recalculated(self.withSites(picked[:step])), population
+            )
+            self.assertAlmostEqual(burden[step] / expected[0], 1, places=9)
+            self.assertEqual(unserved[step], expected[1])
+        for step in range(numSites):
+            candidates = [c for c in range(15) if c not in picked[:step]]
+            states = {
+                c: servedWeightedBurden(
+                    recalculated(self.withSites(list(picked[:step]) + [c])), population
+                )
+                for c in candidates
+            }
+            best = min(candidates, key=lambda c: (states[c][1], states[c][0]))
+            self.assertEqual(picked[step], best)
+
+    def test_siting_after_updates_and_setters(self):
+        """Siting starts from the current inputs, after updates and setters alike."""
+        i = self.inputs
+        self.engine.updateFacility(2, zde=1.5)
+        i["zde"] = i["zde"].copy()
+        i["zde"][2] = 1.5
+        self.assertMatchesRecalculation(self.site(3), 3)
+        i["epf"] = i["epf"] * 3
+        self.engine.setEffortPerDistanceArray(i["epf"])
+        self.assertMatchesRecalculation(self.site(3), 3)
+        i["attainFactors"] = i["attainFactors"] * np.linspace(2, 0.5, 40)
+        self.engine.setAttainFactorArray(i["attainFactors"])
+        self.assertMatchesRecalculation(self.site(3, lazy=False), 3)
+
+    def test_candidate_distance_provider(self):
+        """Candidate distances from a provider give the same picks as the coordinates."""
+        candidateEngine = SBEngine.fromArrays(
+            **dict(
+                self.inputs,
+                facilityLatitudes=self.candidateLatitudes,
+                facilityLongitudes=self.candidateLongitudes,
+            )
+        )
+        provider = MatrixDistanceProvider(candidateEngine.getPopulationToFacilitiesDistances())
+        expected = self.site(4)
+        result = self.site(4, candidateDistanceProvider=provider)
+        np.testing.assert_array_equal(result[0], expected[0])
+        np.testing.assert_allclose(result[1], expected[1], rtol=1e-12)
+
+
+class SBEngineScenarioTest(unittest.TestCase):
+    """Test the batched scenario burdens of the engine."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.inputs = makeInputs(n=40, m=12, seed=8)
+        self.inputs["SLReduce"] = None  # status factors take the place of the reduction
+        self.engine = SBEngine.fromArrays(**self.inputs)
+        self.engine.setPopulationTileSize(16)
+        rng = np.random.default_rng(9)
+        self.statusFactors = rng.uniform(0.1, 1, (7, 12))
+        self.statusFactors[0] = 1
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.engine = None
+
+    def scenario(self, factors):
+        """A new engine on the inputs, with the burden of the scenario calculated from scratch."""
+        return recalculated(dict(self.inputs, SLReduce=100 * (1 - factors)))
+
+    def assertMatchesScenarios(self):
+        expected = [self.scenario(factors) for factors in self.statusFactors]
+        burdens = self.engine.calculateScenarioBurdens(self.statusFactors, scenarioBatch=3)
+        self.assertEqual(burdens.shape, (7, 40, 4))
+        for burden, engine in zip(burdens, expected):
+            np.testing.assert_allclose(burden, engine.getBurdenArray(), rtol=1e-9)
+        indices = []
+        for index, burden in self.engine.iterScenarioBurdens(self.statusFactors, scenarioBatch=3):
+            indices.append(index)
+            np.testing.assert_allclose(burden, expected[index].getBurdenArray(), rtol=1e-9)
+        self.assertEqual(indices, list(range(7)))
+        aggregated = self.engine.calculateScenarioAggregatedWeightedBurdens(
+            self.statusFactors, scenarioBatch=3
+        )
+        np.testing.assert_allclose(
+            aggregated, [engine.getAggregatedWeightedBurden() for engine in expected], rtol=1e-9
+        )
+
+    def test_scenarios_match_recalculation(self):
+        """Each scenario is the burden with the status factors as the service level reduction."""
+        self.assertMatchesScenarios()
+
+    def test_scenarios_after_setters(self):
+        """Scenarios use the current inputs, with the reciprocal denominators memoized or not."""
+        for memoize in [False, True]:
+            with self.subTest(memoize=memoize):
+                self.setUp()
+                self.engine.setMemoizeReciprocalDenominators(memoize)
+                self.assertMatchesScenarios()
+                self.inputs["zde"] = self.inputs["zde"] * 2
+                self.engine.setZeroDistanceEffort(self.inputs["zde"])
+                self.inputs["attainFactors"] = self.inputs["attainFactors"][::-1].copy()
+                self.engine.setAttainFactorArray(self.inputs["attainFactors"])
+                self.assertMatchesScenarios()
+
+
+class SBEngineCriticalityTest(unittest.TestCase):
+    """Test the facility criticality ranking of the engine."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.inputs = makeInputs(n=40, m=12, seed=10)
+        levels = self.inputs["serviceLevels"]
+        levels[levels == 0] = 1
+        levels[:, 3] = 0
+        levels[5, 3] = 2  # facility 5 is the only provider of service 3
+        self.engine = SBEngine.fromArrays(**self.inputs)
+        self.engine.setPopulationTileSize(16)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.engine = None
+
+    def assertMatchesRemovals(self):
+        before = recalculated(self.inputs).getAggregatedWeightedBurden()
+        criticality, top = self.engine.rankFacilityCriticality(topK=4)
+        for j in range(12):
+            with np.errstate(divide="ignore"):
+                after = recalculated(withoutFacilities(self.inputs, [j]))
+            after = after.getAggregatedWeightedBurden()
+            np.testing.assert_allclose(criticality[j], after - before, rtol=1e-7)
+        self.assertEqual(top[0], 5)
+        totals = np.sum(criticality, axis=1)
+        np.testing.assert_array_equal(top, np.argsort(-totals, kind="stable")[:4])
+
+    def test_criticality_matches_removal(self):
+        """Each facility's criticality is the burden increase from recalculating without it."""
+        self.assertMatchesRemovals()
+
+    def test_criticality_after_setters(self):
+        """Criticality uses the current inputs."""
+        self.assertMatchesRemovals()
+        self.inputs["epf"] = self.inputs["epf"] * 0.5
+        self.engine.setEffortPerDistanceArray(self.inputs["epf"])
+        self.inputs["population"] = self.inputs["population"][::-1].copy()
+        self.engine.setPopulationArray(self.inputs["population"])
+        self.assertMatchesRemovals()
+
+
+class SBEngineMonteCarloTest(unittest.TestCase):
+    """Test the Monte Carlo burden of the engine."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.inputs = makeInputs(n=40, m=12, seed=12)
+        self.engine = SBEngine.fromArrays(**self.inputs)
+        self.engine.setPopulationTileSize(16)
+        self.specs = {
+            "serviceLevels": ("triangular", 0.8, 1.0, 1.2),
+            "zde": ("uniform", 0.5, 1.5),
+            "attainFactors": ("lognormal", 0.2),
+        }
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.engine = None
+
+    def assertNoiselessMatchesRecalculation(self):
+        noiseless = {name: ("normal", 0.0) for name in ["serviceLevels", "zde", "epf"]}
+        summary = self.engine.calculateMonteCarloBurden(noiseless, 5, batchSize=2, seed=1)
+        expected = recalculated(self.inputs)
+        np.testing.assert_allclose(
+            summary.getPopulationMoments().getMean(), expected.getBurdenArray(), rtol=1e-9
+        )
+        np.testing.assert_allclose(
+            summary.getAggregateMoments().getMean(),
+            np.append(
+                expected.getAggregatedWeightedBurden(), expected.getAggregatedWeightedTotalBurden()
+            ),
+            rtol=1e-9,
+        )
+
+    def test_noiseless_draws_match_recalculation(self):
+        """Draws without any noise are the burden, before and after input setters."""
+        self.assertNoiselessMatchesRecalculation()
+        self.inputs["epf"] = self.inputs["epf"] * 2
+        self.engine.setEffortPerDistanceArray(self.inputs["epf"])
+        self.inputs["SLReduce"] = self.inputs["SLReduce"][::-1].copy()
+        self.engine.setSLReduce(self.inputs["SLReduce"])
+        self.assertNoiselessMatchesRecalculation()
+
+    def test_draws_match_full_distance_matrix(self):
+        """Reading the distances tile by tile gives the draws of the full matrix."""
+        distances = SBEngine.fromArrays(**self.inputs).getPopulationToFacilitiesDistances()
+        _, sectors = np.unique(self.inputs["facilitySectors"], return_inverse=True)
+        for drawPerSector, groups in [(True, sectors), (False, None)]:
+            with self.subTest(drawPerSector=drawPerSector):
+                result = self.engine.calculateMonteCarloBurden(
+                    self.specs, 9, batchSize=4, seed=2, drawPerSector=drawPerSector
+                )
+                expected = burdenMonteCarlo.monteCarloBurden(
+                    lambda rows: distances[rows], 40, self.inputs["zde"], self.inputs["epf"],
+                    burdenKernels.reducedServiceLevels(
+                        self.inputs["SLReduce"], self.inputs["serviceLevels"]
+                    ),
+                    self.inputs["attainFactors"], self.inputs["population"], self.specs, 9,
+                    facilityGroups=groups, batchSize=4, seed=2, tileSize=16,
+                )
+                np.testing.assert_allclose(
+                    result.getPopulationMoments().getMean(),
+                    expected.getPopulationMoments().getMean(),
+                    rtol=1e-9,
+                )
+                np.testing.assert_allclose(
+                    result.getAggregateQuantiles(), expected.getAggregateQuantiles(), rtol=1e-9
+                )
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    for case in [
+        SBEngineIncrementalTest, SBEngineResilienceTest, SBEngineSitingTest, SBEngineScenarioTest,
+        SBEngineCriticalityTest, SBEngineMonteCarloTest,
+    ]:
+        suite.addTest(unittest.makeSuite(case))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
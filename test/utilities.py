@@ -4,6 +4,8 @@
 import sys
 import logging
 
+import numpy as np
+
 
 LOGGER = logging.getLogger('QGIS')
 QGIS_APP = None  # Static variable used to hold hand to running QGIS app
@@ -59,3 +61,16 @@ def get_qgis_app():
         IFACE = QgisInterface(CANVAS)
 
     return QGIS_APP, CANVAS, IFACE, PARENT
+
+
+def makeProblem(n=57, m=43, s=5, seed=0):
+    """Random but realistic-looking inputs: distances in feet, efforts, service levels 0-5."""
+    rng = np.random.default_rng(seed)
+    return {
+        "distances": rng.uniform(0, 5e4, (n, m)),
+        "zde": rng.uniform(1, 10, m),
+        "epf": rng.uniform(1e-5, 1e-3, m),
+        "SLReduce": rng.choice([0.0, 25.0, 100.0], m),
+        "serviceLevels": rng.integers(0, 6, (m, s)).astype(float),
+        "attainFactors": rng.uniform(0.5, 2, n),
+    }
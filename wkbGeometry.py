@@ -0,0 +1,449 @@
+"""
+Point locations, polygon centroids and point-in-polygon tests straight from
+well-known binary (WKB) geometries, as stored in GeoPackage files, without QGIS.
+
+Only the geometry types the population, facility and exclusion profile layers
+use are read: points, polygons, their multi-part versions and collections of
+them, with or without Z and M coordinates (which are ignored). Both ISO WKB (type
+codes 1000 and up for Z, M and ZM) and PostGIS extended WKB (flag bits) are
+understood.
+
+The centroid of a polygon is the area-weighted centroid of its rings, holes
+counting negatively, as QGIS' native:centroids gives with ALL_PARTS off. A
+multi-polygon's is the area-weighted centroid of its parts.
+
+Nothing in here depends on QGIS.
+"""
+
+import struct
+
+import numpy as np
+
+try:
+    from . import burdenKernels
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import burdenKernels
+
+
+# WKB geometry type codes, after taking off the Z/M part
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTIPOINT = 4
+WKB_MULTILINESTRING = 5
+WKB_MULTIPOLYGON = 6
+WKB_GEOMETRYCOLLECTION = 7
+
+# extended WKB flags
+_EWKB_Z = 0x80000000
+_EWKB_M = 0x40000000
+_EWKB_SRID = 0x20000000
+
+# size in bytes of the GeoPackage geometry header's envelope, by envelope indicator
+_GPKG_ENVELOPE_BYTES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+
+def geometryBlobToWkb(blob):
+    """
+    WKB of a GeoPackage geometry blob, with its header taken off. Anything that is
+    not a GeoPackage blob is taken to be WKB already.
+
+    Returns None for a missing geometry, and for a GeoPackage blob flagged empty.
+    """
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    if not blob:  # e.g. the WKB of a null QgsGeometry
+        return None
+    if blob[:2] != b"GP":
+        return blob
+    flags = blob[3]
+    if flags & 0x10:  # empty geometry
+        return None
+    envelope = (flags >> 1) & 0x07
+    try:
+        return blob[8 + _GPKG_ENVELOPE_BYTES[envelope] :]
+    except KeyError:
+        raise ValueError(f"Invalid GeoPackage geometry envelope indicator {envelope}.")
+
+
+def _readGeometry(wkb, offset, parts):
+    """
+    Reads one geometry starting at offset, and adds its parts to
+    parts = {"points": [...], "polygons": [...], "lines": count}, each polygon being
+    a list of (k,2) ring arrays.
+
+    Returns the offset just after the geometry.
+    """
+    byteOrder = "<" if wkb[offset] == 1 else ">"
+    (code,) = struct.unpack_from(byteOrder + "I", wkb, offset + 1)
+    offset += 5
+    hasZ, hasM = bool(code & _EWKB_Z), bool(code & _EWKB_M)
+    if code & _EWKB_SRID:
+        offset += 4
+    code &= 0x0FFFFFFF
+    dimensions, geometryType = divmod(code, 1000)
+    hasZ |= dimensions in (1, 3)
+    hasM |= dimensions in (2, 3)
+    numOrdinates = 2 + hasZ + hasM
+    ordinate = np.dtype(byteOrder + "f8")
+
+    def readCoordinates(numPoints, offset):
+        coordinates = np.frombuffer(
+            wkb, dtype=ordinate, count=numPoints * numOrdinates, offset=offset
+        ).reshape((numPoints, numOrdinates))[:, :2]
+        return coordinates, offset + numPoints * numOrdinates * 8
+
+    def readCount(offset):
+        return struct.unpack_from(byteOrder + "I", wkb, offset)[0], offset + 4
+
+    if geometryType == WKB_POINT:
+        point, offset = readCoordinates(1, offset)
+        if not np.isnan(point).any():  # an empty point is stored as NaN coordinates
+            parts["points"].append(point[0])
+    elif geometryType == WKB_LINESTRING:
+        numPoints, offset = readCount(offset)
+        _, offset = readCoordinates(numPoints, offset)
+        parts["lines"] += 1
+    elif geometryType == WKB_POLYGON:
+        numRings, offset = readCount(offset)
+        rings = []
+        for _ in range(numRings):
+            numPoints, offset = readCount(offset)
+            ring, offset = readCoordinates(numPoints, offset)
+            rings.append(ring)
+        if rings:
+            parts["polygons"].append(rings)
+    elif geometryType in (WKB_MULTIPOINT, WKB_MULTILINESTRING, WKB_MULTIPOLYGON, WKB_GEOMETRYCOLLECTION):
+        numGeometries, offset = readCount(offset)
+        for _ in range(numGeometries):
+            offset = _readGeometry(wkb, offset, parts)
+    else:
+        raise TypeError(f"Unsupported WKB geometry type {geometryType}.")
+    return offset
+
+
+def _ringMoments(ring, origin):
+    """
+    (signed area, signed area times centroid (2,)) of a closed ring, relative to origin.
+    """
+    x = ring[:, 0] - origin[0]
+    y = ring[:, 1] - origin[1]
+    cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+    area = np.sum(cross) / 2
+    moment = np.array(
+        [np.sum((x[:-1] + x[1:]) * cross), np.sum((y[:-1] + y[1:]) * cross)]
+    ) / 6
+    return area, moment
+
+
+def wkbCentroid(wkb):
+    """
+    (x, y) centroid of a WKB geometry: for polygons the area-weighted centroid (see
+    the module docstring), for points the mean of the points.
+
+    Raises ValueError for a missing or empty geometry, and TypeError for lines.
+    """
+    if wkb is None:
+        raise ValueError("Geometry is null.")
+    parts = {"points": [], "polygons": [], "lines": 0}
+    _readGeometry(wkb, 0, parts)
+
+    if parts["polygons"]:
+        origin = parts["polygons"][0][0][0]
+        totalArea, totalMoment = 0.0, np.zeros(2)
+        for rings in parts["polygons"]:
+            for ringNumber, ring in enumerate(rings):
+                if ring.shape[0] < 4:
+                    continue
+                area, moment = _ringMoments(ring, origin)
+                # whatever the ring's orientation, the exterior ring adds and holes subtract
+                sign = np.sign(area) if ringNumber == 0 else -np.sign(area)
+                totalArea += sign * area
+                totalMoment += sign * moment
+        if totalArea > 0:
+            return tuple(origin + totalMoment / totalArea)
+        # degenerate (zero area) polygons: the mean of their vertices
+        vertices = np.concatenate([rings[0] for rings in parts["polygons"]])
+        return tuple(np.mean(vertices, axis=0))
+    if parts["points"]:
+        return tuple(np.mean(parts["points"], axis=0))
+    if parts["lines"]:
+        raise TypeError("Geometry is a line, not a point or a polygon.")
+    raise ValueError("Geometry is empty.")
+
+
+def wkbPoint(wkb):
+    """
+    (x, y) of a single-point WKB geometry.
+
+    Raises ValueError for a missing or empty geometry, and TypeError for anything
+    but a point.
+    """
+    if wkb is None:
+        raise ValueError("Geometry is null.")
+    parts = {"points": [], "polygons": [], "lines": 0}
+    _readGeometry(wkb, 0, parts)
+    if parts["polygons"] or parts["lines"] or len(parts["points"]) > 1:
+        raise TypeError("Geometry is not a single point.")
+    if not parts["points"]:
+        raise ValueError("Geometry is empty.")
+    return tuple(parts["points"][0])
+
+
+def _plainPointLocations(wkbs):
+    """
+    (latitudes, longitudes) of a list of WKB geometries if they are all plain 2D
+    points of one byte order (21 bytes each), decoded all at once; else None.
+    """
+    try:
+        if not wkbs or set(map(len, wkbs)) != {21}:
+            return None
+    except TypeError:  # missing geometries
+        return None
+    records = np.frombuffer(b"".join(wkbs), dtype=np.uint8).reshape((len(wkbs), 21))
+    if not (records[:, 0] == records[0, 0]).all():
+        return None
+    byteOrder = "<" if records[0, 0] == 1 else ">"
+    codes = np.ascontiguousarray(records[:, 1:5]).view(byteOrder + "u4")[:, 0]
+    if not (codes == WKB_POINT).all():
+        return None
+    coordinates = np.ascontiguousarray(records[:, 5:]).view(byteOrder + "f8")
+    if np.isnan(coordinates).any():  # empty points; let the general path complain
+        return None
+    return coordinates[:, 1].astype(np.float64), coordinates[:, 0].astype(np.float64)
+
+
+def pointLocations(blobs, whichgeom: str):
+    """
+    Locations of a sequence of single-point geometries (WKB or GeoPackage blobs).
+    The usual case, all plain 2D points, is decoded in one go with numpy.
+
+    whichgeom names the layer, e.g. "facilities", for the error messages.
+
+    returns:
+         tuple of numpy 1-d arrays, (latitudes, longitudes), i.e. (y, x)
+    """
+    blobs = list(blobs)
+    locations = _plainPointLocations(blobs)  # plain WKB, as QGIS gives
+    if locations is None:
+        blobs = [geometryBlobToWkb(i) for i in blobs]
+        locations = _plainPointLocations(blobs)  # e.g. GeoPackage blobs
+    if locations is not None:
+        return locations
+    return _locations(blobs, whichgeom, wkbPoint, "single-point")
+
+
+def _polygonRings(wkbs, rows, whichgeom):
+    """
+    The rings of the polygons among wkbs[rows], for _chunkCentroids.
+
+    returns:
+        (list of (k,2) ring arrays, (rings,) index of each ring's geometry in wkbs,
+        (rings,) whether each ring is its polygon's exterior ring, list of the
+        indices of geometries without polygons)
+    """
+    rings, geometries, exterior, others = [], [], [], []
+    for i in range(rows.start, rows.stop):
+        if wkbs[i] is None:
+            raise ValueError("Somehow the %s' geometry is null." % whichgeom)
+        parts = {"points": [], "polygons": [], "lines": 0}
+        try:
+            _readGeometry(wkbs[i], 0, parts)
+        except TypeError:
+            raise TypeError(
+                "The locations for the %s layer somehow aren't point or polygon type." % whichgeom
+            )
+        polygonRings = [
+            (ring, number == 0)
+            for polygon in parts["polygons"]
+            for number, ring in enumerate(polygon)
+            if ring.shape[0] >= 4
+        ]
+        if not polygonRings:
+            others.append(i)
+            continue
+        for ring, isExterior in polygonRings:
+            rings.append(ring)
+            geometries.append(i)
+            exterior.append(isExterior)
+    return rings, np.array(geometries, dtype=int), np.array(exterior, dtype=bool), others
+
+
+def _chunkCentroids(wkbs, rows, latitudes, longitudes, whichgeom):
+    """
+    Centroids of wkbs[rows], into latitudes[rows] and longitudes[rows].
+
+    The rings of all the polygons in the chunk are put end to end, and their
+    areas and moments (see _ringMoments) are calculated for all of them at once,
+    relative to the first vertex of each geometry. Geometries without polygons,
+    and polygons of no area, go through wkbCentroid one by one.
+    """
+    rings, geometries, exterior, others = _polygonRings(wkbs, rows, whichgeom)
+    if rings:
+        lengths = np.array([ring.shape[0] for ring in rings])
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        _, firstRings, ringGeometry = np.unique(geometries, return_index=True, return_inverse=True)
+        vertices = np.concatenate(rings)
+        origins = vertices[starts[firstRings]]  # (geometries, 2)
+        vertices = vertices - np.repeat(origins[ringGeometry], lengths, axis=0)
+        x, y = vertices[:, 0], vertices[:, 1]
+
+        # each vertex with the next, the last vertex of every ring counting for nothing
+        cross = np.zeros(x.shape[0])
+        cross[:-1] = x[:-1] * y[1:] - x[1:] * y[:-1]
+        cross[starts + lengths - 1] = 0
+        nextX, nextY = np.roll(x, -1), np.roll(y, -1)
+        area = np.add.reduceat(cross, starts) / 2
+        momentX = np.add.reduceat((x + nextX) * cross, starts) / 6
+        momentY = np.add.reduceat((y + nextY) * cross, starts) / 6
+
+        # whatever the ring's orientation, exterior rings add and holes subtract
+        sign = np.where(exterior, np.sign(area), -np.sign(area))
+        numGeometries = origins.shape[0]
+        totalArea = np.bincount(ringGeometry, sign * area, numGeometries)
+        totalX = np.bincount(ringGeometry, sign * momentX, numGeometries)
+        totalY = np.bincount(ringGeometry, sign * momentY, numGeometries)
+
+        indices = np.unique(geometries)
+        hasArea = totalArea > 0
+        longitudes[indices[hasArea]] = origins[hasArea, 0] + totalX[hasArea] / totalArea[hasArea]
+        latitudes[indices[hasArea]] = origins[hasArea, 1] + totalY[hasArea] / totalArea[hasArea]
+        others += indices[~hasArea].tolist()
+
+    for i in others:
+        _locate(wkbs, i, latitudes, longitudes, whichgeom, wkbCentroid, "point or polygon")
+
+
+def centroidLocations(blobs, whichgeom: str, workers=1, chunkSize=4096):
+    """
+    Centroids of a sequence of point or polygon geometries (WKB or GeoPackage
+    blobs); see wkbCentroid. The polygons are handled chunkSize at a time, with
+    the arithmetic for all the rings of a chunk done at once.
+
+    If workers is more than 1, the chunks are handed out to a thread pool (see
+    burdenKernels.forEachTile). Reading the WKB holds the GIL, so this mostly
+    helps with polygons of many vertices.
+
+    returns:
+         tuple of numpy 1-d arrays, (latitudes, longitudes), i.e. (y, x)
+    """
+    wkbs = [geometryBlobToWkb(i) for i in blobs]
+    latitudes = np.empty(len(wkbs))
+    longitudes = np.empty(len(wkbs))
+    burdenKernels.forEachTile(
+        lambda rows: _chunkCentroids(wkbs, rows, latitudes, longitudes, whichgeom),
+        len(wkbs),
+        chunkSize,
+        workers,
+    )
+    return latitudes, longitudes
+
+
+def _locate(wkbs, i, latitudes, longitudes, whichgeom, locate, expected):
+    try:
+        longitudes[i], latitudes[i] = locate(wkbs[i])
+    except TypeError:
+        raise TypeError(
+            "The locations for the %s layer somehow aren't %s type." % (whichgeom, expected)
+        )
+    except ValueError:
+        raise ValueError("Somehow the %s' geometry is null." % whichgeom)
+
+
+def _locations(blobs, whichgeom, locate, expected):
+    wkbs = [geometryBlobToWkb(i) for i in blobs]
+    latitudes = np.empty(len(wkbs))
+    longitudes = np.empty(len(wkbs))
+    for i in range(len(wkbs)):
+        _locate(wkbs, i, latitudes, longitudes, whichgeom, locate, expected)
+    return latitudes, longitudes
+
+
+def _pointsInPolygon(x, y, polygon, blockSize=1 << 20):
+    """
+    Whether each point (x[i], y[i]) is in a polygon (a list of (k,2) ring arrays,
+    exterior ring first), by counting the crossings of a ray from the point over
+    all its rings at once, so that holes come out as outside whatever the rings'
+    orientations. Points on a ring count as in the polygon.
+
+    The (points, edges) comparisons are done about blockSize at a time.
+    """
+    edges = np.concatenate([np.stack([ring[:-1], ring[1:]], axis=1) for ring in polygon])
+    x0, y0 = edges[:, 0, 0], edges[:, 0, 1]
+    x1, y1 = edges[:, 1, 0], edges[:, 1, 1]
+    inside = np.zeros(x.shape[0], dtype=bool)
+    step = max(1, blockSize // max(1, edges.shape[0]))
+    for start in range(0, x.shape[0], step):
+        px = x[start : start + step, None]
+        py = y[start : start + step, None]
+        cross = (x1 - x0) * (py - y0) - (y1 - y0) * (px - x0)
+        onEdge = (
+            (cross == 0)
+            & (px >= np.minimum(x0, x1))
+            & (px <= np.maximum(x0, x1))
+            & (py >= np.minimum(y0, y1))
+            & (py <= np.maximum(y0, y1))
+        )
+        # edges straddling the point's horizontal, with the point left of them
+        straddles = (y0 > py) != (y1 > py)
+        leftOf = np.where(y1 > y0, cross > 0, cross < 0)
+        crossings = np.count_nonzero(straddles & leftOf, axis=1)
+        inside[start : start + step] = (crossings % 2 == 1) | onEdge.any(axis=1)
+    return inside
+
+
+def polygonValuesAtPoints(latitudes, longitudes, blobs, values, whichgeom: str):
+    """
+    For each point, the largest of the values of the polygons (WKB or GeoPackage
+    blobs) it is in, and 0 for points outside all of them; e.g. the service level
+    reduction of each facility from overlapping hazard zones of different severity.
+
+    The points are indexed once by sorting them along x, so that each polygon part
+    only tests the points in its bounding box, and those all at once. Polygons
+    without geometry are skipped. The polygons are taken to be valid; with
+    self-intersecting rings the even-odd test can leave points out.
+
+    Inputs:
+        latitudes, longitudes: (n,) coordinates of the points, in the polygons' CRS
+        blobs: sequence of polygon or multi-polygon geometries
+        values: (polygons,) value of each polygon
+        whichgeom: name of the polygons' layer, for errors
+
+    Returns:
+        (n,) float64 array
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    result = np.zeros(latitudes.shape[0])
+    order = np.argsort(longitudes, kind="stable")
+    sortedLongitudes = longitudes[order]
+    for blob, value in zip(blobs, np.asarray(values, dtype=np.float64)):
+        wkb = geometryBlobToWkb(blob)
+        if wkb is None or value <= 0:
+            continue
+        parts = {"points": [], "polygons": [], "lines": 0}
+        try:
+            _readGeometry(wkb, 0, parts)
+            if parts["points"] or parts["lines"]:
+                raise TypeError("Not a polygon.")
+        except TypeError:
+            raise TypeError("The geometries of the %s layer somehow aren't polygon type." % whichgeom)
+        for polygon in parts["polygons"]:
+            polygon = [ring for ring in polygon if ring.shape[0] >= 4]
+            if not polygon:
+                continue
+            low, high = polygon[0].min(axis=0), polygon[0].max(axis=0)
+            start = np.searchsorted(sortedLongitudes, low[0], side="left")
+            stop = np.searchsorted(sortedLongitudes, high[0], side="right")
+            candidates = order[start:stop]
+            candidates = candidates[
+                (latitudes[candidates] >= low[1])
+                & (latitudes[candidates] <= high[1])
+                & (result[candidates] < value)
+            ]
+            if candidates.shape[0] == 0:
+                continue
+            inside = _pointsInPolygon(longitudes[candidates], latitudes[candidates], polygon)
+            result[candidates[inside]] = value
+    return result